@@ -0,0 +1,282 @@
+from typing import NamedTuple, Optional
+from datetime import date, datetime
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Q, Count, Min, Avg, F, Value, CharField, DateField, DurationField, ExpressionWrapper
+from django.utils.dateparse import parse_datetime
+
+from .models import Projeto, Emenda, Parecer
+
+TAMANHO_PAGINA_DASHBOARD = 25
+
+# Status de Projeto e de Emenda que compõem cada seção do dashboard do gestor
+SECOES_DASHBOARD = {
+    'aguardando': {'projeto': ['novo'], 'emenda': []},
+    'analise': {'projeto': ['em_analise'], 'emenda': ['pendente']},
+    'pendente': {'projeto': ['pendente'], 'emenda': []},
+    'concluido': {'projeto': ['aprovado', 'reprovado'], 'emenda': ['aprovada', 'reprovada']},
+}
+
+# Campos do filtro de busca, relativos ao Projeto (emendas usam o projeto pai)
+CAMPOS_BUSCA = {
+    'titulo': ['titulo'],
+    'caae': ['caae'],
+    'pesquisador': ['pesquisador__nome'],
+    'relator-nome': ['relator_designado__first_name', 'relator_designado__username'],
+    'relator-email': ['relator_designado__email'],
+}
+
+
+def filtro_busca(termo, campo='all', prefixo=''):
+    """
+    Monta o Q() da busca do dashboard. `prefixo` é 'projeto__' para emendas,
+    que são encontradas pelos dados do projeto pai (ou pelo próprio título).
+    """
+    if not termo:
+        return Q()
+
+    if campo in CAMPOS_BUSCA:
+        campos = CAMPOS_BUSCA[campo]
+    else:
+        campos = [c for lista in CAMPOS_BUSCA.values() for c in lista]
+
+    filtro = Q()
+    for c in campos:
+        filtro |= Q(**{f'{prefixo}{c}__icontains': termo})
+    if prefixo and 'titulo' in campos:
+        filtro |= Q(titulo__icontains=termo)
+    return filtro
+
+
+def codificar_cursor(item):
+    return f"{item.data_submissao.isoformat()}|{item.tipo_item}|{item.id}"
+
+
+def decodificar_cursor(cursor):
+    """
+    Converte o cursor 'data|tipo|id' em tupla. Levanta ValueError se for inválido.
+    """
+    if not cursor:
+        return None
+    try:
+        data_txt, tipo, id_txt = cursor.split('|')
+        data = parse_datetime(data_txt)
+        id_item = int(id_txt)
+    except (ValueError, TypeError):
+        raise ValueError("Cursor inválido.")
+    if data is None or tipo not in ('P', 'E'):
+        raise ValueError("Cursor inválido.")
+    return data, tipo, id_item
+
+
+def filtro_apos_cursor(cursor, tipo):
+    """
+    Condição de keyset para a ordenação (data_submissao, tipo, id) decrescente:
+    devolve apenas os itens do `tipo` que vêm depois do cursor.
+    """
+    if not cursor:
+        return Q()
+    data, tipo_cursor, id_cursor = cursor
+    if tipo < tipo_cursor:
+        return Q(data_submissao__lte=data)
+    if tipo > tipo_cursor:
+        return Q(data_submissao__lt=data)
+    return Q(data_submissao__lt=data) | Q(data_submissao=data, id__lt=id_cursor)
+
+
+class ItemLinhaDoTempo(NamedTuple):
+    """
+    Linha leve (sem instâncias de modelo) de uma linha do tempo que mistura
+    projetos ('P') e emendas ('E'). Para emendas, caae/pesquisador/relator
+    são os do projeto pai.
+    """
+    tipo_item: str
+    id: int
+    titulo: str
+    status: str
+    data_submissao: datetime
+    data_aprovacao: Optional[date]
+    projeto_id: int
+    projeto_titulo: str
+    caae: str
+    pesquisador_nome: str
+    relator_first_name: Optional[str]
+    relator_username: Optional[str]
+    relator_email: Optional[str]
+
+    @property
+    def relator_nome(self):
+        return self.relator_first_name or self.relator_username or ''
+
+    def get_status_display(self):
+        choices = Projeto.STATUS_CHOICES if self.tipo_item == 'P' else Emenda.STATUS_EMENDA_CHOICES
+        return dict(choices).get(self.status, self.status)
+
+
+def _colunas_linha_do_tempo(tipo, prefixo):
+    """
+    Colunas anotadas, na ordem de ItemLinhaDoTempo, para o lado `tipo` do UNION.
+    Todas são anotações para que os dois lados tenham exatamente a mesma ordem.
+    """
+    return {
+        'lt_tipo_item': Value(tipo, output_field=CharField()),
+        'lt_id': F('id'),
+        'lt_titulo': F('titulo'),
+        'lt_status': F('status'),
+        'lt_data_submissao': F('data_submissao'),
+        'lt_data_aprovacao': F('data_aprovacao') if tipo == 'P' else Value(None, output_field=DateField()),
+        'lt_projeto_id': F(f'{prefixo}id'),
+        'lt_projeto_titulo': F(f'{prefixo}titulo'),
+        'lt_caae': F(f'{prefixo}caae'),
+        'lt_pesquisador_nome': F(f'{prefixo}pesquisador__nome'),
+        'lt_relator_first_name': F(f'{prefixo}relator_designado__first_name'),
+        'lt_relator_username': F(f'{prefixo}relator_designado__username'),
+        'lt_relator_email': F(f'{prefixo}relator_designado__email'),
+    }
+
+
+def _partes_linha_do_tempo(projetos, emendas, cursor=None):
+    partes = []
+    for tipo, qs, prefixo in (('P', projetos, ''), ('E', emendas, 'projeto__')):
+        if qs is None:
+            continue
+        colunas = _colunas_linha_do_tempo(tipo, prefixo)
+        partes.append(
+            qs.filter(filtro_apos_cursor(cursor, tipo))
+              .order_by()
+              .annotate(**colunas)
+              .values_list(*colunas)
+        )
+    return partes
+
+
+def linha_do_tempo(projetos=None, emendas=None, cursor=None, limite=TAMANHO_PAGINA_DASHBOARD):
+    """
+    Junta projetos e emendas com UNION ALL no banco, ordenando por
+    (data_submissao, tipo, id) decrescente e aplicando o limite no SQL.
+    Devolve (itens, proximo_cursor); `limite=None` traz tudo.
+    """
+    partes = _partes_linha_do_tempo(projetos, emendas, cursor)
+    if not partes:
+        return [], None
+
+    uniao = partes[0].union(*partes[1:], all=True) if len(partes) > 1 else partes[0]
+    uniao = uniao.order_by('-lt_data_submissao', '-lt_tipo_item', '-lt_id')
+    if limite is not None:
+        uniao = uniao[:limite + 1]
+
+    itens = [ItemLinhaDoTempo(*linha) for linha in uniao]
+    if limite is not None and len(itens) > limite:
+        return itens[:limite], codificar_cursor(itens[limite - 1])
+    return itens, None
+
+
+def contar_linha_do_tempo(projetos=None, emendas=None):
+    return sum(qs.count() for qs in (projetos, emendas) if qs is not None)
+
+
+def querysets_secao(secao, termo='', campo='all'):
+    definicao = SECOES_DASHBOARD[secao]
+    projetos = emendas = None
+
+    if definicao['projeto']:
+        projetos = (
+            Projeto.objects
+            .filter(status__in=definicao['projeto'])
+            .filter(filtro_busca(termo, campo))
+        )
+    if definicao['emenda']:
+        emendas = (
+            Emenda.objects
+            .filter(status__in=definicao['emenda'])
+            .filter(filtro_busca(termo, campo, prefixo='projeto__'))
+        )
+    return projetos, emendas
+
+
+def pagina_secao(secao, termo='', campo='all', cursor=None, limite=TAMANHO_PAGINA_DASHBOARD):
+    """
+    Devolve (itens, proximo_cursor) de uma seção do dashboard, já filtrados,
+    ordenados e limitados no banco numa única consulta.
+    """
+    projetos, emendas = querysets_secao(secao, termo, campo)
+    return linha_do_tempo(projetos, emendas, cursor, limite)
+
+
+def contar_secao(secao, termo='', campo='all'):
+    return contar_linha_do_tempo(*querysets_secao(secao, termo, campo))
+
+
+def contagens_secoes():
+    """
+    Total de itens por seção com duas consultas agregadas (uma por modelo).
+    """
+    por_status_projeto = dict(Projeto.objects.values_list('status').annotate(n=Count('id')))
+    por_status_emenda = dict(Emenda.objects.values_list('status').annotate(n=Count('id')))
+
+    return {
+        secao: sum(por_status_projeto.get(s, 0) for s in definicao['projeto'])
+               + sum(por_status_emenda.get(s, 0) for s in definicao['emenda'])
+        for secao, definicao in SECOES_DASHBOARD.items()
+    }
+
+
+CHAVE_CACHE_ESTATISTICAS_RELATORES = 'core:estatisticas_relatores'
+
+
+def calcular_estatisticas_relatores():
+    """
+    Carga de trabalho de cada relator calculada com agregações no banco:
+    uma consulta para as contagens por status e o item aberto mais antigo,
+    outra para o tempo médio entre submissão e parecer.
+    """
+    abertos = Q(projetos_designados__status__in=['em_analise', 'pendente'])
+    relatores = (
+        User.objects
+        .filter(groups__name='Relatores')
+        .annotate(
+            total=Count('projetos_designados'),
+            em_analise=Count('projetos_designados', filter=Q(projetos_designados__status='em_analise')),
+            pendentes=Count('projetos_designados', filter=Q(projetos_designados__status='pendente')),
+            aprovados=Count('projetos_designados', filter=Q(projetos_designados__status='aprovado')),
+            reprovados=Count('projetos_designados', filter=Q(projetos_designados__status='reprovado')),
+            aberto_mais_antigo=Min('projetos_designados__data_submissao', filter=abertos),
+        )
+        .order_by('first_name', 'username')
+        .values(
+            'id', 'username', 'first_name', 'email',
+            'total', 'em_analise', 'pendentes', 'aprovados', 'reprovados', 'aberto_mais_antigo',
+        )
+    )
+
+    tempo_parecer = ExpressionWrapper(F('data_parecer') - F('projeto__data_submissao'), output_field=DurationField())
+    medias = dict(
+        Parecer.objects
+        .filter(relator__groups__name='Relatores')
+        .values_list('relator')
+        .annotate(media=Avg(tempo_parecer))
+    )
+
+    estatisticas = []
+    for relator in relatores:
+        relator['tempo_medio_parecer'] = medias.get(relator['id'])
+        estatisticas.append(relator)
+    return estatisticas
+
+
+def estatisticas_relatores():
+    """
+    Versão em cache de calcular_estatisticas_relatores(). As views que mudam
+    designação ou status de projetos chamam invalidar_estatisticas_relatores().
+    """
+    estatisticas = cache.get(CHAVE_CACHE_ESTATISTICAS_RELATORES)
+    if estatisticas is None:
+        estatisticas = calcular_estatisticas_relatores()
+        cache.set(CHAVE_CACHE_ESTATISTICAS_RELATORES, estatisticas, settings.TEMPO_CACHE_ESTATISTICAS_RELATORES)
+    return estatisticas
+
+
+def invalidar_estatisticas_relatores():
+    cache.delete(CHAVE_CACHE_ESTATISTICAS_RELATORES)
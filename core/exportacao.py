@@ -0,0 +1,178 @@
+import csv
+import tempfile
+from datetime import date, datetime
+from typing import Any, Callable, NamedTuple, Optional
+
+from django.contrib.auth.models import User
+from django.db.models import F, FilteredRelation, Q, Value
+from django.db.models.functions import Coalesce, NullIf
+from django.utils import timezone
+from openpyxl import Workbook
+
+from .models import Projeto, Emenda, Parecer
+
+TAMANHO_LOTE_EXPORTACAO = 2000
+
+
+def _nome_usuario(prefixo):
+    """first_name do usuário ou, se vazio, o username (como no restante do sistema)."""
+    return Coalesce(NullIf(F(f'{prefixo}first_name'), Value('')), F(f'{prefixo}username'))
+
+
+def _como_data(valor):
+    if isinstance(valor, datetime):
+        return timezone.localtime(valor).date() if timezone.is_aware(valor) else valor.date()
+    return valor
+
+
+def _status(choices):
+    rotulos = dict(choices)
+    return lambda valor: rotulos.get(valor, valor)
+
+
+def _sim_nao(valor):
+    return "Sim" if valor else "Não"
+
+
+class Coluna(NamedTuple):
+    titulo: str
+    expressao: Any
+    formato: Optional[Callable] = None
+    vazio: str = ''
+
+
+# Cada exportação: consulta base (recebe o Q do período), campo usado no
+# filtro de datas e colunas disponíveis (na ordem padrão). As colunas viram
+# anotações, então uma exportação é sempre uma única consulta lida em lotes.
+EXPORTACOES = {
+    'relatores': {
+        'titulo': "Relatores e projetos designados",
+        'arquivo': 'relatores_projetos',
+        # O período entra na condição do JOIN: relatores sem projetos nele continuam na lista
+        'consulta': lambda periodo: User.objects.filter(groups__name='Relatores').alias(
+            projetos=FilteredRelation('projetos_designados', condition=periodo)
+        ).order_by(_nome_usuario(''), 'id', 'projetos__data_submissao', 'projetos__id'),
+        'campo_data': 'projetos_designados__data_submissao',
+        'colunas': {
+            'relator': Coluna('Nome do Relator', _nome_usuario('')),
+            'email': Coluna('E-mail', F('email')),
+            'projeto': Coluna('Projeto', F('projetos__titulo'), vazio="Nenhum projeto designado"),
+            'caae': Coluna('CAAE', F('projetos__caae'), vazio='-'),
+            'status': Coluna('Status', F('projetos__status'), _status(Projeto.STATUS_CHOICES), vazio='-'),
+            'data_submissao': Coluna('Data Submissão', F('projetos__data_submissao'), _como_data, vazio='-'),
+        },
+    },
+    'projetos': {
+        'titulo': "Projetos",
+        'arquivo': 'projetos',
+        'consulta': lambda periodo: Projeto.objects.filter(periodo).order_by('data_submissao', 'id'),
+        'campo_data': 'data_submissao',
+        'colunas': {
+            'caae': Coluna('CAAE', F('caae')),
+            'titulo': Coluna('Título', F('titulo')),
+            'protocolo': Coluna('Protocolo', F('protocolo')),
+            'status': Coluna('Status', F('status'), _status(Projeto.STATUS_CHOICES)),
+            'pesquisador': Coluna('Pesquisador', F('pesquisador__nome')),
+            'pesquisador_email': Coluna('E-mail do Pesquisador', F('pesquisador__email')),
+            'relator': Coluna('Relator', _nome_usuario('relator_designado__')),
+            'relator_email': Coluna('E-mail do Relator', F('relator_designado__email')),
+            'data_submissao': Coluna('Data Submissão', F('data_submissao'), _como_data),
+            'data_aprovacao': Coluna('Data Aprovação', F('data_aprovacao')),
+            'rel_parc': Coluna('Relatório Parcial', F('rel_parc'), _sim_nao),
+            'rel_final': Coluna('Relatório Final', F('rel_final'), _sim_nao),
+        },
+    },
+    'emendas': {
+        'titulo': "Emendas",
+        'arquivo': 'emendas',
+        'consulta': lambda periodo: Emenda.objects.filter(periodo).order_by('data_submissao', 'id'),
+        'campo_data': 'data_submissao',
+        'colunas': {
+            'caae': Coluna('CAAE', F('projeto__caae')),
+            'projeto': Coluna('Projeto', F('projeto__titulo')),
+            'titulo': Coluna('Emenda', F('titulo')),
+            'status': Coluna('Status', F('status'), _status(Emenda.STATUS_EMENDA_CHOICES)),
+            'data_submissao': Coluna('Data Submissão', F('data_submissao'), _como_data),
+            'relator': Coluna('Relator do Parecer', _nome_usuario('relator_parecer__')),
+            'data_parecer': Coluna('Data Parecer', F('data_parecer'), _como_data),
+            'justificativa': Coluna('Justificativa', F('justificativa')),
+        },
+    },
+    'pareceres': {
+        'titulo': "Pareceres",
+        'arquivo': 'pareceres',
+        'consulta': lambda periodo: Parecer.objects.filter(periodo).order_by('data_parecer', 'id'),
+        'campo_data': 'data_parecer',
+        'colunas': {
+            'caae': Coluna('CAAE', F('projeto__caae')),
+            'projeto': Coluna('Projeto', F('projeto__titulo')),
+            'relator': Coluna('Relator', _nome_usuario('relator__')),
+            'relator_email': Coluna('E-mail do Relator', F('relator__email')),
+            'decisao': Coluna('Decisão', F('decisao'), _status(Parecer.DECISAO_CHOICES)),
+            'data_parecer': Coluna('Data Parecer', F('data_parecer'), _como_data),
+            'justificativa': Coluna('Justificativa', F('justificativa')),
+        },
+    },
+}
+
+
+def linhas_exportacao(tipo, colunas=None, de=None, ate=None):
+    """
+    Devolve (cabeçalho, gerador de linhas) da exportação `tipo`. As linhas
+    vêm de um iterator() em lotes, sem carregar instâncias de modelo, e já
+    formatadas (datas como `date`, status pelo rótulo).
+    """
+    definicao = EXPORTACOES[tipo]
+    selecionadas = [definicao['colunas'][c] for c in (colunas or definicao['colunas'])]
+
+    # Os dois limites num único Q: em relação multivalorada, dois filter() fariam dois JOINs
+    limites = {'gte': de, 'lte': ate}
+    periodo = Q(**{f"{definicao['campo_data']}__date__{op}": valor for op, valor in limites.items() if valor})
+    qs = definicao['consulta'](periodo)
+
+    anotacoes = {f'exp_{n}': coluna.expressao for n, coluna in enumerate(selecionadas)}
+    qs = qs.annotate(**anotacoes).values_list(*anotacoes)
+
+    def gerar():
+        for valores in qs.iterator(chunk_size=TAMANHO_LOTE_EXPORTACAO):
+            yield [
+                coluna.vazio if valor is None else (coluna.formato(valor) if coluna.formato else valor)
+                for coluna, valor in zip(selecionadas, valores)
+            ]
+
+    return [coluna.titulo for coluna in selecionadas], gerar()
+
+
+class _Eco:
+    """Pseudo-arquivo para o csv.writer: devolve a linha em vez de guardá-la."""
+    def write(self, valor):
+        return valor
+
+
+def _texto_csv(valor):
+    return valor.strftime("%d/%m/%Y") if isinstance(valor, date) else valor
+
+
+def gerar_csv(cabecalho, linhas):
+    """Gera o CSV linha a linha, para uso com StreamingHttpResponse."""
+    writer = csv.writer(_Eco())
+    yield writer.writerow(cabecalho)
+    for linha in linhas:
+        yield writer.writerow([_texto_csv(valor) for valor in linha])
+
+
+def gerar_xlsx(cabecalho, linhas):
+    """
+    Escreve o XLSX no modo write-only do openpyxl (as linhas vão direto para
+    disco, memória constante) e devolve o arquivo temporário já no início.
+    """
+    workbook = Workbook(write_only=True)
+    planilha = workbook.create_sheet("Exportação")
+    planilha.append(cabecalho)
+    for linha in linhas:
+        planilha.append(linha)
+
+    arquivo = tempfile.TemporaryFile()
+    workbook.save(arquivo)
+    arquivo.seek(0)
+    return arquivo
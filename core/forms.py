@@ -108,6 +108,77 @@ class ProjetoForm(forms.ModelForm):
         self.instance.pesquisador = pesq
         return super().save(commit=commit)
 
+class LinhaImportacaoForm(forms.Form):
+    """
+    Linha do formset de revisão da planilha. Mesmos campos do ProjetoForm,
+    mas sem consultas por linha: as opções de relator chegam prontas e a
+    unicidade do CAAE é validada em lote pelo BaseImportacaoFormSet.
+    """
+    caae = forms.CharField(label="CAAE", max_length=254, widget=forms.TextInput(attrs={'class': 'form-control'}))
+    titulo = forms.CharField(label="Título do Projeto", max_length=255, widget=forms.TextInput(attrs={'class': 'form-control'}))
+    descricao = forms.CharField(label="Descrição", required=False, widget=forms.Textarea(attrs={'class': 'form-control', 'rows': 1}))
+    pesquisador_nome = ProjetoForm.base_fields['pesquisador_nome']
+    pesquisador_email = ProjetoForm.base_fields['pesquisador_email']
+    status_inicial = ProjetoForm.base_fields['status_inicial']
+    relator_designado = forms.TypedChoiceField(
+        label="Relator",
+        required=False,
+        coerce=int,
+        empty_value=None,
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    data_parecer_manual = ProjetoForm.base_fields['data_parecer_manual']
+    relator_nome_texto = ProjetoForm.base_fields['relator_nome_texto']
+
+    def __init__(self, *args, relatores=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['relator_designado'].choices = [('', '-- Sem Relator --')] + list(relatores)
+
+class BaseImportacaoFormSet(forms.BaseFormSet):
+    def __init__(self, *args, **kwargs):
+        # Opções de relator resolvidas uma vez para o formset inteiro
+        relatores = list(User.objects.filter(groups__name='Relatores').order_by('id').values_list('id', 'username'))
+        kwargs.setdefault('form_kwargs', {})['relatores'] = relatores
+        super().__init__(*args, **kwargs)
+
+    def clean(self):
+        if any(self.errors):
+            return
+        vistos = {}
+        for form in self.forms:
+            caae = form.cleaned_data.get('caae')
+            if not caae:
+                continue
+            if caae in vistos:
+                form.add_error('caae', "CAAE repetido na planilha.")
+            vistos.setdefault(caae, form)
+
+        existentes = Projeto.objects.filter(caae__in=list(vistos)).values_list('caae', flat=True)
+        for caae in existentes:
+            vistos[caae].add_error('caae', "Projeto com este CAAE já existe.")
+
+ImportacaoFormSet = forms.formset_factory(LinhaImportacaoForm, formset=BaseImportacaoFormSet, extra=0)
+
+class ExportacaoForm(forms.Form):
+    """
+    Parâmetros (GET) das exportações: formato, colunas e período. As colunas
+    disponíveis dependem da exportação e chegam prontas no __init__.
+    """
+    formato = forms.ChoiceField(choices=[('csv', 'CSV'), ('xlsx', 'Excel (XLSX)')], required=False)
+    colunas = forms.MultipleChoiceField(required=False, widget=forms.CheckboxSelectMultiple)
+    de = forms.DateField(label="De", required=False, widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}))
+    ate = forms.DateField(label="Até", required=False, widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}))
+
+    def __init__(self, *args, colunas=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['colunas'].choices = list(colunas)
+
+    def clean(self):
+        dados = super().clean()
+        if dados.get('de') and dados.get('ate') and dados['de'] > dados['ate']:
+            raise forms.ValidationError("A data inicial é posterior à data final.")
+        return dados
+
 class EmendaForm(forms.ModelForm):
     class Meta:
         model = Emenda
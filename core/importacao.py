@@ -0,0 +1,345 @@
+import io
+from datetime import date, datetime, time, timedelta
+
+import numpy as np
+import pandas as pd
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from sistema_logs.registroLog import RegistroLog
+from .consultas import invalidar_estatisticas_relatores
+from .forms import ImportacaoFormSet
+from .models import Projeto, Pesquisador, Parecer, ImportacaoPlanilha
+from .notificacoes import enviar_emails_pendencia
+
+TAMANHO_LOTE_IMPORTACAO = 500
+# Sem sinal de vida do worker por esse tempo, a importação é dada como interrompida
+TEMPO_MAXIMO_SEM_PROGRESSO = timedelta(minutes=30)
+
+JUSTIFICATIVAS_HISTORICO = {
+    'pendente': "Importação de histórico: Pendência.",
+    'aprovado': "Importação de histórico: Aprovado.",
+    'reprovado': "Importação de histórico: Reprovado.",
+}
+
+
+def ler_planilha(arquivo, nome=None):
+    """
+    Lê CSV ou Excel como texto (evita CAAE virar float) e normaliza os cabeçalhos.
+    `nome` decide o formato quando o arquivo não tem nome (ex.: BytesIO).
+    """
+    if (nome or arquivo.name).endswith('.csv'):
+        df = pd.read_csv(arquivo, dtype=str)
+    else:
+        try: df = pd.read_excel(arquivo, engine='openpyxl', dtype=str)
+        except:
+            arquivo.seek(0)
+            try: df = pd.read_excel(arquivo, engine='xlrd', dtype=str)
+            except:
+                arquivo.seek(0)
+                df = pd.read_excel(arquivo, dtype=str)
+
+    df.columns = df.columns.str.strip()
+    return df
+
+
+def _coluna_texto(df, *nomes):
+    """
+    Primeiro valor não vazio entre as colunas `nomes`, já sem espaços e sem 'nan'.
+    """
+    resultado = pd.Series('', index=df.index, dtype=object)
+    for nome in nomes:
+        if nome not in df.columns:
+            continue
+        coluna = df[nome].fillna('').astype(str).str.strip().replace('nan', '')
+        resultado = resultado.where(resultado != '', coluna)
+    return resultado
+
+
+def _data_da_coluna(coluna):
+    """
+    Extrai a data do cabeçalho da coluna de reunião (ex: "Reunião:01/09").
+    Se não conseguir, usa a data de hoje.
+    """
+    hoje = timezone.now().date()
+    try:
+        if ':' in coluna:
+            str_data = coluna.split(':')[-1].strip()
+        else:
+            str_data = coluna.split()[-1].strip()
+        dia, mes = str_data.split('/')
+        return datetime(hoje.year, int(mes), int(dia)).date()
+    except:
+        return hoje
+
+
+def mapa_relatores(nomes):
+    """
+    Resolve os nomes de relator da planilha para ids com uma única consulta.
+    Usa o primeiro nome, como antes: casa com first_name ou username (sem caixa).
+    """
+    primeiros = {nome.split()[0].lower() for nome in nomes if nome}
+    if not primeiros:
+        return {}
+
+    relatores = list(
+        User.objects.filter(groups__name='Relatores')
+        .order_by('id')
+        .values_list('id', 'first_name', 'username')
+    )
+    mapa = {}
+    for primeiro in primeiros:
+        for id_relator, first_name, username in relatores:
+            if primeiro in (first_name or '').lower() or primeiro in username.lower():
+                mapa[primeiro] = id_relator
+                break
+    return mapa
+
+
+def extrair_linhas(df):
+    """
+    Converte a planilha nos dados iniciais do formset de revisão.
+    Tudo é feito por coluna; o status vem da última coluna de reunião com
+    PENDÊNCIA, REPROVADO ou APROVADO, e a data do parecer do cabeçalho dela.
+    """
+    caae = _coluna_texto(df, 'CAAE')
+    titulo = _coluna_texto(df, 'Titulo', 'Título do Projeto')
+    titulo = titulo.where(titulo != '', 'Projeto Importado ' + caae).str.strip()
+    nome_pesq = _coluna_texto(df, 'Nome Pesquisador', 'Pesquisador', 'NomePesq')
+    email_pesq = _coluna_texto(df, 'Email', 'EmailPesq')
+    relator_texto = _coluna_texto(df, 'RELATOR', 'Relator')
+    descricao = _coluna_texto(df, 'Descricao', 'Descrição')
+    if 'Descricao' not in df.columns and 'Descrição' not in df.columns:
+        descricao[:] = 'Importado via planilha.'
+
+    relatores = mapa_relatores(relator_texto.unique())
+    relator_id = relator_texto.map(lambda nome: relatores.get(nome.split()[0].lower()) if nome else None)
+
+    status = pd.Series('novo', index=df.index, dtype=object)
+    data_parecer = pd.Series(None, index=df.index, dtype=object)
+    for col in [c for c in df.columns if 'Reunião' in str(c)]:
+        val = df[col].fillna('').astype(str).str.strip().str.upper()
+        decisao = pd.Series(np.select(
+            [
+                val.str.contains('PENDENCIA') | val.str.contains('PENDÊNCIA'),
+                val.str.contains('REPROVADO'),
+                val.str.contains('APROVADO'),
+            ],
+            ['pendente', 'reprovado', 'aprovado'],
+            default='',
+        ), index=df.index)
+        tem_decisao = decisao != ''
+        status = status.where(~tem_decisao, decisao)
+        data_parecer = data_parecer.where(~tem_decisao, _data_da_coluna(str(col)))
+
+    status = status.where(~(relator_id.notna() & (status == 'novo')), 'em_analise')
+
+    colunas = zip(caae, titulo, descricao, nome_pesq, email_pesq, status, relator_texto, relator_id, data_parecer)
+    return [
+        {
+            'caae': c,
+            'titulo': t,
+            'descricao': d,
+            'pesquisador_nome': n,
+            'pesquisador_email': e,
+            'status_inicial': s,
+            'relator_nome_texto': rt,
+            'relator_designado': None if pd.isna(r) else int(r),
+            # Sem decisão o pandas deixa NaN na coluna, que não é JSON válido
+            'data_parecer_manual': dp if isinstance(dp, date) else None,
+        }
+        for c, t, d, n, e, s, rt, r, dp in colunas
+    ]
+
+
+def _como_datahora(data):
+    return timezone.make_aware(datetime.combine(data, time()))
+
+
+@transaction.atomic
+def importar_linhas(linhas, usuario):
+    """
+    Grava as linhas revisadas (cleaned_data do formset) em lote: uma consulta
+    para os pesquisadores existentes e bulk_create para pesquisadores novos,
+    projetos e pareceres históricos. Devolve os projetos criados.
+    """
+    linhas = [l for l in linhas if l.get('caae')]
+    if not linhas:
+        return []
+
+    emails = {l['pesquisador_email'] for l in linhas}
+    pesquisadores = {p.email: p for p in Pesquisador.objects.filter(email__in=emails)}
+    novos = {}
+    for l in linhas:
+        email = l['pesquisador_email']
+        if email not in pesquisadores and email not in novos:
+            novos[email] = Pesquisador(email=email, nome=l['pesquisador_nome'], telefone=l.get('pesquisador_telefone') or None)
+    if novos:
+        Pesquisador.objects.bulk_create(novos.values(), batch_size=TAMANHO_LOTE_IMPORTACAO)
+        pesquisadores.update({p.email: p for p in Pesquisador.objects.filter(email__in=novos)})
+
+    hoje = timezone.now().date()
+    projetos = []
+    for l in linhas:
+        status = l.get('status_inicial') or 'novo'
+        data_hist = l.get('data_parecer_manual')
+        projetos.append(Projeto(
+            titulo=l['titulo'],
+            descricao=l.get('descricao') or '',
+            caae=l['caae'],
+            pesquisador=pesquisadores[l['pesquisador_email']],
+            relator_designado_id=l.get('relator_designado'),
+            status=status,
+            data_aprovacao=(data_hist or hoje) if status == 'aprovado' else None,
+        ))
+    Projeto.objects.bulk_create(projetos, batch_size=TAMANHO_LOTE_IMPORTACAO)
+
+    if any(p.pk is None for p in projetos):
+        # Banco sem RETURNING no INSERT em lote: recupera os ids pelo CAAE
+        ids = dict(Projeto.objects.filter(caae__in=[p.caae for p in projetos]).values_list('caae', 'id'))
+        for p in projetos:
+            p.pk = ids[p.caae]
+
+    pareceres = []
+    for projeto, l in zip(projetos, linhas):
+        data_hist = l.get('data_parecer_manual')
+        if data_hist and projeto.status in JUSTIFICATIVAS_HISTORICO:
+            pareceres.append(Parecer(
+                projeto=projeto,
+                relator_id=projeto.relator_designado_id or usuario.id,
+                decisao=projeto.status,
+                justificativa=JUSTIFICATIVAS_HISTORICO[projeto.status],
+                data_parecer=_como_datahora(data_hist),
+            ))
+    Parecer.objects.bulk_create(pareceres, batch_size=TAMANHO_LOTE_IMPORTACAO)
+
+    return projetos
+
+
+# --- IMPORTAÇÃO EM SEGUNDO PLANO ---
+INTERVALO_PROGRESSO = 250
+
+def _serializar_linhas(linhas):
+    return [
+        {campo: valor.isoformat() if isinstance(valor, date) else valor for campo, valor in linha.items()}
+        for linha in linhas
+    ]
+
+
+def _atualizar(job, **campos):
+    ImportacaoPlanilha.objects.filter(pk=job.pk).update(atualizado_em=timezone.now(), **campos)
+    for campo, valor in campos.items():
+        setattr(job, campo, valor)
+
+
+def ler_importacao(job):
+    """
+    Etapa 1: lê a planilha do job e guarda as linhas para revisão.
+    """
+    if not job.conteudo:
+        raise ValueError("A planilha não foi recebida")
+    df = ler_planilha(io.BytesIO(job.conteudo), job.nome_arquivo)
+    linhas = _serializar_linhas(extrair_linhas(df))
+    _atualizar(
+        job,
+        conteudo=None,
+        linhas=linhas,
+        erros=[],
+        total_linhas=len(linhas),
+        linhas_processadas=len(linhas),
+        status='revisao',
+        mensagem="Planilha lida! Por favor, PREENCHA OS E-MAILS FALTANTES e verifique os Relatores na tabela abaixo.",
+    )
+
+
+def gravar_importacao(job):
+    """
+    Etapa 2: valida os dados revisados e grava tudo em lote. Se houver erros,
+    o job volta para revisão com as mensagens de cada linha.
+    """
+    formset = ImportacaoFormSet(job.dados_revisao)
+    _atualizar(job, total_linhas=formset.total_form_count(), linhas_processadas=0)
+
+    for n, form in enumerate(formset.forms, start=1):
+        form.is_valid()
+        if n % INTERVALO_PROGRESSO == 0:
+            _atualizar(job, linhas_processadas=n)
+
+    if not formset.is_valid():
+        _atualizar(
+            job,
+            status='revisao',
+            linhas=[{nome: form[nome].value() for nome in form.fields} for form in formset.forms],
+            erros=[
+                {campo: [e['message'] for e in msgs] for campo, msgs in form.errors.get_json_data().items()}
+                for form in formset.forms
+            ],
+            mensagem=" ".join(formset.non_form_errors()) or "Existem erros no formulário. Verifique os campos em vermelho.",
+        )
+        return []
+
+    projetos = importar_linhas([f.cleaned_data for f in formset], job.usuario)
+    enviar_emails_pendencia(
+        [p for p in projetos if p.status == 'pendente'],
+        "Pendência identificada na importação inicial.",
+    )
+
+    invalidar_estatisticas_relatores()
+    _atualizar(
+        job,
+        status='concluida',
+        linhas_processadas=len(formset.forms),
+        mensagem=f"{len(projetos)} projeto(s) importado(s).",
+    )
+    return projetos
+
+
+ETAPAS_IMPORTACAO = {
+    # status na fila -> (status durante o processamento, função)
+    'na_fila': ('lendo', ler_importacao),
+    'confirmada': ('importando', gravar_importacao),
+}
+
+
+def liberar_interrompidas():
+    """Marca como erro as importações cujo worker parou no meio da leitura ou da gravação."""
+    limite = timezone.now() - TEMPO_MAXIMO_SEM_PROGRESSO
+    return ImportacaoPlanilha.objects.filter(status__in=('lendo', 'importando'), atualizado_em__lt=limite).update(
+        status='erro', mensagem="Importação interrompida. Envie a planilha novamente.", atualizado_em=timezone.now()
+    )
+
+
+def processar_proxima_importacao():
+    """
+    Pega o job mais antigo da fila e executa a etapa correspondente.
+    A reserva é um UPDATE condicional, então vários workers podem rodar juntos.
+    Devolve o job processado ou None se a fila estiver vazia.
+    """
+    liberar_interrompidas()
+    for job in ImportacaoPlanilha.objects.filter(status__in=ETAPAS_IMPORTACAO).order_by('atualizado_em', 'id'):
+        status_execucao, etapa = ETAPAS_IMPORTACAO[job.status]
+        reservado = ImportacaoPlanilha.objects.filter(pk=job.pk, status=job.status).update(
+            status=status_execucao, atualizado_em=timezone.now()
+        )
+        if not reservado:
+            continue
+
+        job.status = status_execucao
+        try:
+            etapa(job)
+            RegistroLog.registra(
+                nome_log="ImportacaoPlanilha",
+                processo=etapa.__name__,
+                parametros_func={'importacao': job.pk},
+            )
+        except Exception as e:
+            _atualizar(job, status='erro', mensagem=f"Erro crítico ao processar a importação: {str(e)}. Verifique se é um Excel válido.")
+            RegistroLog.registra(
+                nome_log="ImportacaoPlanilha",
+                processo=etapa.__name__,
+                parametros_func={'importacao': job.pk},
+                msgErro=str(e),
+            )
+        return job
+    return None
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core.sincronizacao import processar_proxima_sincronizacao
+from webdriver.pool import pool
+
+
+class Command(BaseCommand):
+    help = 'Processa a fila de sincronizações com a Plataforma Brasil'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--uma-vez', action='store_true', help='Esvazia a fila e sai, sem ficar aguardando novos jobs.')
+        parser.add_argument('--intervalo', type=float, default=2, help='Segundos de espera quando a fila está vazia.')
+
+    def handle(self, *args, **options):
+        self.stdout.write("Aguardando sincronizações...")
+        try:
+            while True:
+                # Conexão derrubada pelo banco (CONN_MAX_AGE, reinício) não deve derrubar o worker
+                close_old_connections()
+                job = processar_proxima_sincronizacao()
+                if job is not None:
+                    self.stdout.write(f"Sincronização {job.pk}: {job.get_status_display()}")
+                    continue
+                if options['uma_vez']:
+                    break
+                # Fecha os navegadores ociosos enquanto espera
+                pool.evict_idle()
+                time.sleep(options['intervalo'])
+        finally:
+            pool.close_all()
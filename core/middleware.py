@@ -0,0 +1,38 @@
+import logging
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class ContadorConsultasMiddleware:
+    """
+    Conta quantas consultas SQL cada requisição executou.
+
+    O total fica em `request.total_consultas` e no cabeçalho `X-Total-Consultas`.
+    Se `LIMITE_CONSULTAS_POR_REQUISICAO` estiver definido no settings, requisições
+    que passarem do limite geram um aviso no log (útil para pegar N+1 cedo).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.limite = getattr(settings, 'LIMITE_CONSULTAS_POR_REQUISICAO', None)
+
+    def __call__(self, request):
+        request.total_consultas = 0
+
+        def contar(execute, sql, params, many, context):
+            request.total_consultas += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(contar):
+            response = self.get_response(request)
+
+        response['X-Total-Consultas'] = str(request.total_consultas)
+        if self.limite is not None and request.total_consultas > self.limite:
+            logger.warning(
+                "%s %s executou %d consultas (limite: %d)",
+                request.method, request.path, request.total_consultas, self.limite,
+            )
+        return response
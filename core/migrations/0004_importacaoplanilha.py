@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_parecer_arquivo_parecer'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportacaoPlanilha',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('arquivo', models.FileField(upload_to='importacoes/', verbose_name='Planilha')),
+                ('status', models.CharField(choices=[('na_fila', 'Na fila'), ('lendo', 'Lendo planilha'), ('revisao', 'Aguardando revisão'), ('confirmada', 'Confirmada'), ('importando', 'Importando'), ('concluida', 'Concluída'), ('erro', 'Erro')], db_index=True, default='na_fila', max_length=20)),
+                ('total_linhas', models.PositiveIntegerField(default=0)),
+                ('linhas_processadas', models.PositiveIntegerField(default=0)),
+                ('mensagem', models.TextField(blank=True, default='')),
+                ('linhas', models.JSONField(blank=True, default=list)),
+                ('dados_revisao', models.JSONField(blank=True, default=dict)),
+                ('erros', models.JSONField(blank=True, default=list)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='importacoes', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
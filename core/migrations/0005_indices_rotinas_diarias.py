@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_importacaoplanilha'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='parecer',
+            index=models.Index(fields=['projeto', 'decisao', 'data_parecer'], name='core_parece_projeto_d96050_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='projeto',
+            index=models.Index(fields=['status', 'data_aprovacao'], name='core_projet_status_4e2389_idx'),
+        ),
+    ]
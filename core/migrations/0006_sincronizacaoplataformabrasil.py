@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_indices_rotinas_diarias'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SincronizacaoPlataformaBrasil',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('conta', models.CharField(db_index=True, max_length=254, verbose_name='E-mail da conta')),
+                ('senha', models.CharField(blank=True, default='', max_length=255)),
+                ('status', models.CharField(choices=[('na_fila', 'Na fila'), ('executando', 'Executando'), ('concluida', 'Concluída'), ('erro', 'Erro')], db_index=True, default='na_fila', max_length=20)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('processados', models.PositiveIntegerField(default=0)),
+                ('mensagem', models.TextField(blank=True, default='')),
+                ('resultado', models.JSONField(blank=True, default=dict)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('iniciado_em', models.DateTimeField(blank=True, null=True)),
+                ('concluido_em', models.DateTimeField(blank=True, null=True)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status__in', ('na_fila', 'executando'))), fields=('conta',), name='uma_sincronizacao_pb_ativa_por_conta')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_sincronizacaoplataformabrasil'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProtocoloPlataformaBrasil',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('caae', models.CharField(max_length=254, unique=True, verbose_name='CAAE')),
+                ('versao', models.CharField(blank=True, default='', max_length=20)),
+                ('data_ultima_modificacao', models.CharField(blank=True, default='', max_length=30)),
+                ('situacao', models.CharField(blank=True, default='', max_length=255)),
+                ('pesquisador', models.CharField(blank=True, default='', max_length=255)),
+                ('relator', models.CharField(blank=True, default='', max_length=255)),
+                ('sincronizado_em', models.DateTimeField()),
+                ('projeto', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='protocolos_pb', to='core.projeto')),
+            ],
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.6 on 2026-10-18 15:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_protocoloplataformabrasil'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sincronizacaoplataformabrasil',
+            name='solicitante',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sincronizacoes_pb', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,34 @@
+from django.db import migrations, models
+
+
+def copiar_nomes(apps, schema_editor):
+    ImportacaoPlanilha = apps.get_model('core', 'ImportacaoPlanilha')
+    for job in ImportacaoPlanilha.objects.exclude(arquivo=''):
+        job.nome_arquivo = job.arquivo.name.rsplit('/', 1)[-1]
+        job.save(update_fields=['nome_arquivo'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_sincronizacaoplataformabrasil_solicitante'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importacaoplanilha',
+            name='nome_arquivo',
+            field=models.CharField(default='', max_length=255, verbose_name='Planilha'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='importacaoplanilha',
+            name='conteudo',
+            field=models.BinaryField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(copiar_nomes, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='importacaoplanilha',
+            name='arquivo',
+        ),
+    ]
@@ -75,6 +75,10 @@ class Projeto(models.Model):
     rel_final = models.BooleanField("Relatório Final Recebido", default=False)
     rel_parc = models.BooleanField("Relatório Parcial Recebido", default=False)
 
+    class Meta:
+        # Rotinas diárias: projetos aprovados numa faixa de datas
+        indexes = [models.Index(fields=['status', 'data_aprovacao'])]
+
     def __str__(self):
         return f"{self.titulo} ({self.caae})"
 
@@ -134,5 +138,111 @@ class Parecer(models.Model):
         blank=True
     )
 
+    class Meta:
+        # Último parecer de cada decisão por projeto (prazos de pendência)
+        indexes = [models.Index(fields=['projeto', 'decisao', 'data_parecer'])]
+
+    def __str__(self):
+        return f"Parecer de {self.relator.username} para {self.projeto.titulo}"
+
+class ImportacaoPlanilha(models.Model):
+    """
+    Importação de planilha processada fora da requisição pelo comando
+    `processar_importacoes`. O próprio registro serve de fila: o worker pega
+    os jobs 'na_fila' (leitura) e 'confirmada' (validação e gravação).
+    """
+    STATUS_CHOICES = (
+        ('na_fila', 'Na fila'),
+        ('lendo', 'Lendo planilha'),
+        ('revisao', 'Aguardando revisão'),
+        ('confirmada', 'Confirmada'),
+        ('importando', 'Importando'),
+        ('concluida', 'Concluída'),
+        ('erro', 'Erro'),
+    )
+
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='importacoes')
+    # A planilha viaja no próprio registro: o worker roda em outro serviço e
+    # não enxerga o disco do web. Os bytes são descartados depois da leitura.
+    nome_arquivo = models.CharField("Planilha", max_length=255)
+    conteudo = models.BinaryField(null=True, blank=True, editable=False)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='na_fila', db_index=True)
+
+    total_linhas = models.PositiveIntegerField(default=0)
+    linhas_processadas = models.PositiveIntegerField(default=0)
+    mensagem = models.TextField(blank=True, default='')
+
+    # Linhas lidas da planilha (dados iniciais do formset) e, depois da revisão,
+    # os dados enviados pelo gestor e os erros de validação por linha.
+    linhas = models.JSONField(default=list, blank=True)
+    dados_revisao = models.JSONField(default=dict, blank=True)
+    erros = models.JSONField(default=list, blank=True)
+
+    criado_em = models.DateTimeField(auto_now_add=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Importação {self.id} ({self.get_status_display()})"
+
+
+class SincronizacaoPlataformaBrasil(models.Model):
+    """
+    Sincronização com a Plataforma Brasil executada fora da requisição pelo
+    comando `sincronizar_plataforma_brasil`. Como na ImportacaoPlanilha, o
+    registro é a fila. Só pode haver uma sincronização ativa por conta.
+    """
+    STATUS_CHOICES = (
+        ('na_fila', 'Na fila'),
+        ('executando', 'Executando'),
+        ('concluida', 'Concluída'),
+        ('erro', 'Erro'),
+    )
+    STATUS_ATIVOS = ('na_fila', 'executando')
+
+    solicitante = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='sincronizacoes_pb')
+    conta = models.CharField("E-mail da conta", max_length=254, db_index=True)
+    # Só fica gravada enquanto o job está na fila: o worker apaga ao reservá-lo,
+    # e jobs que passam de TEMPO_MAXIMO_NA_FILA sem worker são cancelados
+    senha = models.CharField(max_length=255, blank=True, default='')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='na_fila', db_index=True)
+
+    total = models.PositiveIntegerField(default=0)
+    processados = models.PositiveIntegerField(default=0)
+    mensagem = models.TextField(blank=True, default='')
+    resultado = models.JSONField(default=dict, blank=True)
+
+    criado_em = models.DateTimeField(auto_now_add=True)
+    iniciado_em = models.DateTimeField(null=True, blank=True)
+    concluido_em = models.DateTimeField(null=True, blank=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['conta'],
+                condition=models.Q(status__in=('na_fila', 'executando')),
+                name='uma_sincronizacao_pb_ativa_por_conta',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Sincronização {self.id} ({self.get_status_display()})"
+
+
+class ProtocoloPlataformaBrasil(models.Model):
+    """
+    Última versão vista de cada protocolo na tabela da Plataforma Brasil.
+    A sincronização compara versão e data da última modificação com esta
+    foto e só abre o detalhe dos protocolos novos ou alterados.
+    """
+    caae = models.CharField("CAAE", max_length=254, unique=True)
+    versao = models.CharField(max_length=20, blank=True, default='')
+    data_ultima_modificacao = models.CharField(max_length=30, blank=True, default='')
+    situacao = models.CharField(max_length=255, blank=True, default='')
+    pesquisador = models.CharField(max_length=255, blank=True, default='')
+    relator = models.CharField(max_length=255, blank=True, default='')
+    projeto = models.ForeignKey(Projeto, on_delete=models.SET_NULL, null=True, blank=True, related_name='protocolos_pb')
+    sincronizado_em = models.DateTimeField()
+
     def __str__(self):
-        return f"Parecer de {self.relator.username} para {self.projeto.titulo}"
\ No newline at end of file
+        return f"{self.caae} (versão {self.versao})"
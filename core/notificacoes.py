@@ -0,0 +1,45 @@
+from emails.fila import enfileirar_email, enfileirar_emails
+from emails.models import EmailSaida
+from emails.notificacoes import modelo_notificacao
+
+
+def _contexto_pendencia(projeto, motivo):
+    return {
+        'nome_pesquisador': projeto.pesquisador.nome,
+        'titulo': projeto.titulo,
+        'caae': projeto.caae,
+        'motivo': motivo,
+    }
+
+
+def _email_pendencia(projeto, renderizado):
+    assunto, mensagem, html = renderizado
+    return EmailSaida(destinatario=projeto.pesquisador.email, assunto=assunto, mensagem=mensagem,
+                      mensagem_html=html, projeto=projeto)
+
+
+def email_pendencia(projeto, motivo="Pendências identificadas pelo relator."):
+    """
+    Monta (sem salvar) o aviso de pendência para o pesquisador do projeto.
+    Devolve None se o pesquisador não tiver e-mail.
+    """
+    if not projeto.pesquisador.email:
+        return None
+    return _email_pendencia(projeto, modelo_notificacao('pendencia_projeto').renderizar(_contexto_pendencia(projeto, motivo)))
+
+
+def enviar_email_pendencia(projeto, motivo="Pendências identificadas pelo relator."):
+    """Coloca o aviso de pendência na caixa de saída (o envio é feito pelo worker)."""
+    email = email_pendencia(projeto, motivo)
+    if email:
+        return enfileirar_email(email.destinatario, email.assunto, email.mensagem, projeto=projeto,
+                                mensagem_html=email.mensagem_html)
+
+
+def enviar_emails_pendencia(projetos, motivo):
+    """Renderiza os avisos de vários projetos em lote e os enfileira com um único INSERT."""
+    projetos = [p for p in projetos if p.pesquisador.email]
+    renderizados = modelo_notificacao('pendencia_projeto').renderizar_lote(
+        [_contexto_pendencia(p, motivo) for p in projetos]
+    )
+    return enfileirar_emails([_email_pendencia(p, r) for p, r in zip(projetos, renderizados)])
@@ -0,0 +1,86 @@
+from datetime import datetime
+
+from django.utils import timezone
+
+from .consultas import invalidar_estatisticas_relatores
+from .models import Pesquisador, Projeto, ProtocoloPlataformaBrasil
+
+# Situação na Plataforma Brasil -> status inicial do Projeto criado pela sincronização
+STATUS_POR_SITUACAO = {
+    'Relatoria Aprovada': 'aprovado',
+    'Relatoria Recusada': 'pendente',
+    'Em relatoria': 'em_analise',
+}
+
+
+def data_br(texto):
+    """'dd/mm/aaaa' (com ou sem hora) -> date; None se não for uma data."""
+    try:
+        return datetime.strptime((texto or '')[:10], '%d/%m/%Y').date()
+    except ValueError:
+        return None
+
+
+def protocolos_conhecidos():
+    """{caae: (versao, data_ultima_modificacao)} da última sincronização."""
+    return {
+        caae: (versao, modificacao)
+        for caae, versao, modificacao in ProtocoloPlataformaBrasil.objects.values_list('caae', 'versao', 'data_ultima_modificacao')
+    }
+
+
+def gravar_protocolos(registros):
+    """
+    Grava um lote de protocolos lidos da Plataforma Brasil (linha da tabela
+    + e-mail/telefone do detalhe) com um upsert em lote por tabela:
+    pesquisadores por e-mail, projetos e a foto por CAAE.
+    O que é gerido aqui não é sobrescrito: título, descrição, status e data
+    de aprovação do Projeto só são preenchidos na criação (depois seguem o
+    fluxo de pareceres), e um telefone vazio na Plataforma Brasil não apaga
+    o do Pesquisador. Em projetos já existentes só o pesquisador responsável
+    é atualizado. Devolve quantos protocolos foram gravados.
+    """
+    # Sem o e-mail do detalhe não há pesquisador; o protocolo fica para a próxima sincronização.
+    # Um CAAE/e-mail por lote: o ON CONFLICT não pode atualizar a mesma linha duas vezes.
+    registros = list({r['caae']: r for r in registros if r.get('email_pesquisador')}.values())
+    if not registros:
+        return 0
+    agora = timezone.now()
+
+    por_email = {r['email_pesquisador']: r for r in registros}
+    # Um UPSERT só aceita uma lista de colunas: sem telefone, atualiza só o nome
+    for com_telefone, colunas in ((True, ['nome', 'telefone']), (False, ['nome'])):
+        lote = [
+            Pesquisador(nome=r['pesquisador'], email=email, telefone=r.get('telefone_pesquisador') or None)
+            for email, r in por_email.items() if bool(r.get('telefone_pesquisador')) == com_telefone
+        ]
+        if lote:
+            Pesquisador.objects.bulk_create(lote, update_conflicts=True, unique_fields=['email'], update_fields=colunas)
+    pesquisadores = dict(Pesquisador.objects.filter(email__in=por_email).values_list('email', 'id'))
+
+    def projeto(r):
+        status = STATUS_POR_SITUACAO.get(r['situacao'])
+        return Projeto(
+            caae=r['caae'], titulo=r['caae'], descricao='',
+            pesquisador_id=pesquisadores[r['email_pesquisador']],
+            status=status or 'novo',
+            data_aprovacao=data_br(r['data_ultima_modificacao']) if status == 'aprovado' else None,
+        )
+
+    Projeto.objects.bulk_create([projeto(r) for r in registros], update_conflicts=True, unique_fields=['caae'], update_fields=['pesquisador'])
+    projetos = dict(Projeto.objects.filter(caae__in={r['caae'] for r in registros}).values_list('caae', 'id'))
+
+    ProtocoloPlataformaBrasil.objects.bulk_create(
+        [
+            ProtocoloPlataformaBrasil(
+                caae=r['caae'], versao=r['versao'], data_ultima_modificacao=r['data_ultima_modificacao'],
+                situacao=r['situacao'], pesquisador=r['pesquisador'], relator=r['relator'],
+                projeto_id=projetos.get(r['caae']), sincronizado_em=agora,
+            )
+            for r in registros
+        ],
+        update_conflicts=True, unique_fields=['caae'],
+        update_fields=['versao', 'data_ultima_modificacao', 'situacao', 'pesquisador', 'relator', 'projeto', 'sincronizado_em'],
+    )
+    invalidar_estatisticas_relatores()
+    return len(registros)
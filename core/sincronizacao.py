@@ -0,0 +1,106 @@
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from sistema_logs.registroLog import RegistroLog
+from webdriver.pool import pool
+from .models import SincronizacaoPlataformaBrasil
+
+# Sem sinal de vida do worker por esse tempo, a sincronização é dada como interrompida
+TEMPO_MAXIMO_SEM_PROGRESSO = timedelta(minutes=30)
+# Nenhum worker pegou o job nesse tempo: ele é cancelado e a senha sai do banco
+TEMPO_MAXIMO_NA_FILA = timedelta(minutes=15)
+
+
+def enfileirar_sincronizacao(conta, senha, solicitante=None):
+    """
+    Cria a sincronização da conta, ou devolve a que já está ativa.
+    Devolve (job, criado).
+    """
+    liberar_interrompidas()
+    ativos = SincronizacaoPlataformaBrasil.objects.filter(conta=conta, status__in=SincronizacaoPlataformaBrasil.STATUS_ATIVOS)
+    job = ativos.first()
+    if job is not None:
+        return job, False
+    try:
+        with transaction.atomic():
+            return SincronizacaoPlataformaBrasil.objects.create(conta=conta, senha=senha, solicitante=solicitante), True
+    except IntegrityError:
+        # Outra requisição da mesma conta criou o job entre a consulta e o INSERT
+        return ativos.first(), False
+
+
+def _atualizar(job, **campos):
+    SincronizacaoPlataformaBrasil.objects.filter(pk=job.pk).update(atualizado_em=timezone.now(), **campos)
+    for campo, valor in campos.items():
+        setattr(job, campo, valor)
+
+
+def liberar_interrompidas():
+    """
+    Marca como erro as sincronizações cujo worker parou de dar notícias e as
+    que ficaram na fila sem worker, liberando a conta. Também roda ao
+    enfileirar e ao consultar o status, então não depende de haver worker.
+    """
+    agora = timezone.now()
+    sincronizacoes = SincronizacaoPlataformaBrasil.objects
+    interrompidas = sincronizacoes.filter(status='executando', atualizado_em__lt=agora - TEMPO_MAXIMO_SEM_PROGRESSO).update(
+        status='erro', mensagem="Sincronização interrompida.", concluido_em=agora, atualizado_em=agora
+    )
+    esquecidas = sincronizacoes.filter(status='na_fila', criado_em__lt=agora - TEMPO_MAXIMO_NA_FILA).update(
+        status='erro', senha='', mensagem="Sincronização não iniciada a tempo. Tente novamente.", concluido_em=agora, atualizado_em=agora
+    )
+    return interrompidas + esquecidas
+
+
+def executar_sincronizacao(job, senha, navegadores):
+    with navegadores.session(job.conta, senha) as servico:
+        if not servico.logged:
+            raise Exception("Não foi possível entrar na Plataforma Brasil com essa conta.")
+
+        def progresso(feitos, total):
+            _atualizar(job, processados=feitos, total=total, mensagem=f"Lendo protocolos: {feitos} de {total}")
+
+        servico.fetch_projects_form_table(progress=progresso)
+        return servico.last_sync or {}
+
+
+def processar_proxima_sincronizacao(navegadores=None):
+    """
+    Pega a sincronização mais antiga da fila e a executa com um navegador do
+    pool (que fica logado para as próximas). A reserva é um UPDATE
+    condicional que também apaga a senha do banco.
+    Devolve o job processado ou None se a fila estiver vazia.
+    """
+    navegadores = navegadores or pool
+    liberar_interrompidas()
+
+    for job in SincronizacaoPlataformaBrasil.objects.filter(status='na_fila').order_by('criado_em', 'id'):
+        senha = job.senha
+        reservado = SincronizacaoPlataformaBrasil.objects.filter(pk=job.pk, status='na_fila').update(
+            status='executando', senha='', iniciado_em=timezone.now(), atualizado_em=timezone.now()
+        )
+        if not reservado:
+            continue
+
+        job.status, job.senha = 'executando', ''
+        try:
+            resultado = executar_sincronizacao(job, senha, navegadores)
+            _atualizar(job, status='concluida', resultado=resultado, concluido_em=timezone.now(),
+                       mensagem=f"{resultado.get('salvos', 0)} protocolo(s) atualizado(s).")
+            RegistroLog.registra(
+                nome_log="SincronizacaoPlataformaBrasil",
+                processo="fetch_projects_form_table",
+                parametros_func={'sincronizacao': job.pk},
+            )
+        except Exception as e:
+            _atualizar(job, status='erro', mensagem=str(e), concluido_em=timezone.now())
+            RegistroLog.registra(
+                nome_log="SincronizacaoPlataformaBrasil",
+                processo="fetch_projects_form_table",
+                parametros_func={'sincronizacao': job.pk},
+                msgErro=str(e),
+            )
+        return job
+    return None
@@ -1,3 +1,745 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import re
+import tempfile
+from contextlib import contextmanager
+from datetime import timedelta, date
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from django.test import TestCase, override_settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+from django.utils import timezone
+from django.contrib.auth.models import User, Group
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from core.models import Projeto, Pesquisador, Emenda, Parecer, ImportacaoPlanilha, SincronizacaoPlataformaBrasil, ProtocoloPlataformaBrasil
+from core.views import is_gestor, is_relator, grupos_do_usuario
+from core.importacao import extrair_linhas, importar_linhas, processar_proxima_importacao
+from core.sincronizacao import enfileirar_sincronizacao, processar_proxima_sincronizacao
+from core.protocolos import gravar_protocolos, protocolos_conhecidos
+from core.consultas import (
+    pagina_secao, decodificar_cursor, linha_do_tempo, ItemLinhaDoTempo, TAMANHO_PAGINA_DASHBOARD,
+    estatisticas_relatores, CHAVE_CACHE_ESTATISTICAS_RELATORES,
+)
+
+CACHE_LOCAL = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+# Número máximo de consultas que o dashboard do gestor pode executar,
+# contando sessão, usuário e checagem de grupo. Não depende da quantidade de itens:
+# uma página por seção (um UNION cada), contagens e estatísticas de relatores
+# sem cache (o pior caso).
+ORCAMENTO_CONSULTAS_DASHBOARD = 11
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class DashboardGestorConsultasTest(TestCase):
+    def setUp(self):
+        self.gestores = Group.objects.create(name='Gestores')
+        self.relatores = Group.objects.create(name='Relatores')
+
+        self.gestor = User.objects.create_user('gestor', 'gestor@teste.com', '123')
+        self.gestor.groups.add(self.gestores)
+
+        self.relator = User.objects.create_user('relator', 'relator@teste.com', '123', first_name='Relator')
+        self.relator.groups.add(self.relatores)
+
+        self.client.force_login(self.gestor)
+        self.total_projetos = 0
+
+    def criar_itens(self, quantidade):
+        status = ['novo', 'em_analise', 'pendente', 'aprovado', 'reprovado']
+        for _ in range(quantidade):
+            n = self.total_projetos
+            self.total_projetos += 1
+            pesq = Pesquisador.objects.create(nome=f"Pesq {n}", email=f"pesq{n}@teste.com")
+            projeto = Projeto.objects.create(
+                titulo=f"Projeto {n}",
+                descricao="",
+                caae=f"CAAE-{n}",
+                pesquisador=pesq,
+                relator_designado=self.relator if n % 5 else None,
+                status=status[n % len(status)],
+            )
+            Emenda.objects.create(
+                projeto=projeto,
+                titulo=f"Emenda {n}",
+                descricao="",
+                status='pendente' if n % 2 else 'aprovada',
+            )
+
+    def consultas_dashboard(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_dashboard_dentro_do_orcamento(self):
+        self.criar_itens(10)
+        total, _ = self.consultas_dashboard()
+        self.assertLessEqual(total, ORCAMENTO_CONSULTAS_DASHBOARD)
+
+    def test_consultas_nao_crescem_com_itens(self):
+        self.criar_itens(5)
+        poucos, _ = self.consultas_dashboard()
+
+        self.criar_itens(25)
+        muitos, _ = self.consultas_dashboard()
+
+        self.assertEqual(poucos, muitos)
+
+    def test_cabecalho_contador_consultas(self):
+        self.criar_itens(3)
+        total, response = self.consultas_dashboard()
+        self.assertEqual(int(response['X-Total-Consultas']), total)
+
+
+class DashboardSecaoTest(TestCase):
+    def setUp(self):
+        gestores = Group.objects.create(name='Gestores')
+        self.gestor = User.objects.create_user('gestor', 'gestor@teste.com', '123')
+        self.gestor.groups.add(gestores)
+        self.client.force_login(self.gestor)
+
+        relator = User.objects.create_user('maria', 'maria@teste.com', '123', first_name='Maria')
+        pesq = Pesquisador.objects.create(nome="Ana Souza", email="ana@teste.com")
+        outro = Pesquisador.objects.create(nome="Bruno Lima", email="bruno@teste.com")
+
+        agora = timezone.now()
+        for n in range(7):
+            projeto = Projeto.objects.create(
+                titulo=f"Estudo {n}",
+                descricao="",
+                caae=f"1000.{n}",
+                pesquisador=pesq if n % 2 else outro,
+                relator_designado=relator if n < 3 else None,
+                status='aprovado',
+                data_submissao=agora - timedelta(days=n),
+            )
+            emenda = Emenda.objects.create(projeto=projeto, titulo=f"Alteração {n}", descricao="", status='aprovada')
+            # mesma data do projeto para exercitar o desempate do cursor
+            Emenda.objects.filter(pk=emenda.pk).update(data_submissao=projeto.data_submissao)
+
+    def buscar(self, **params):
+        response = self.client.get(reverse('dashboard_secao', args=['concluido']), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_primeira_pagina(self):
+        dados = self.buscar()
+        self.assertEqual(dados['total'], 14)
+        self.assertIsNone(dados['proximo'])
+        self.assertEqual(len(re.findall(r'<tr>', dados['html'])), 14)
+
+    def test_paginacao_percorre_todos_os_itens(self):
+        vistos = []
+        cursor = None
+        while True:
+            itens, cursor = pagina_secao('concluido', cursor=decodificar_cursor(cursor), limite=3)
+            vistos += [(i.tipo_item, i.id) for i in itens]
+            if not cursor:
+                break
+        self.assertEqual(len(vistos), 14)
+        self.assertEqual(len(set(vistos)), 14)
+
+    def test_endpoint_segue_cursor(self):
+        itens, cursor = pagina_secao('concluido', limite=5)
+        dados = self.buscar(apos=cursor)
+        self.assertNotIn('total', dados)
+        self.assertEqual(len(re.findall(r'<tr>', dados['html'])), 9)
+        for item in itens:
+            marca = f"CAAE: {item.caae}" if item.tipo_item == 'P' else f"Emenda: {item.titulo}"
+            self.assertNotIn(marca, dados['html'])
+
+    def test_filtro_no_servidor(self):
+        dados = self.buscar(q="1000.4", campo="caae")
+        self.assertEqual(dados['total'], 2)
+        self.assertIn("Estudo 4", dados['html'])
+        self.assertNotIn("Estudo 3", dados['html'])
+
+        dados = self.buscar(q="maria", campo="relator-nome")
+        self.assertEqual(dados['total'], 6)
+
+        dados = self.buscar(q="ana", campo="pesquisador")
+        self.assertEqual(dados['total'], 6)
+
+    def test_cursor_invalido(self):
+        response = self.client.get(reverse('dashboard_secao', args=['concluido']), {'apos': 'lixo'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_secao_inexistente(self):
+        response = self.client.get(reverse('dashboard_secao', args=['nada']))
+        self.assertEqual(response.status_code, 404)
+
+
+class LinhaDoTempoTest(TestCase):
+    def setUp(self):
+        Group.objects.create(name='Gestores')
+        relatores = Group.objects.create(name='Relatores')
+        self.relator = User.objects.create_user('relator', 'relator@teste.com', '123', first_name='Carla')
+        self.relator.groups.add(relatores)
+        pesq = Pesquisador.objects.create(nome="Ana", email="ana@teste.com")
+
+        agora = timezone.now()
+        self.antigo = Projeto.objects.create(
+            titulo="Antigo", descricao="", caae="A-1", pesquisador=pesq,
+            relator_designado=self.relator, status='aprovado',
+            data_submissao=agora - timedelta(days=10),
+        )
+        self.recente = Projeto.objects.create(
+            titulo="Recente", descricao="", caae="R-1", pesquisador=pesq,
+            relator_designado=self.relator, status='em_analise',
+            data_submissao=agora - timedelta(days=1),
+        )
+        self.emenda = Emenda.objects.create(projeto=self.antigo, titulo="Ajuste", descricao="", status='pendente')
+        Emenda.objects.filter(pk=self.emenda.pk).update(data_submissao=agora - timedelta(days=5))
+
+    def test_uniao_ordenada_em_uma_consulta(self):
+        with self.assertNumQueries(1):
+            itens, proximo = linha_do_tempo(Projeto.objects.all(), Emenda.objects.all(), limite=2)
+
+        self.assertEqual([(i.tipo_item, i.id) for i in itens], [('P', self.recente.id), ('E', self.emenda.id)])
+        self.assertIsNotNone(proximo)
+        self.assertIsInstance(itens[0], ItemLinhaDoTempo)
+
+        emenda = itens[1]
+        self.assertEqual(emenda.caae, "A-1")
+        self.assertEqual(emenda.projeto_id, self.antigo.id)
+        self.assertEqual(emenda.relator_nome, "Carla")
+        self.assertEqual(emenda.get_status_display(), "Pendente")
+
+        resto, proximo = linha_do_tempo(Projeto.objects.all(), Emenda.objects.all(), cursor=decodificar_cursor(proximo), limite=2)
+        self.assertEqual([(i.tipo_item, i.id) for i in resto], [('P', self.antigo.id)])
+        self.assertIsNone(proximo)
+
+    def test_dashboard_relator(self):
+        self.client.force_login(self.relator)
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([i.id for i in response.context['projetos_para_analisar']], [self.recente.id, self.emenda.id])
+        self.assertEqual([i.id for i in response.context['meus_projetos_concluidos']], [self.antigo.id])
+
+    def test_dashboard_relator_historico_completo(self):
+        pesq = Pesquisador.objects.get()
+        for n in range(TAMANHO_PAGINA_DASHBOARD + 5):
+            Projeto.objects.create(titulo=f"Concluído {n}", descricao="", caae=f"C-{n}", pesquisador=pesq,
+                                   relator_designado=self.relator, status='aprovado')
+        self.client.force_login(self.relator)
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(len(response.context['meus_projetos_concluidos']), TAMANHO_PAGINA_DASHBOARD + 6)
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class EstatisticasRelatoresTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        gestores = Group.objects.create(name='Gestores')
+        relatores = Group.objects.create(name='Relatores')
+        self.gestor = User.objects.create_user('gestor', 'gestor@teste.com', '123')
+        self.gestor.groups.add(gestores)
+        self.relator = User.objects.create_user('relator', 'relator@teste.com', '123', first_name='Carla')
+        self.relator.groups.add(relatores)
+        self.livre = User.objects.create_user('livre', 'livre@teste.com', '123')
+        self.livre.groups.add(relatores)
+
+        self.pesq = Pesquisador.objects.create(nome="Ana", email="ana@teste.com")
+        agora = timezone.now()
+        self.projetos = []
+        for n, status in enumerate(['em_analise', 'pendente', 'aprovado', 'novo']):
+            self.projetos.append(Projeto.objects.create(
+                titulo=f"P{n}", descricao="", caae=f"E-{n}", pesquisador=self.pesq,
+                relator_designado=self.relator if status != 'novo' else None,
+                status=status, data_submissao=agora - timedelta(days=10 + n),
+            ))
+        aprovado = self.projetos[2]
+        Parecer.objects.create(
+            projeto=aprovado, relator=self.relator, decisao='aprovado', justificativa="ok",
+            data_parecer=aprovado.data_submissao + timedelta(days=4),
+        )
+
+    def stats(self, user):
+        return next(r for r in estatisticas_relatores() if r['id'] == user.id)
+
+    def test_agregados(self):
+        stats = self.stats(self.relator)
+        self.assertEqual(stats['total'], 3)
+        self.assertEqual((stats['em_analise'], stats['pendentes'], stats['aprovados'], stats['reprovados']), (1, 1, 1, 0))
+        self.assertEqual(stats['aberto_mais_antigo'], self.projetos[1].data_submissao)
+        self.assertEqual(stats['tempo_medio_parecer'], timedelta(days=4))
+
+        livre = self.stats(self.livre)
+        self.assertEqual(livre['total'], 0)
+        self.assertIsNone(livre['aberto_mais_antigo'])
+        self.assertIsNone(livre['tempo_medio_parecer'])
+
+    def test_usa_cache(self):
+        estatisticas_relatores()
+        with self.assertNumQueries(0):
+            estatisticas_relatores()
+
+    def test_designar_relator_invalida_cache(self):
+        self.assertEqual(self.stats(self.livre)['total'], 0)
+        self.client.force_login(self.gestor)
+        response = self.client.post(
+            reverse('designar_relator', args=[self.projetos[3].id]),
+            {'relator_designado': self.livre.id},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertIsNone(cache.get(CHAVE_CACHE_ESTATISTICAS_RELATORES))
+        self.assertEqual(self.stats(self.livre)['em_analise'], 1)
+
+
+class GruposDoUsuarioTest(TestCase):
+    def setUp(self):
+        gestores = Group.objects.create(name='Gestores')
+        relatores = Group.objects.create(name='Relatores')
+        self.usuario = User.objects.create_user('ambos', 'ambos@teste.com', '123')
+        self.usuario.groups.add(gestores, relatores)
+        pesq = Pesquisador.objects.create(nome="Ana", email="ana@teste.com")
+        self.projeto = Projeto.objects.create(titulo="P", descricao="", caae="G-1", pesquisador=pesq, status='em_analise')
+        self.emenda = Emenda.objects.create(projeto=self.projeto, titulo="E", descricao="")
+
+    def consultas_de_grupo(self, url):
+        self.client.force_login(self.usuario)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [q for q in ctx.captured_queries if 'auth_user_groups' in q['sql']]
+
+    def test_uma_consulta_de_grupos_por_requisicao(self):
+        # dar_parecer usa grupo_requerido + is_gestor; detalhe_emenda usa is_relator + is_gestor
+        self.assertEqual(len(self.consultas_de_grupo(reverse('dar_parecer', args=[self.projeto.id]))), 1)
+        self.assertEqual(len(self.consultas_de_grupo(reverse('detalhe_emenda', args=[self.emenda.id]))), 1)
+
+    def test_helpers(self):
+        with self.assertNumQueries(1):
+            self.assertTrue(is_gestor(self.usuario))
+            self.assertTrue(is_relator(self.usuario))
+            self.assertEqual(grupos_do_usuario(self.usuario), {'Gestores', 'Relatores'})
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ImportacaoPlanilhaTest(TestCase):
+    CSV = (
+        "CAAE,Nome Pesquisador,Titulo,Descricao,RELATOR,Reunião:01/09,Reunião:29/09\n"
+        "111.1,Larissa,Algoritmos,Estudo A,João Relator,PENDENCIA,\n"
+        "222.2,Ricardo,Terapias,Estudo B,Maria,,APROVADO\n"
+        "333.3,Fernando,Redes 5G,,joao,REPROVADO,\n"
+        "444.4,Beatriz,Energia,Estudo D,Desconhecido,,\n"
+    )
+
+    def setUp(self):
+        gestores = Group.objects.create(name='Gestores')
+        relatores = Group.objects.create(name='Relatores')
+        self.gestor = User.objects.create_user('gestor', 'gestor@teste.com', '123')
+        self.gestor.groups.add(gestores)
+        self.joao = User.objects.create_user('joao.silva', 'joao@teste.com', '123', first_name='João')
+        self.maria = User.objects.create_user('maria', 'maria@teste.com', '123', first_name='Maria')
+        self.joao.groups.add(relatores)
+        self.maria.groups.add(relatores)
+        self.client.force_login(self.gestor)
+
+    def test_extracao_por_coluna(self):
+        df = pd.read_csv(io.StringIO(self.CSV), dtype=str)
+        with self.assertNumQueries(1):
+            linhas = extrair_linhas(df)
+
+        ano = timezone.now().year
+        self.assertEqual([l['status_inicial'] for l in linhas], ['pendente', 'aprovado', 'reprovado', 'novo'])
+        self.assertEqual([l['relator_designado'] for l in linhas], [self.joao.id, self.maria.id, self.joao.id, None])
+        self.assertEqual(linhas[0]['data_parecer_manual'], date(ano, 9, 1))
+        self.assertEqual(linhas[1]['data_parecer_manual'], date(ano, 9, 29))
+        self.assertIsNone(linhas[3]['data_parecer_manual'])
+        self.assertEqual(linhas[2]['descricao'], '')
+
+    def test_relator_sem_decisao_fica_sem_data(self):
+        df = pd.read_csv(io.StringIO(
+            "CAAE,Nome Pesquisador,Titulo,RELATOR,Reunião:01/09\n"
+            "555.5,Paula,Clima,Maria,\n"
+            "666.6,Rui,Solo,Maria,APROVADO\n"
+        ), dtype=str)
+        linhas = extrair_linhas(df)
+
+        self.assertEqual(linhas[0]['status_inicial'], 'em_analise')
+        self.assertIsNone(linhas[0]['data_parecer_manual'])
+        self.assertEqual(linhas[1]['data_parecer_manual'], date(timezone.now().year, 9, 1))
+        # Vai para um JSONField: NaN seria recusado pelo jsonb do PostgreSQL
+        json.dumps([{k: str(v) if isinstance(v, date) else v for k, v in l.items()} for l in linhas], allow_nan=False)
+
+    def test_upload_e_confirmacao(self):
+        arquivo = SimpleUploadedFile("planilha.csv", self.CSV.encode('utf-8'), content_type="text/csv")
+        response = self.client.post(reverse('cadastrar_projeto'), {'arquivo_importacao': arquivo})
+        job = ImportacaoPlanilha.objects.get()
+        self.assertRedirects(response, reverse('acompanhar_importacao', args=[job.pk]))
+        self.assertEqual(job.status, 'na_fila')
+
+        # A leitura acontece no worker, fora da requisição
+        processar_proxima_importacao()
+        response = self.client.get(reverse('acompanhar_importacao', args=[job.pk]))
+        formset = response.context['formset']
+        self.assertEqual(len(formset.forms), 4)
+
+        dados = {'form-TOTAL_FORMS': '4', 'form-INITIAL_FORMS': '4'}
+        for i, inicial in enumerate(formset.initial):
+            for campo, valor in inicial.items():
+                dados[f'form-{i}-{campo}'] = '' if valor is None else str(valor)
+            dados[f'form-{i}-pesquisador_email'] = f'pesq{i}@teste.com'
+
+        response = self.client.post(reverse('acompanhar_importacao', args=[job.pk]), dados)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Projeto.objects.count(), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            processar_proxima_importacao()
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'concluida')
+
+        self.assertEqual(Projeto.objects.count(), 4)
+        reprovado = Projeto.objects.get(caae='333.3')
+        self.assertEqual(reprovado.status, 'reprovado')
+        self.assertEqual(reprovado.relator_designado, self.joao)
+        self.assertEqual(Parecer.objects.count(), 3)
+        self.assertEqual(Projeto.objects.get(caae='222.2').data_aprovacao, date(timezone.now().year, 9, 29))
+
+    def test_erros_voltam_para_revisao(self):
+        job = ImportacaoPlanilha.objects.create(usuario=self.gestor, nome_arquivo="planilha.csv", conteudo=self.CSV.encode('utf-8'))
+        processar_proxima_importacao()
+        job.refresh_from_db()
+
+        # Sem e-mail do pesquisador: o worker devolve o job com os erros por linha
+        dados = {'form-TOTAL_FORMS': '4', 'form-INITIAL_FORMS': '4'}
+        for i, linha in enumerate(job.linhas):
+            for campo, valor in linha.items():
+                dados[f'form-{i}-{campo}'] = '' if valor is None else str(valor)
+        self.client.post(reverse('acompanhar_importacao', args=[job.pk]), dados)
+        processar_proxima_importacao()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'revisao')
+        self.assertTrue(job.erros[0]['pesquisador_email'])
+        self.assertEqual(Projeto.objects.count(), 0)
+
+        response = self.client.get(reverse('acompanhar_importacao', args=[job.pk]))
+        self.assertTrue(response.context['formset'].forms[0].errors)
+
+    def test_progresso(self):
+        job = ImportacaoPlanilha.objects.create(usuario=self.gestor, nome_arquivo="planilha.csv", conteudo=self.CSV.encode('utf-8'))
+        response = self.client.get(reverse('progresso_importacao', args=[job.pk]))
+        self.assertEqual(response.json()['status'], 'na_fila')
+
+        processar_proxima_importacao()
+        dados = self.client.get(reverse('progresso_importacao', args=[job.pk])).json()
+        self.assertEqual(dados['status'], 'revisao')
+        self.assertEqual((dados['total'], dados['processadas']), (4, 4))
+        self.assertIsNone(processar_proxima_importacao())
+
+    def test_worker_le_a_planilha_do_registro(self):
+        # O worker roda em outro serviço: nada do upload pode depender do disco do web
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            arquivo = SimpleUploadedFile("planilha.csv", self.CSV.encode('utf-8'), content_type="text/csv")
+            self.client.post(reverse('cadastrar_projeto'), {'arquivo_importacao': arquivo})
+            self.assertEqual(os.listdir(media), [])
+
+        job = processar_proxima_importacao()
+        self.assertEqual((job.status, job.total_linhas), ('revisao', 4))
+        job.refresh_from_db()
+        self.assertEqual(job.nome_arquivo, "planilha.csv")
+        self.assertIsNone(job.conteudo)
+
+    def test_job_sem_planilha(self):
+        job = ImportacaoPlanilha.objects.create(usuario=self.gestor, nome_arquivo="planilha.csv")
+        processar_proxima_importacao()
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'erro')
+
+    def test_importacao_interrompida(self):
+        job = ImportacaoPlanilha.objects.create(usuario=self.gestor, nome_arquivo="planilha.csv", conteudo=self.CSV.encode('utf-8'))
+        ImportacaoPlanilha.objects.filter(pk=job.pk).update(status='importando', atualizado_em=timezone.now() - timedelta(hours=1))
+
+        self.assertIsNone(processar_proxima_importacao())
+        dados = self.client.get(reverse('progresso_importacao', args=[job.pk])).json()
+        self.assertEqual(dados['status'], 'erro')
+        self.assertIn('interrompida', dados['mensagem'])
+
+    def linhas(self, inicio, quantidade):
+        return [
+            {
+                'caae': f'CAAE-{n}',
+                'titulo': f'Projeto {n}',
+                'descricao': '',
+                'pesquisador_nome': f'Pesq {n}',
+                'pesquisador_email': f'pesq{n}@teste.com',
+                'status_inicial': 'aprovado',
+                'relator_designado': self.maria.id,
+                'data_parecer_manual': date(2025, 1, 1),
+            }
+            for n in range(inicio, inicio + quantidade)
+        ]
+
+    def test_gravacao_em_lote(self):
+        # Só os INSERTs em lote crescem (o SQLite limita variáveis por comando)
+        with CaptureQueriesContext(connection) as ctx:
+            importar_linhas(self.linhas(0, 300), self.gestor)
+
+        self.assertLess(len(ctx.captured_queries), 20)
+        self.assertEqual(Projeto.objects.count(), 300)
+        self.assertEqual(Parecer.objects.filter(decisao='aprovado').count(), 300)
+        self.assertEqual(Pesquisador.objects.count(), 300)
+
+
+class ServicoPBFalso:
+    def __init__(self, logged=True, linhas=3, falha=None):
+        self.logged = logged
+        self.linhas = linhas
+        self.falha = falha
+        self.last_sync = None
+
+    def fetch_projects_form_table(self, known=None, progress=None):
+        if self.falha:
+            raise self.falha
+        progress(0, self.linhas)
+        for feitos in range(1, self.linhas + 1):
+            progress(feitos, self.linhas)
+        self.last_sync = {'linhas': self.linhas, 'alterados': self.linhas, 'salvos': self.linhas, 'falhas': 0}
+        return self
+
+
+class PoolPBFalso:
+    def __init__(self, servico):
+        self.servico = servico
+        self.credenciais = []
+
+    @contextmanager
+    def session(self, email, senha):
+        self.credenciais.append((email, senha))
+        yield self.servico
+
+
+class SincronizacaoPlataformaBrasilTest(TestCase):
+    def setUp(self):
+        gestores = Group.objects.create(name='Gestores')
+        self.gestor = User.objects.create_user('gestor', 'gestor@teste.com', '123')
+        self.gestor.groups.add(gestores)
+        self.client.force_login(self.gestor)
+
+    def enfileirar(self, email='pesq@teste.com', senha='segredo'):
+        return self.client.post(reverse('receber_credenciais_pb'), json.dumps({'email': email, 'senha': senha}), content_type='application/json')
+
+    def test_endpoint_so_enfileira(self):
+        response = self.enfileirar()
+        self.assertEqual(response.status_code, 202)
+        job = SincronizacaoPlataformaBrasil.objects.get(pk=response.json()['job'])
+        self.assertEqual((job.conta, job.status), ('pesq@teste.com', 'na_fila'))
+        self.assertEqual(self.client.get(response.json()['url_status']).json()['status'], 'na_fila')
+
+    def test_uma_sincronizacao_ativa_por_conta(self):
+        primeiro = self.enfileirar().json()['job']
+        repetido = self.enfileirar()
+        self.assertEqual(repetido.status_code, 409)
+        self.assertEqual(repetido.json()['job'], primeiro)
+        # Outra conta não espera
+        self.assertEqual(self.enfileirar(email='outro@teste.com').status_code, 202)
+
+        processar_proxima_sincronizacao(PoolPBFalso(ServicoPBFalso()))
+        self.assertEqual(self.enfileirar().status_code, 202)
+
+    def test_worker_processa_e_informa_progresso(self):
+        job_id = self.enfileirar().json()['job']
+        navegadores = PoolPBFalso(ServicoPBFalso(linhas=4))
+
+        job = processar_proxima_sincronizacao(navegadores)
+        self.assertEqual(job.pk, job_id)
+        self.assertEqual(navegadores.credenciais, [('pesq@teste.com', 'segredo')])
+
+        dados = self.client.get(reverse('status_sincronizacao_pb', args=[job_id])).json()
+        self.assertEqual(dados['status'], 'concluida')
+        self.assertEqual((dados['total'], dados['processados']), (4, 4))
+        self.assertEqual(dados['resultado']['salvos'], 4)
+        # A senha só fica no banco enquanto o job está na fila
+        self.assertEqual(SincronizacaoPlataformaBrasil.objects.get(pk=job_id).senha, '')
+        self.assertIsNone(processar_proxima_sincronizacao(navegadores))
+
+    def test_erro_fica_registrado(self):
+        job, _ = enfileirar_sincronizacao('pesq@teste.com', 'errada')
+        processar_proxima_sincronizacao(PoolPBFalso(ServicoPBFalso(logged=False)))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'erro')
+        self.assertIn('Plataforma Brasil', job.mensagem)
+        self.assertEqual(job.senha, '')
+
+    def test_endpoints_restritos_ao_gestor_que_pediu(self):
+        url_status = self.enfileirar().json()['url_status']
+
+        outro = User.objects.create_user('outro', 'outro@teste.com', '123')
+        outro.groups.add(Group.objects.get(name='Gestores'))
+        self.client.force_login(outro)
+        self.assertEqual(self.client.get(url_status).status_code, 404)
+
+        relator = User.objects.create_user('relator', 'relator@teste.com', '123')
+        self.client.force_login(relator)
+        self.assertEqual(self.client.get(url_status).status_code, 403)
+        self.assertEqual(self.enfileirar(email='outra@teste.com').status_code, 403)
+
+        self.client.logout()
+        self.assertEqual(self.client.get(url_status).status_code, 302)
+        self.assertEqual(self.enfileirar(email='outra@teste.com').status_code, 302)
+
+    def test_job_esquecido_na_fila_apaga_a_senha(self):
+        job_id = self.enfileirar().json()['job']
+        SincronizacaoPlataformaBrasil.objects.filter(pk=job_id).update(criado_em=timezone.now() - timedelta(hours=1))
+
+        # Sem worker rodando: a consulta de status já cancela o job
+        dados = self.client.get(reverse('status_sincronizacao_pb', args=[job_id])).json()
+        self.assertEqual(dados['status'], 'erro')
+        self.assertEqual(SincronizacaoPlataformaBrasil.objects.get(pk=job_id).senha, '')
+        self.assertEqual(self.enfileirar().status_code, 202)
+
+    def test_sincronizacao_interrompida_libera_a_conta(self):
+        job, _ = enfileirar_sincronizacao('pesq@teste.com', 'segredo')
+        SincronizacaoPlataformaBrasil.objects.filter(pk=job.pk).update(
+            status='executando', atualizado_em=timezone.now() - timedelta(hours=1)
+        )
+        self.assertIsNone(processar_proxima_sincronizacao(PoolPBFalso(ServicoPBFalso())))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'erro')
+        self.assertTrue(enfileirar_sincronizacao('pesq@teste.com', 'segredo')[1])
+
+
+class ProtocolosPlataformaBrasilTest(TestCase):
+    def registro(self, n, versao='1', modificacao='10/03/2025', situacao='Em relatoria', email=None):
+        return {
+            'caae': f'CAAE-{n}', 'versao': versao, 'data_ultima_modificacao': modificacao,
+            'situacao': situacao, 'pesquisador': f'Pesq {n}', 'relator': 'Relator',
+            'email_pesquisador': email or f'pesq{n}@teste.com', 'telefone_pesquisador': '7999999',
+        }
+
+    def test_upsert_em_lote(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(gravar_protocolos([self.registro(n) for n in range(100)]), 100)
+        self.assertLess(len(ctx.captured_queries), 10)
+        self.assertEqual(Projeto.objects.filter(status='em_analise').count(), 100)
+        self.assertEqual(protocolos_conhecidos()['CAAE-7'], ('1', '10/03/2025'))
+
+    def test_protocolo_alterado_atualiza_sem_duplicar(self):
+        gravar_protocolos([self.registro(1)])
+        Projeto.objects.filter(caae='CAAE-1').update(titulo='Título editado')
+
+        gravar_protocolos([self.registro(1, versao='2', modificacao='20/04/2025 10:00', situacao='Relatoria Aprovada', email='novo@teste.com')])
+
+        # Só o pesquisador responsável acompanha a Plataforma Brasil; status e título seguem o fluxo local
+        projeto = Projeto.objects.get(caae='CAAE-1')
+        self.assertEqual((projeto.titulo, projeto.status, projeto.data_aprovacao), ('Título editado', 'em_analise', None))
+        self.assertEqual(projeto.pesquisador.email, 'novo@teste.com')
+        protocolo = ProtocoloPlataformaBrasil.objects.get(caae='CAAE-1')
+        self.assertEqual((protocolo.versao, protocolo.situacao, protocolo.projeto_id), ('2', 'Relatoria Aprovada', projeto.pk))
+        self.assertEqual(Projeto.objects.count(), 1)
+
+    def test_status_inicial_pela_situacao(self):
+        gravar_protocolos([
+            self.registro(1, situacao='Relatoria Aprovada', modificacao='20/04/2025'),
+            self.registro(2, situacao='Relatoria Recusada'),
+            self.registro(3, situacao='Aguardando'),
+        ])
+        status = dict(Projeto.objects.values_list('caae', 'status'))
+        self.assertEqual(status, {'CAAE-1': 'aprovado', 'CAAE-2': 'pendente', 'CAAE-3': 'novo'})
+        self.assertEqual(Projeto.objects.get(caae='CAAE-1').data_aprovacao, date(2025, 4, 20))
+
+    def test_telefone_vazio_nao_apaga_o_cadastrado(self):
+        gravar_protocolos([self.registro(1)])
+        gravar_protocolos([{**self.registro(1, versao='2'), 'pesquisador': 'Pesq Renomeado', 'telefone_pesquisador': ''}])
+        pesquisador = Pesquisador.objects.get()
+        self.assertEqual((pesquisador.nome, pesquisador.telefone), ('Pesq Renomeado', '7999999'))
+
+    @override_settings(CACHES=CACHE_LOCAL)
+    def test_invalida_estatisticas_relatores(self):
+        cache.set(CHAVE_CACHE_ESTATISTICAS_RELATORES, [])
+        gravar_protocolos([self.registro(1)])
+        self.assertIsNone(cache.get(CHAVE_CACHE_ESTATISTICAS_RELATORES))
+
+    def test_sem_email_fica_para_a_proxima(self):
+        registro = {**self.registro(1), 'email_pesquisador': ''}
+        self.assertEqual(gravar_protocolos([registro]), 0)
+        self.assertNotIn('CAAE-1', protocolos_conhecidos())
+
+
+class ExportacaoTest(TestCase):
+    def setUp(self):
+        gestores = Group.objects.create(name='Gestores')
+        relatores = Group.objects.create(name='Relatores')
+        self.gestor = User.objects.create_user('gestor', 'gestor@teste.com', '123')
+        self.gestor.groups.add(gestores)
+        self.relator = User.objects.create_user('relator', 'relator@teste.com', '123', first_name='Ana')
+        self.sem_projetos = User.objects.create_user('vazio', 'vazio@teste.com', '123')
+        self.relator.groups.add(relatores)
+        self.sem_projetos.groups.add(relatores)
+        self.client.force_login(self.gestor)
+
+        pesq = Pesquisador.objects.create(nome="Pesq", email="pesq@teste.com")
+        for n, dia in enumerate([5, 15, 25]):
+            projeto = Projeto.objects.create(
+                titulo=f"Projeto {n}", descricao="", caae=f"CAAE-{n}", pesquisador=pesq,
+                relator_designado=self.relator, status='aprovado',
+                data_submissao=timezone.make_aware(timezone.datetime(2025, 3, dia, 12)),
+            )
+            Parecer.objects.create(projeto=projeto, relator=self.relator, decisao='aprovado', justificativa="Ok")
+
+    def baixar(self, tipo, **params):
+        response = self.client.get(reverse('exportar', args=[tipo]), params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def csv(self, response):
+        return list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+
+    def test_relatores_em_streaming(self):
+        response = self.client.get(reverse('exportar_relatores'))
+        self.assertTrue(response.streaming)
+        linhas = self.csv(response)
+        self.assertEqual(linhas[0], ['Nome do Relator', 'E-mail', 'Projeto', 'CAAE', 'Status', 'Data Submissão'])
+        self.assertEqual(linhas[1], ['Ana', 'relator@teste.com', 'Projeto 0', 'CAAE-0', 'Aprovado', '05/03/2025'])
+        self.assertEqual(linhas[-1], ['vazio', 'vazio@teste.com', 'Nenhum projeto designado', '-', '-', '-'])
+
+    def test_colunas_e_periodo(self):
+        response = self.baixar('projetos', colunas=['caae', 'relator'], de='2025-03-10', ate='2025-03-20')
+        self.assertEqual(self.csv(response), [['CAAE', 'Relator'], ['CAAE-1', 'Ana']])
+
+        response = self.client.get(reverse('exportar', args=['projetos']), {'de': '2025-04-01', 'ate': '2025-03-01'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_relatores_no_periodo(self):
+        Projeto.objects.create(
+            titulo="Fora", descricao="", caae="CAAE-fora", pesquisador=Pesquisador.objects.get(), relator_designado=self.relator,
+            data_submissao=timezone.make_aware(timezone.datetime(2025, 5, 1, 12)),
+        )
+        linhas = self.csv(self.baixar('relatores', colunas=['relator', 'caae'], de='2025-03-01', ate='2025-03-31'))
+        self.assertEqual(linhas, [
+            ['Nome do Relator', 'CAAE'],
+            ['Ana', 'CAAE-0'], ['Ana', 'CAAE-1'], ['Ana', 'CAAE-2'],
+            ['vazio', '-'],
+        ])
+        linhas = self.csv(self.baixar('relatores', colunas=['relator', 'caae'], de='2025-03-10', ate='2025-03-20'))
+        self.assertEqual(linhas[1:], [['Ana', 'CAAE-1'], ['vazio', '-']])
+
+    def test_consulta_unica(self):
+        response = self.baixar('pareceres')
+        with self.assertNumQueries(1):
+            linhas = self.csv(response)
+        self.assertEqual(len(linhas), 4)
+
+    def test_xlsx(self):
+        Emenda.objects.create(projeto=Projeto.objects.first(), titulo="Emenda", descricao="")
+        response = self.baixar('emendas', formato='xlsx', colunas=['caae', 'titulo', 'data_submissao'])
+        planilha = load_workbook(io.BytesIO(b''.join(response.streaming_content))).active
+        linhas = list(planilha.values)
+        self.assertEqual(linhas[0], ('CAAE', 'Emenda', 'Data Submissão'))
+        self.assertEqual(linhas[1][:2], ('CAAE-0', 'Emenda'))
+        self.assertEqual(linhas[1][2].date(), timezone.localdate())
 
-# Create your tests here.
@@ -13,9 +13,12 @@ urlpatterns = [
 
     # --- Dashboard Principal ---
     path('', views.dashboard, name='dashboard'),
+    path('painel/secao/<str:secao>/', views.dashboard_secao, name='dashboard_secao'),
 
     # --- Cadastros ---
     path('cadastrar/', views.cadastrar_projeto, name='cadastrar_projeto'),
+    path('importacao/<int:pk>/', views.acompanhar_importacao, name='acompanhar_importacao'),
+    path('importacao/<int:pk>/progresso/', views.progresso_importacao, name='progresso_importacao'),
     path('cadastrar-relator/', views.cadastrar_relator, name='cadastrar_relator'),
     path('projeto/<int:projeto_id>/nova-emenda/', views.cadastrar_emenda, name='cadastrar_emenda'),
     
@@ -26,9 +29,11 @@ urlpatterns = [
 
     # --- API ---
     path('api/pb-login/', views.receber_credenciais_pb, name='receber_credenciais_pb'),
+    path('api/pb-sync/<int:pk>/', views.status_sincronizacao_pb, name='status_sincronizacao_pb'),
 
     # --- EXPORTAÇÃO  ---
     path('exportar-relatores/', views.exportar_relatores, name='exportar_relatores'),
+    path('exportar/<str:tipo>/', views.exportar, name='exportar'),
     
      # --- RECUPERAÇÃO DE SENHA ---
     path('reset_password/', 
@@ -1,47 +1,63 @@
 import csv
 import io
 import json
-from datetime import datetime # Importação necessária para converter strings em data
-from django.forms import formset_factory
+from django.forms.utils import ErrorDict, ErrorList
 from django.contrib.auth.decorators import login_required
-from django.contrib.auth.models import User
-from django.http import HttpResponseForbidden, JsonResponse, HttpResponse
+from django.http import HttpResponseForbidden, JsonResponse, HttpResponseBadRequest, Http404, StreamingHttpResponse, FileResponse
 from django.shortcuts import render, get_object_or_404, redirect
+from django.urls import reverse
+from django.template.loader import render_to_string
 from django.utils import timezone
-from django.views.decorators.csrf import csrf_exempt
-from django.core.mail import send_mail
-from django.conf import settings
-import pandas as pd
-from django.db.models import Q 
 
 from functools import wraps
-from itertools import chain
-from operator import attrgetter
-from webdriver.plataforma_brasil import PlataformaBrasilService
 from .forms import (
     CadastroRelatorForm,
     DesignarRelatorForm, 
     ParecerForm, ParecerEmendaForm,
     ProjetoForm, EmendaForm,
+    ImportacaoFormSet, ExportacaoForm,
 )
-from .models import Projeto, Pesquisador, Emenda, Parecer
+from .models import Projeto, Pesquisador, Emenda, Parecer, ImportacaoPlanilha, SincronizacaoPlataformaBrasil
+from .consultas import (
+    SECOES_DASHBOARD,
+    linha_do_tempo, pagina_secao, contar_secao, contagens_secoes,
+    decodificar_cursor,
+    estatisticas_relatores, invalidar_estatisticas_relatores,
+)
+from .exportacao import EXPORTACOES, linhas_exportacao, gerar_csv, gerar_xlsx
+from .notificacoes import enviar_email_pendencia
+from .sincronizacao import enfileirar_sincronizacao, liberar_interrompidas
 
 
 # --- DECORATORS E AUXILIARES ---
+def grupos_do_usuario(user):
+    """
+    Nomes dos grupos do usuário, resolvidos com uma única consulta e guardados
+    no próprio objeto. Como request.user é o mesmo objeto durante toda a
+    requisição, os helpers de permissão abaixo compartilham esse resultado.
+    """
+    if not user.is_authenticated:
+        return frozenset()
+    grupos = getattr(user, '_grupos_cache', None)
+    if grupos is None:
+        grupos = frozenset(user.groups.values_list('name', flat=True))
+        user._grupos_cache = grupos
+    return grupos
+
 def grupo_requerido(grupos):
     if isinstance(grupos, str): grupos = [grupos]
     def decorator(view_func):
         @wraps(view_func)
         def _wrapped_view(request, *args, **kwargs):
             if not request.user.is_authenticated: return redirect('login')
-            if request.user.is_superuser or request.user.groups.filter(name__in=grupos).exists():
+            if request.user.is_superuser or grupos_do_usuario(request.user).intersection(grupos):
                 return view_func(request, *args, **kwargs)
             return HttpResponseForbidden("Você não tem permissão para acessar esta página.")
         return _wrapped_view
     return decorator
 
-def is_grupo(user, nome_grupo): return user.groups.filter(name=nome_grupo).exists()
-def is_gestor(user): return is_grupo(user, 'Gestores') or user.is_superuser
+def is_grupo(user, nome_grupo): return nome_grupo in grupos_do_usuario(user)
+def is_gestor(user): return user.is_superuser or is_grupo(user, 'Gestores')
 def is_relator(user): return is_grupo(user, 'Relatores')
 
 def processar_csv(csv_file):
@@ -70,69 +86,39 @@ def processar_csv(csv_file):
         print(f"Erro no CSV: {e}")
         return 0
 
-def enviar_email_pendencia(projeto, motivo="Pendências identificadas pelo relator."):
-    if projeto.pesquisador.email:
-        assunto = f"Pendência no Projeto: {projeto.titulo}"
-        mensagem = f"""
-        Prezado(a) {projeto.pesquisador.nome},
-        O seu projeto "{projeto.titulo}" (CAAE: {projeto.caae}) consta com PENDÊNCIAS.
-        Observação: {motivo}
-        Por favor, acesse a plataforma para regularizar.
-        """
-        try:
-            send_mail(assunto, mensagem, settings.DEFAULT_FROM_EMAIL, [projeto.pesquisador.email], fail_silently=True)
-            print(f"📧 E-mail enviado para {projeto.pesquisador.email}")
-        except Exception as e:
-            print(f"❌ Erro ao enviar e-mail: {e}")
-
 @login_required
 def dashboard(request):
     if is_gestor(request.user):
-        itens_novos = list(Projeto.objects.filter(status='novo'))
-        for i in itens_novos: i.tipo_item = 'P'
-
-        projetos_analise = list(Projeto.objects.filter(status='em_analise'))
-        for p in projetos_analise: p.tipo_item = 'P'
-        emendas_analise = list(Emenda.objects.filter(status='pendente'))
-        for e in emendas_analise: e.tipo_item = 'E'
-        itens_em_analise = sorted(chain(projetos_analise, emendas_analise), key=attrgetter('data_submissao'), reverse=True)
-        
-        itens_pendentes = list(Projeto.objects.filter(status='pendente'))
-        for p in itens_pendentes: p.tipo_item = 'P'
+        # Só a primeira página de cada seção vai no HTML; o restante e a busca
+        # são servidos por dashboard_secao, filtrando e paginando no banco.
+        secoes = {secao: pagina_secao(secao) for secao in SECOES_DASHBOARD}
+        contagens = contagens_secoes()
 
-        projetos_concluidos = list(Projeto.objects.filter(status__in=['aprovado', 'reprovado']))
-        for p in projetos_concluidos: p.tipo_item = 'P'
-        emendas_concluidas = list(Emenda.objects.filter(status__in=['aprovada', 'reprovada']))
-        for e in emendas_concluidas: e.tipo_item = 'E'
-        itens_concluidos = sorted(chain(projetos_concluidos, emendas_concluidas), key=attrgetter('data_submissao'), reverse=True)
-
-        relatores_stats = User.objects.filter(groups__name='Relatores').prefetch_related('projetos_designados')
+        relatores_stats = estatisticas_relatores()
         
         contexto = {
-            'itens_novos': itens_novos,
-            'itens_em_analise': itens_em_analise,
-            'itens_pendentes': itens_pendentes,
-            'itens_concluidos': itens_concluidos,
+            'itens_novos': secoes['aguardando'][0],
+            'itens_em_analise': secoes['analise'][0],
+            'itens_pendentes': secoes['pendente'][0],
+            'itens_concluidos': secoes['concluido'][0],
+            'proximos': {secao: pagina[1] for secao, pagina in secoes.items()},
+            'contagens': contagens,
             'relatores_stats': relatores_stats,
+            'exportacoes': EXPORTACOES,
         }
         return render(request, 'core/dashboard_gestor.html', contexto)
 
     elif is_relator(request.user):
-        meus_projetos = list(Projeto.objects.filter(
-            relator_designado=request.user, 
-            status__in=['em_analise', 'pendente']
-        ))
-        for p in meus_projetos: p.tipo_item = 'P'
-
-        minhas_emendas = list(Emenda.objects.filter(projeto__relator_designado=request.user, status='pendente'))
-        for e in minhas_emendas: e.tipo_item = 'E'
-        itens_para_analisar = sorted(chain(meus_projetos, minhas_emendas), key=attrgetter('data_submissao'), reverse=True)
-        
-        hist_p = list(Projeto.objects.filter(relator_designado=request.user).exclude(status__in=['novo', 'em_analise', 'pendente']))
-        for p in hist_p: p.tipo_item = 'P'
-        hist_e = list(Emenda.objects.filter(projeto__relator_designado=request.user).exclude(status='pendente'))
-        for e in hist_e: e.tipo_item = 'E'
-        itens_concluidos = sorted(chain(hist_p, hist_e), key=attrgetter('data_submissao'), reverse=True)
+        itens_para_analisar, _ = linha_do_tempo(
+            Projeto.objects.filter(relator_designado=request.user, status__in=['em_analise', 'pendente']),
+            Emenda.objects.filter(projeto__relator_designado=request.user, status='pendente'),
+            limite=None,
+        )
+        itens_concluidos, _ = linha_do_tempo(
+            Projeto.objects.filter(relator_designado=request.user).exclude(status__in=['novo', 'em_analise', 'pendente']),
+            Emenda.objects.filter(projeto__relator_designado=request.user).exclude(status='pendente'),
+            limite=None,  # o painel do relator não tem "carregar mais": mostra o histórico inteiro
+        )
         
         contexto = {'projetos_para_analisar': itens_para_analisar, 'meus_projetos_concluidos': itens_concluidos}
         return render(request, 'core/dashboard_relator.html', contexto)
@@ -140,166 +126,46 @@ def dashboard(request):
         return render(request, 'core/dashboard_generico.html', {'mensagem_erro': 'Usuário sem grupo definido.'})
 
 
+@login_required
+@grupo_requerido('Gestores')
+def dashboard_secao(request, secao):
+    if secao not in SECOES_DASHBOARD:
+        raise Http404("Seção inexistente.")
+    try:
+        cursor = decodificar_cursor(request.GET.get('apos'))
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'msg': str(e)}, status=400)
+
+    termo = request.GET.get('q', '').strip()
+    campo = request.GET.get('campo', 'all')
+    itens, proximo = pagina_secao(secao, termo, campo, cursor)
+
+    html = render_to_string('core/includes/linhas_projetos.html', {
+        'lista_itens': itens,
+        'tipo': secao,
+        'msg_vazia': "Nenhum item encontrado.",
+    }, request=request)
+    resposta = {'status': 'ok', 'html': html, 'proximo': proximo}
+    if cursor is None:
+        resposta['total'] = contar_secao(secao, termo, campo)
+    return JsonResponse(resposta)
+
+
 @login_required
 def cadastrar_projeto(request):
     if not is_gestor(request.user):
         return HttpResponseForbidden("Apenas gestores podem cadastrar projetos.")
 
-    ProjetoFormSet = formset_factory(ProjetoForm, extra=0)
     form = ProjetoForm()
-    formset = None
     mensagem = None
     aba_ativa = 'manual'
 
     if request.method == 'POST':
         if 'arquivo_importacao' in request.FILES:
+            # Leitura, validação e gravação rodam no worker (processar_importacoes)
             arquivo = request.FILES['arquivo_importacao']
-            try:
-                if arquivo.name.endswith('.csv'):
-                    df = pd.read_csv(arquivo)
-                else:
-                    try: df = pd.read_excel(arquivo, engine='openpyxl')
-                    except: 
-                        try: df = pd.read_excel(arquivo, engine='xlrd')
-                        except: df = pd.read_excel(arquivo)
-
-                df.columns = df.columns.str.strip()
-                dados_iniciais = []
-                
-                for index, row in df.iterrows():
-                    caae = str(row.get('CAAE', '')).strip()
-                    if caae == 'nan': caae = ''
-                    titulo = str(row.get('Titulo') or row.get('Título do Projeto') or f'Projeto Importado {caae}').strip()
-                    nome_pesq = str(row.get('Nome Pesquisador') or row.get('Pesquisador') or '').strip()
-                    if nome_pesq == 'nan': nome_pesq = ''
-                    email_pesq = str(row.get('Email') or '').strip()
-                    if email_pesq == 'nan': email_pesq = ''
-                    
-                    relator_texto = str(row.get('RELATOR') or row.get('Relator') or '').strip()
-                    if relator_texto == 'nan': relator_texto = ''
-                    
-                    relator_id = None
-                    if relator_texto:
-                        primeiro_nome = relator_texto.split()[0]
-                        user_relator = User.objects.filter(
-                            Q(first_name__icontains=primeiro_nome) | 
-                            Q(username__icontains=primeiro_nome),
-                            groups__name='Relatores'
-                        ).first()
-                        if user_relator:
-                            relator_id = user_relator.id
-
-                    descricao = str(row.get('Descricao') or row.get('Descrição') or 'Importado via planilha.').strip()
-                    if descricao == 'nan': descricao = ''
-
-                    status_detectado = 'novo'
-                    data_parecer_detectada = None
-                    cols_reuniao = [c for c in df.columns if 'Reunião' in str(c)]
-                    
-                    for col in cols_reuniao:
-                        val = str(row.get(col, '')).strip().upper()
-                        
-                        # ---LÓGICA DE EXTRAÇÃO DE DATA ---
-                        # Tenta extrair a data do cabeçalho da coluna (ex: "Reunião:01/09")
-                        # Se não conseguir, usa data de hoje 
-                        data_extraida = timezone.now().date()
-                        try:
-                            # Divide por ':' ou espaço para pegar "01/09"
-                            if ':' in col:
-                                str_data = col.split(':')[-1].strip()
-                            else:
-                                str_data = col.split()[-1].strip()
-                            
-                            # Tenta converter dd/mm para data com ano atual
-                            dia, mes = str_data.split('/')
-                            ano_atual = timezone.now().year
-                            data_extraida = datetime(ano_atual, int(mes), int(dia)).date()
-                        except:
-                            # Se der erro no parse (ex: formato diferente), mantém a data de hoje
-                            pass
-
-                        if 'PENDENCIA' in val or 'PENDÊNCIA' in val:
-                            status_detectado = 'pendente'
-                            data_parecer_detectada = data_extraida
-                        elif 'APROVADO' in val:
-                            status_detectado = 'aprovado'
-                            data_parecer_detectada = data_extraida
-                        elif 'REPROVADO' in val:
-                            status_detectado = 'reprovado'
-                            data_parecer_detectada = data_extraida
-
-                    if relator_id and status_detectado == 'novo':
-                        status_detectado = 'em_analise'
-
-                    dados_iniciais.append({
-                        'caae': caae,
-                        'titulo': titulo,
-                        'descricao': descricao,
-                        'pesquisador_nome': nome_pesq,
-                        'pesquisador_email': email_pesq,
-                        'status_inicial': status_detectado,
-                        'relator_nome_texto': relator_texto,
-                        'relator_designado': relator_id,
-                        'data_parecer_manual': data_parecer_detectada if status_detectado != 'novo' else None,
-                    })
-                
-                formset = ProjetoFormSet(initial=dados_iniciais)
-                aba_ativa = 'csv'
-                mensagem = "Planilha lida! Por favor, PREENCHA OS E-MAILS FALTANTES e verifique os Relatores na tabela abaixo."
-
-            except Exception as e:
-                mensagem = f"Erro crítico ao ler arquivo: {str(e)}. Verifique se é um Excel válido."
-                aba_ativa = 'csv'
-
-        elif 'form-TOTAL_FORMS' in request.POST:
-            formset = ProjetoFormSet(request.POST)
-            aba_ativa = 'csv'
-            if formset.is_valid():
-                salvos = 0
-                for f in formset:
-                    if f.cleaned_data.get('caae'):
-                        projeto = f.save(commit=False)
-                        status = f.cleaned_data.get('status_inicial')
-                        projeto.status = status
-                        
-                        if status == 'aprovado':
-                            projeto.data_aprovacao = f.cleaned_data.get('data_parecer_manual') or timezone.now().date()
-                        
-                        projeto.save() 
-                        
-                        data_hist = f.cleaned_data.get('data_parecer_manual')
-                        
-                        if status == 'pendente':
-                             enviar_email_pendencia(projeto, "Pendência identificada na importação inicial.")
-                             if data_hist:
-                                Parecer.objects.create(
-                                    projeto=projeto,
-                                    relator=projeto.relator_designado if projeto.relator_designado else request.user,
-                                    decisao='pendente',
-                                    justificativa="Importação de histórico: Pendência.",
-                                    data_parecer=data_hist
-                                )
-                        elif status == 'aprovado' and data_hist:
-                             Parecer.objects.create(
-                                projeto=projeto,
-                                relator=projeto.relator_designado if projeto.relator_designado else request.user,
-                                decisao='aprovado',
-                                justificativa="Importação de histórico: Aprovado.",
-                                data_parecer=data_hist
-                             )
-                        elif status == 'reprovado' and data_hist:
-                             Parecer.objects.create(
-                                projeto=projeto,
-                                relator=projeto.relator_designado if projeto.relator_designado else request.user,
-                                decisao='reprovado',
-                                justificativa="Importação de histórico: Reprovado.",
-                                data_parecer=data_hist
-                             )
-
-                        salvos += 1
-                return redirect('dashboard')
-            else:
-                mensagem = "Existem erros no formulário. Verifique os campos em vermelho."
+            job = ImportacaoPlanilha.objects.create(usuario=request.user, nome_arquivo=arquivo.name, conteudo=arquivo.read())
+            return redirect('acompanhar_importacao', pk=job.pk)
 
         else:
             form = ProjetoForm(request.POST, request.FILES)
@@ -311,12 +177,12 @@ def cadastrar_projeto(request):
                 if projeto.relator_designado and status == 'novo':
                     projeto.status = 'em_analise'
                 
-                if status == 'pendente':
-                    enviar_email_pendencia(projeto, "Pendência cadastrada manualmente.")
                 if status == 'aprovado' and not projeto.data_aprovacao:
                      projeto.data_aprovacao = timezone.now().date()
                 
                 projeto.save()
+                if status == 'pendente':
+                    enviar_email_pendencia(projeto, "Pendência cadastrada manualmente.")
                 
                 data_hist = form.cleaned_data.get('data_parecer_manual')
                 if data_hist:
@@ -328,13 +194,51 @@ def cadastrar_projeto(request):
                         data_parecer=data_hist
                     )
                 
+                invalidar_estatisticas_relatores()
                 return redirect('dashboard')
 
     return render(request, 'core/cadastrar_projeto.html', {
         'form': form, 
-        'formset': formset, 
         'mensagem': mensagem, 
-        'aba_ativa': aba_ativa
+        'aba_ativa': aba_ativa,
+        'importacoes_recentes': ImportacaoPlanilha.objects.order_by('-criado_em')[:5],
+    })
+
+def formset_revisao(job):
+    """
+    Formset de revisão montado a partir das linhas guardadas no job. Os erros
+    vêm da validação feita no worker, então nada é revalidado aqui.
+    """
+    formset = ImportacaoFormSet(initial=job.linhas)
+    for form, erros in zip(formset.forms, job.erros):
+        if erros:
+            form._errors = ErrorDict({campo: ErrorList(msgs) for campo, msgs in erros.items()})
+    return formset
+
+@login_required
+@grupo_requerido('Gestores')
+def acompanhar_importacao(request, pk):
+    job = get_object_or_404(ImportacaoPlanilha, pk=pk)
+    if request.method == 'POST' and job.status == 'revisao':
+        job.dados_revisao = {k: v for k, v in request.POST.items() if k.startswith('form-')}
+        job.status = 'confirmada'
+        job.mensagem = "Importação confirmada. Validando e gravando os projetos..."
+        job.save(update_fields=['dados_revisao', 'status', 'mensagem', 'atualizado_em'])
+        return redirect('acompanhar_importacao', pk=job.pk)
+
+    formset = formset_revisao(job) if job.status == 'revisao' else None
+    return render(request, 'core/importacao_planilha.html', {'job': job, 'formset': formset})
+
+@login_required
+@grupo_requerido('Gestores')
+def progresso_importacao(request, pk):
+    job = get_object_or_404(ImportacaoPlanilha, pk=pk)
+    return JsonResponse({
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'total': job.total_linhas,
+        'processadas': job.linhas_processadas,
+        'mensagem': job.mensagem,
     })
 
 @login_required
@@ -344,6 +248,7 @@ def cadastrar_relator(request):
         form = CadastroRelatorForm(request.POST)
         if form.is_valid():
             form.save()
+            invalidar_estatisticas_relatores()
             return redirect('dashboard')
     else: form = CadastroRelatorForm()
     return render(request, 'core/cadastrar_relator.html', {'form': form})
@@ -358,6 +263,7 @@ def designar_relator(request, pk):
             projeto = form.save(commit=False)
             projeto.status = 'em_analise'
             projeto.save()
+            invalidar_estatisticas_relatores()
             return redirect('dashboard')
     else: form = DesignarRelatorForm(instance=projeto)
     return render(request, 'core/designar_relator.html', {'form': form, 'projeto': projeto})
@@ -390,6 +296,7 @@ def dar_parecer(request, pk):
                 projeto.data_aprovacao = timezone.now().date()
             
             projeto.save()
+            invalidar_estatisticas_relatores()
             return redirect('dashboard')
     else: form = ParecerForm()
     return render(request, 'core/dar_parecer.html', {'form': form, 'projeto': projeto})
@@ -420,34 +327,69 @@ def detalhe_projeto(request, pk):
         'is_gestor': is_gestor_user
     })
 
-@csrf_exempt
+@login_required
+@grupo_requerido('Gestores')
 def receber_credenciais_pb(request):
+    # A sincronização roda no worker (sincronizar_plataforma_brasil); aqui só entra na fila
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
             email = data.get('email')
             senha = data.get('senha')
-            pb_service = PlataformaBrasilService(user_email=email, user_password=senha, headless=True)
-            pb_service.login()
-            if pb_service.logged: pb_service.fetch_projects_form_table()
-            return JsonResponse({'status': 'ok', 'msg': 'Credenciais recebidas com sucesso!'})
+            if not email or not senha:
+                return JsonResponse({'status': 'error', 'msg': 'Informe e-mail e senha.'}, status=400)
+            job, criado = enfileirar_sincronizacao(email, senha, solicitante=request.user)
+            resposta = {'job': job.pk, 'url_status': reverse('status_sincronizacao_pb', args=[job.pk])}
+            if not criado:
+                return JsonResponse({'status': 'em_andamento', 'msg': 'Já existe uma sincronização em andamento para esta conta.', **resposta}, status=409)
+            return JsonResponse({'status': 'ok', 'msg': 'Sincronização agendada.', **resposta}, status=202)
         except Exception as e: return JsonResponse({'status': 'error', 'msg': str(e)}, status=400)
-    return JsonResponse({'status': 'error', 'msg': str(e)}, status=400)
+    return JsonResponse({'status': 'error', 'msg': 'Método não permitido.'}, status=405)
+
+@login_required
+@grupo_requerido('Gestores')
+def status_sincronizacao_pb(request, pk):
+    liberar_interrompidas()
+    # Cada gestor só acompanha as sincronizações que ele mesmo pediu
+    job = get_object_or_404(SincronizacaoPlataformaBrasil, pk=pk, solicitante=request.user)
+    return JsonResponse({
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'total': job.total,
+        'processados': job.processados,
+        'mensagem': job.mensagem,
+        'resultado': job.resultado,
+    })
 
 @login_required
 def exportar_relatores(request):
-    if not is_gestor(request.user): return HttpResponseForbidden("Apenas gestores.")
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="relatores_projetos.csv"'
-    writer = csv.writer(response)
-    writer.writerow(['Nome do Relator', 'E-mail', 'Projeto', 'CAAE', 'Status', 'Data Submissão'])
-    relatores = User.objects.filter(groups__name='Relatores').prefetch_related('projetos_designados')
-    for relator in relatores:
-        projetos = relator.projetos_designados.all()
-        if projetos:
-            for projeto in projetos:
-                writer.writerow([relator.first_name or relator.username, relator.email, projeto.titulo, projeto.caae, projeto.get_status_display(), projeto.data_submissao.strftime("%d/%m/%Y")])
-        else: writer.writerow([relator.first_name or relator.username, relator.email, "Nenhum projeto designado", "-", "-", "-"])
+    return exportar(request, 'relatores')
+
+@login_required
+@grupo_requerido('Gestores')
+def exportar(request, tipo):
+    """
+    Exporta relatores, projetos, emendas ou pareceres em CSV ou XLSX.
+    Parâmetros GET: formato (csv|xlsx), colunas (repetível) e o período de/ate.
+    O CSV sai em streaming e o XLSX é escrito em modo write-only, então a
+    memória não cresce com o tamanho do histórico.
+    """
+    if tipo not in EXPORTACOES:
+        raise Http404("Exportação desconhecida.")
+    definicao = EXPORTACOES[tipo]
+
+    form = ExportacaoForm(request.GET, colunas=[(chave, c.titulo) for chave, c in definicao['colunas'].items()])
+    if not form.is_valid():
+        return HttpResponseBadRequest(" ".join(e for erros in form.errors.values() for e in erros))
+
+    cabecalho, linhas = linhas_exportacao(
+        tipo, form.cleaned_data['colunas'], form.cleaned_data['de'], form.cleaned_data['ate']
+    )
+    if form.cleaned_data['formato'] == 'xlsx':
+        return FileResponse(gerar_xlsx(cabecalho, linhas), as_attachment=True, filename=f"{definicao['arquivo']}.xlsx")
+
+    response = StreamingHttpResponse(gerar_csv(cabecalho, linhas), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{definicao["arquivo"]}.csv"'
     return response
 
 @login_required
@@ -491,6 +433,7 @@ def editar_projeto(request, pk):
                 if novo_status == 'pendente':
                     enviar_email_pendencia(projeto, "Status alterado para PENDENTE via edição.")
             projeto.save()
+            invalidar_estatisticas_relatores()
             return redirect('detalhe_projeto', pk=projeto.id)
     else:
         initial = {
@@ -1,5 +1,11 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete
 
 class EmailsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'emails'
+
+    def ready(self):
+        from emails.armazenamentoAnexos import anexo_apagado
+        from emails.models import AnexoEmail
+        post_delete.connect(anexo_apagado, sender=AnexoEmail, dispatch_uid='emails_anexo_apagado')
@@ -0,0 +1,76 @@
+import hashlib
+
+from django.core.files import File
+from django.db import transaction
+from django.db.models import F
+
+from emails.models import AnexoEmail, ConteudoAnexo
+
+# Tamanho dos blocos lidos ao calcular o hash (o arquivo nunca é lido inteiro para a memória)
+TAMANHO_BLOCO_HASH = 1024 * 1024
+
+
+def resumo_arquivo(arquivo):
+    """SHA-256 e tamanho de um arquivo binário posicionado no início; devolve-o ao início."""
+    sha256 = hashlib.sha256()
+    tamanho = 0
+    for bloco in iter(lambda: arquivo.read(TAMANHO_BLOCO_HASH), b''):
+        sha256.update(bloco)
+        tamanho += len(bloco)
+    arquivo.seek(0)
+    return sha256.hexdigest(), tamanho
+
+
+def guardar_conteudo(arquivo):
+    """
+    Devolve o ConteudoAnexo dos bytes de `arquivo` (binário, com seek),
+    gravando-os no storage só se ainda não existirem. A gravação é feita em
+    blocos pelo próprio storage (File.chunks), sem carregar o arquivo inteiro.
+    """
+    hash_conteudo, tamanho = resumo_arquivo(arquivo)
+    with transaction.atomic():
+        conteudo, _ = ConteudoAnexo.objects.select_for_update().get_or_create(
+            hash=hash_conteudo, defaults={'tamanho': tamanho}
+        )
+        if not conteudo.arquivo:
+            nome = ConteudoAnexo.arquivo.field.generate_filename(conteudo, hash_conteudo)
+            if conteudo.arquivo.storage.exists(nome):
+                # Sobra de uma gravação cuja transação não foi confirmada: os bytes são os mesmos
+                conteudo.arquivo.name = nome
+            else:
+                conteudo.arquivo.save(hash_conteudo, File(arquivo), save=False)
+            conteudo.save(update_fields=['arquivo'])
+    return conteudo
+
+
+def anexar_arquivo(email_obj, nome, arquivo):
+    """Cria o AnexoEmail `nome` de `email_obj`, reaproveitando o conteúdo se já estiver guardado."""
+    with transaction.atomic():
+        conteudo = guardar_conteudo(arquivo)
+        ConteudoAnexo.objects.filter(pk=conteudo.pk).update(referencias=F('referencias') + 1)
+        return AnexoEmail.objects.create(
+            email=email_obj,
+            conteudo=conteudo,
+            arquivo=conteudo.arquivo.name,
+            caminhoArquivo=nome,
+            tamanho=conteudo.tamanho,
+        )
+
+
+def liberar_conteudo(conteudo_id):
+    """Desconta uma referência e apaga conteúdo e arquivo quando ninguém mais o usa."""
+    with transaction.atomic():
+        ConteudoAnexo.objects.filter(pk=conteudo_id, referencias__gt=0).update(referencias=F('referencias') - 1)
+        orfao = ConteudoAnexo.objects.select_for_update().filter(pk=conteudo_id, referencias=0).first()
+        if orfao is None:
+            return
+        arquivo = orfao.arquivo
+        orfao.delete()
+        # Só remove do disco se o apagamento for confirmado
+        transaction.on_commit(lambda: arquivo.storage.delete(arquivo.name) if arquivo else None)
+
+
+def anexo_apagado(sender, instance, **kwargs):
+    # post_delete (ligado em EmailsConfig.ready): cobre também o CASCADE ao apagar o Email
+    if instance.conteudo_id:
+        liberar_conteudo(instance.conteudo_id)
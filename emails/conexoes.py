@@ -0,0 +1,161 @@
+import smtplib
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.mail import get_connection
+
+from emails.imapUtils import conectar_email_IMAP, ERROS_CONEXAO_IMAP
+
+# Servidores costumam derrubar sessões paradas (SMTP em poucos minutos, IMAP
+# em ~30 min); antes disso fechamos nós mesmos e abrimos outra no próximo uso.
+TEMPO_OCIOSO_SMTP = 120
+TEMPO_OCIOSO_IMAP = 20 * 60
+# Sessões paradas há mais que isso recebem um NOOP antes de serem reaproveitadas
+INTERVALO_VERIFICACAO = 30
+
+ERROS_CONEXAO_SMTP = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+
+class SessaoSMTP:
+    """
+    Conexão SMTP autenticada reaproveitada entre envios. É verificada com
+    NOOP quando fica parada, fechada depois de TEMPO_OCIOSO_SMTP e reaberta
+    (com uma nova tentativa do envio) se o servidor derrubar a sessão.
+    """
+
+    def __init__(self, fabrica=None, tempo_ocioso=TEMPO_OCIOSO_SMTP):
+        self.fabrica = fabrica or (lambda: get_connection(fail_silently=False))
+        self.tempo_ocioso = tempo_ocioso
+        self._backend = None
+        self._ultimo_uso = 0
+        self._lock = threading.RLock()
+
+    def _saudavel(self):
+        conexao = getattr(self._backend, 'connection', None)
+        if conexao is None:
+            # Backends sem socket (console, locmem) não têm o que verificar
+            return True
+        try:
+            return conexao.noop()[0] == 250
+        except Exception:
+            return False
+
+    def conexao(self):
+        with self._lock:
+            parada = time.monotonic() - self._ultimo_uso
+            if self._backend is not None and (
+                parada > self.tempo_ocioso or (parada > INTERVALO_VERIFICACAO and not self._saudavel())
+            ):
+                self.fechar()
+            if self._backend is None:
+                self._backend = self.fabrica()
+                self._backend.open()
+            self._ultimo_uso = time.monotonic()
+            return self._backend
+
+    def enviar(self, mensagem):
+        """Envia um EmailMessage pela sessão, reconectando uma vez se ela tiver caído."""
+        with self._lock:
+            for tentativa in (1, 2):
+                backend = self.conexao()
+                mensagem.connection = backend
+                try:
+                    backend.send_messages([mensagem])
+                    self._ultimo_uso = time.monotonic()
+                    return
+                except ERROS_CONEXAO_SMTP:
+                    self.fechar()
+                    if tentativa == 2:
+                        raise
+
+    def fechar(self):
+        with self._lock:
+            if self._backend is not None:
+                try:
+                    self._backend.close()
+                except Exception:
+                    pass
+            self._backend = None
+
+
+class SessaoIMAP:
+    """
+    Cliente IMAP logado e com a pasta já selecionada, reaproveitado entre
+    leituras. Mesmas regras da SessaoSMTP: NOOP quando parado, fechamento por
+    inatividade e descarte se a conexão cair (a próxima leitura reconecta).
+    """
+
+    def __init__(self, mailbox, fabrica=None, tempo_ocioso=TEMPO_OCIOSO_IMAP):
+        self.mailbox = mailbox
+        self.fabrica = fabrica or (lambda: conectar_email_IMAP(mailbox))
+        self.tempo_ocioso = tempo_ocioso
+        self._cliente = None
+        self._ultimo_uso = 0
+        self._lock = threading.RLock()
+
+    def _saudavel(self):
+        try:
+            self._cliente.noop()
+            return True
+        except Exception:
+            return False
+
+    def cliente(self):
+        with self._lock:
+            parada = time.monotonic() - self._ultimo_uso
+            if self._cliente is not None and (
+                parada > self.tempo_ocioso or (parada > INTERVALO_VERIFICACAO and not self._saudavel())
+            ):
+                self.fechar()
+            if self._cliente is None:
+                self._cliente = self.fabrica()
+            self._ultimo_uso = time.monotonic()
+            return self._cliente
+
+    @contextmanager
+    def usar(self):
+        with self._lock:
+            try:
+                yield self.cliente()
+            except ERROS_CONEXAO_IMAP:
+                self.fechar()
+                raise
+            finally:
+                self._ultimo_uso = time.monotonic()
+
+    def fechar(self):
+        with self._lock:
+            if self._cliente is not None:
+                try:
+                    self._cliente.logout()
+                except Exception:
+                    pass
+            self._cliente = None
+
+
+class GerenciadorConexoes:
+    """
+    Sessões compartilhadas do processo: uma SMTP e uma IMAP por pasta.
+    Comandos de longa duração chamam fechar() ao terminar.
+    """
+
+    def __init__(self):
+        self.smtp = SessaoSMTP()
+        self._imap = {}
+        self._lock = threading.Lock()
+
+    def imap(self, mailbox="INBOX"):
+        with self._lock:
+            if mailbox not in self._imap:
+                self._imap[mailbox] = SessaoIMAP(mailbox)
+            return self._imap[mailbox]
+
+    def fechar(self):
+        self.smtp.fechar()
+        with self._lock:
+            for sessao in self._imap.values():
+                sessao.fechar()
+
+
+conexoes = GerenciadorConexoes()
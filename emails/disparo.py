@@ -0,0 +1,120 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from typing import Any, NamedTuple, Optional
+
+from decouple import config
+
+from emails.conexoes import SessaoSMTP
+from emails.imapUtils import gerar_message_id
+from emails.models import Email
+from emails.notificacoes import mensagem_email
+
+TRABALHADORES_ENVIO = 4
+# Cota do provedor SMTP; 0 desliga o limite
+ENVIOS_POR_MINUTO = config("EMAILS_POR_MINUTO", default=60, cast=int)
+
+
+class Aviso(NamedTuple):
+    """Um e-mail já montado, pronto para o disparo."""
+    destinatario: str
+    assunto: str
+    mensagem: str
+    projeto: Optional[Any] = None
+    descricao: str = ''
+    # Lembretes automáticos: marco e referência gravados em LembreteEnviado após o envio
+    marco: str = ''
+    referencia: Optional[date] = None
+    html: str = ''
+
+
+class ResultadoEnvio(NamedTuple):
+    aviso: Aviso
+    message_id: Optional[str] = None
+    erro: Optional[str] = None
+
+    @property
+    def ok(self):
+        return self.erro is None
+
+
+class LimiteTaxa:
+    """
+    Distribui os envios ao longo do minuto: cada chamada de aguardar() fica
+    com o próximo horário livre (intervalo de 60/por_minuto segundos),
+    compartilhado entre as threads.
+    """
+
+    def __init__(self, por_minuto, relogio=time.monotonic, dormir=time.sleep):
+        self.intervalo = 60 / por_minuto if por_minuto else 0
+        self.relogio = relogio
+        self.dormir = dormir
+        self._proximo = 0
+        self._lock = threading.Lock()
+
+    def aguardar(self):
+        if not self.intervalo:
+            return
+        with self._lock:
+            agora = self.relogio()
+            vez = max(agora, self._proximo)
+            self._proximo = vez + self.intervalo
+        if vez > agora:
+            self.dormir(vez - agora)
+
+
+def disparar_avisos(avisos, trabalhadores=TRABALHADORES_ENVIO, por_minuto=ENVIOS_POR_MINUTO,
+                    remetente=None, fabrica_sessao=SessaoSMTP, limite=None):
+    """
+    Envia os avisos em paralelo: cada thread do pool tem a própria sessão
+    SMTP e todas respeitam o mesmo LimiteTaxa. As threads só falam com o
+    servidor SMTP; os registros de Email dos enviados são gravados depois,
+    num INSERT em lote. Devolve um ResultadoEnvio por aviso, na mesma ordem.
+    """
+    avisos = list(avisos)
+    if not avisos:
+        return []
+
+    remetente = remetente or config("EMAIL_HOST_USER")
+    limite = limite or LimiteTaxa(por_minuto)
+    local = threading.local()
+    sessoes = []
+    lock_sessoes = threading.Lock()
+
+    def sessao_da_thread():
+        if not hasattr(local, 'sessao'):
+            local.sessao = fabrica_sessao()
+            with lock_sessoes:
+                sessoes.append(local.sessao)
+        return local.sessao
+
+    def enviar(aviso):
+        limite.aguardar()
+        message_id = gerar_message_id(remetente)
+        mensagem = mensagem_email(remetente, aviso.destinatario, aviso.assunto, aviso.mensagem, aviso.html, message_id)
+        try:
+            sessao_da_thread().enviar(mensagem)
+        except Exception as e:
+            return ResultadoEnvio(aviso, erro=str(e) or e.__class__.__name__)
+        return ResultadoEnvio(aviso, message_id=message_id)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(trabalhadores, len(avisos)))) as pool:
+            resultados = list(pool.map(enviar, avisos))
+    finally:
+        for sessao in sessoes:
+            sessao.fechar()
+
+    Email.objects.bulk_create([
+        Email(
+            remetente=remetente,
+            destinatario=r.aviso.destinatario,
+            assunto=r.aviso.assunto,
+            mensagem=r.aviso.mensagem,
+            email_id=r.message_id,
+            projeto=r.aviso.projeto,
+        )
+        for r in resultados if r.ok
+    ])
+    return resultados
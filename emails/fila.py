@@ -0,0 +1,113 @@
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from emails.conexoes import conexoes
+from emails.imapUtils import gerar_message_id
+from emails.notificacoes import mensagem_email
+from emails.models import Email, EmailSaida
+
+TAMANHO_LOTE_EMAIL = 50
+MAX_TENTATIVAS_EMAIL = 5
+ESPERA_BASE_EMAIL = timedelta(minutes=1)
+# Reserva de um worker que caiu no meio do lote volta para a fila depois disso
+TEMPO_RESERVA_EMAIL = timedelta(minutes=15)
+
+
+def enfileirar_email(destinatario, assunto, mensagem, projeto=None, remetente=None, mensagem_html=''):
+    """
+    Grava o e-mail na caixa de saída. Dentro de uma transação, o e-mail só
+    existe se ela for confirmada, então rollback também cancela o envio.
+    """
+    return EmailSaida.objects.create(
+        remetente=remetente or '',
+        destinatario=destinatario,
+        assunto=assunto,
+        mensagem=mensagem,
+        mensagem_html=mensagem_html,
+        projeto=projeto,
+    )
+
+
+def enfileirar_emails(emails):
+    """Versão em lote de enfileirar_email para instâncias de EmailSaida ainda não salvas."""
+    return EmailSaida.objects.bulk_create(emails, batch_size=500)
+
+
+def espera_para(tentativas):
+    """Backoff exponencial: 1, 2, 4, 8... minutos depois de cada falha."""
+    return ESPERA_BASE_EMAIL * (2 ** (tentativas - 1))
+
+
+def reservar_lote(limite=TAMANHO_LOTE_EMAIL):
+    """
+    Reserva até `limite` e-mails prontos para envio com um único UPDATE
+    marcado com um identificador de lote, para que workers simultâneos não
+    peguem os mesmos itens. Devolve os e-mails reservados.
+    """
+    agora = timezone.now()
+    prontos = (
+        EmailSaida.objects
+        .filter(
+            Q(status='pendente', proxima_tentativa__lte=agora)
+            | Q(status='enviando', reservado_em__lt=agora - TEMPO_RESERVA_EMAIL)
+        )
+        .order_by('proxima_tentativa', 'id')
+        .values_list('id', flat=True)[:limite]
+    )
+    lote = uuid.uuid4()
+    EmailSaida.objects.filter(id__in=list(prontos)).filter(
+        Q(status='pendente') | Q(status='enviando', reservado_em__lt=agora - TEMPO_RESERVA_EMAIL)
+    ).update(status='enviando', lote=lote, reservado_em=agora)
+    return list(EmailSaida.objects.filter(lote=lote, status='enviando').order_by('id'))
+
+
+def enviar_lote(limite=TAMANHO_LOTE_EMAIL, sessao=None):
+    """
+    Envia um lote da caixa de saída pela sessão SMTP compartilhada. Os
+    enviados viram registros de Email com o Message-ID gerado aqui; falhas
+    voltam para a fila com backoff até MAX_TENTATIVAS_EMAIL e depois ficam
+    como 'falhou'.
+    Devolve (enviados, falhas).
+    """
+    emails = reservar_lote(limite)
+    if not emails:
+        return 0, 0
+
+    sessao = sessao or conexoes.smtp
+    enviados, registros, falhas = [], [], 0
+    for email in emails:
+        remetente = email.remetente or settings.DEFAULT_FROM_EMAIL
+        message_id = gerar_message_id(remetente)
+        mensagem = mensagem_email(remetente, email.destinatario, email.assunto, email.mensagem,
+                                  email.mensagem_html, message_id)
+        try:
+            sessao.enviar(mensagem)
+        except Exception as e:
+            falhas += 1
+            email.tentativas += 1
+            email.ultimo_erro = str(e)
+            if email.tentativas >= MAX_TENTATIVAS_EMAIL:
+                email.status = 'falhou'
+            else:
+                email.status = 'pendente'
+                email.proxima_tentativa = timezone.now() + espera_para(email.tentativas)
+            email.save(update_fields=['status', 'tentativas', 'ultimo_erro', 'proxima_tentativa'])
+        else:
+            enviados.append(email.id)
+            registros.append(Email(
+                remetente=remetente,
+                destinatario=email.destinatario,
+                assunto=email.assunto,
+                mensagem=email.mensagem,
+                email_id=message_id,
+                projeto_id=email.projeto_id,
+            ))
+
+    EmailSaida.objects.filter(id__in=enviados).update(status='enviado', enviado_em=timezone.now(), ultimo_erro='')
+    # Registra os enviados como Email para que as respostas sejam associadas pelo Message-ID
+    Email.objects.bulk_create(registros)
+    return len(enviados), falhas
@@ -0,0 +1,185 @@
+import base64
+import binascii
+import quopri
+from email.header import decode_header, make_header
+from typing import NamedTuple, Optional
+
+# Tamanho de cada fetch parcial (BODY[n]<início.tamanho>) ao baixar anexos
+TAMANHO_PEDACO_ANEXO = 1024 * 1024
+
+
+class ParteMensagem(NamedTuple):
+    """Uma parte folha do BODYSTRUCTURE, com o número usado em BODY[n]."""
+    numero: str
+    tipo: str
+    subtipo: str
+    parametros: dict
+    codificacao: str
+    tamanho: int
+    disposicao: Optional[str]
+    nome_arquivo: Optional[str]
+
+    @property
+    def tipo_completo(self):
+        return f"{self.tipo}/{self.subtipo}"
+
+    @property
+    def eh_anexo(self):
+        # Como antes: inline também vale, desde que tenha nome de arquivo
+        return bool(self.nome_arquivo) and self.disposicao in ('attachment', 'inline')
+
+
+def _texto(valor):
+    if valor is None:
+        return None
+    return valor.decode(errors='ignore') if isinstance(valor, bytes) else str(valor)
+
+
+def _parametros(lista):
+    if not lista:
+        return {}
+    itens = [_texto(v) for v in lista]
+    return {itens[i].lower(): itens[i + 1] for i in range(0, len(itens) - 1, 2)}
+
+
+def _decodificar_nome(nome):
+    if not nome:
+        return None
+    try:
+        return str(make_header(decode_header(nome)))
+    except Exception:
+        return nome
+
+
+def _parte_simples(estrutura, numero):
+    tipo = _texto(estrutura[0]).lower()
+    subtipo = _texto(estrutura[1]).lower()
+    # A posição da disposição depende do tipo (text tem "lines"; message/rfc822 tem envelope, body e lines)
+    if tipo == 'text':
+        indice_disposicao = 9
+    elif (tipo, subtipo) == ('message', 'rfc822'):
+        indice_disposicao = 11
+    else:
+        indice_disposicao = 8
+
+    disposicao, parametros_disposicao = None, {}
+    if len(estrutura) > indice_disposicao and estrutura[indice_disposicao]:
+        bruta = estrutura[indice_disposicao]
+        disposicao = _texto(bruta[0]).lower()
+        parametros_disposicao = _parametros(bruta[1] if len(bruta) > 1 else None)
+
+    parametros = _parametros(estrutura[2])
+    nome = parametros_disposicao.get('filename') or parametros_disposicao.get('filename*') or parametros.get('name')
+    return ParteMensagem(
+        numero=numero,
+        tipo=tipo,
+        subtipo=subtipo,
+        parametros=parametros,
+        codificacao=(_texto(estrutura[5]) or '7bit').lower(),
+        tamanho=int(estrutura[6] or 0),
+        disposicao=disposicao,
+        nome_arquivo=_decodificar_nome(nome),
+    )
+
+
+def partes_da_estrutura(estrutura, prefixo=''):
+    """
+    Percorre o BODYSTRUCTURE (no formato do IMAPClient) e devolve as partes
+    folha numeradas como no IMAP: '1' para mensagem simples, '1', '2', '2.1'...
+    para multipart. Mensagens anexadas (message/rfc822) contam como uma parte.
+    """
+    if isinstance(estrutura[0], list):
+        partes = []
+        for i, filha in enumerate(estrutura[0], start=1):
+            partes.extend(partes_da_estrutura(filha, f'{prefixo}{i}.'))
+        return partes
+    return [_parte_simples(estrutura, prefixo.rstrip('.') or '1')]
+
+
+def escolher_corpo(partes):
+    """Primeira parte text/plain que não é anexo; senão a primeira text/html."""
+    texto = [p for p in partes if p.tipo == 'text' and p.disposicao != 'attachment' and not p.nome_arquivo]
+    for subtipo in ('plain', 'html'):
+        for parte in texto:
+            if parte.subtipo == subtipo:
+                return parte
+    return None
+
+
+class DecodificadorIncremental:
+    """
+    Decodifica base64/quoted-printable em pedaços arbitrários, guardando o
+    resto que ainda não forma uma unidade completa para o próximo pedaço.
+    """
+
+    def __init__(self, codificacao):
+        self.codificacao = codificacao
+        self.resto = b''
+
+    def decodificar(self, pedaco):
+        if self.codificacao == 'base64':
+            dados = self.resto + b''.join(pedaco.split())
+            corte = len(dados) - len(dados) % 4
+            self.resto = dados[corte:]
+            try:
+                return base64.b64decode(dados[:corte])
+            except binascii.Error:
+                return b''
+        if self.codificacao == 'quoted-printable':
+            dados = self.resto + pedaco
+            # Só decodifica até a última quebra de linha, para não cortar um "=XX" ou "=\r\n"
+            corte = dados.rfind(b'\n') + 1
+            self.resto = dados[corte:]
+            return quopri.decodestring(dados[:corte])
+        return pedaco
+
+    def finalizar(self):
+        resto, self.resto = self.resto, b''
+        if self.codificacao == 'base64':
+            try:
+                return base64.b64decode(resto + b'=' * (-len(resto) % 4))
+            except binascii.Error:
+                return b''
+        if self.codificacao == 'quoted-printable':
+            return quopri.decodestring(resto)
+        return resto
+
+
+def baixar_parte(clienteEmail, uid, parte, destino=None, tamanho_pedaco=None):
+    """
+    Baixa a parte com fetches parciais BODY.PEEK[n]<início.tamanho>,
+    decodificando cada pedaço. Se `destino` for um arquivo, os bytes vão
+    direto para ele (memória limitada ao pedaço); senão são devolvidos.
+    """
+    tamanho_pedaco = tamanho_pedaco or TAMANHO_PEDACO_ANEXO
+    decodificador = DecodificadorIncremental(parte.codificacao)
+    saida = [] if destino is None else None
+
+    def escrever(dados):
+        if not dados:
+            return
+        if destino is None:
+            saida.append(dados)
+        else:
+            destino.write(dados)
+
+    inicio = 0
+    while True:
+        chave = f'BODY[{parte.numero}]<{inicio}>'.encode()
+        resposta = clienteEmail.fetch([uid], [f'BODY.PEEK[{parte.numero}]<{inicio}.{tamanho_pedaco}>'])
+        pedaco = resposta.get(uid, {}).get(chave) or b''
+        escrever(decodificador.decodificar(pedaco))
+        inicio += len(pedaco)
+        if len(pedaco) < tamanho_pedaco or (parte.tamanho and inicio >= parte.tamanho):
+            break
+    escrever(decodificador.finalizar())
+
+    return b''.join(saida) if destino is None else None
+
+
+def texto_da_parte(bruto, parte):
+    charset = parte.parametros.get('charset') or 'utf-8'
+    try:
+        return bruto.decode(charset, errors='ignore').strip()
+    except LookupError:
+        return bruto.decode('utf-8', errors='ignore').strip()
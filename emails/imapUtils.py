@@ -1,12 +1,21 @@
 from imapclient import IMAPClient
 from decouple import config
-from email import message_from_bytes
-from django.core.files.base import ContentFile
+from email.parser import BytesHeaderParser
 from django.db import transaction
 from email.header import decode_header, make_header
-from emails.models import Email, AnexoEmail
+from email.utils import make_msgid
+from emails.models import Email, SincronizacaoCaixa
+import logging
 import re
-import time
+import tempfile
+
+from emails.imapPartes import partes_da_estrutura, escolher_corpo, baixar_parte, texto_da_parte
+from emails.armazenamentoAnexos import anexar_arquivo
+
+logger = logging.getLogger(__name__)
+
+# Conexão caída: a sincronização é interrompida e retomada do checkpoint
+ERROS_CONEXAO_IMAP = (IMAPClient.AbortError, ConnectionError, TimeoutError, OSError)
 
 def conectar_email_IMAP(mailbox: str):
     host = config("IMAP_HOST")
@@ -18,147 +27,251 @@ def conectar_email_IMAP(mailbox: str):
     clienteEmail.select_folder(mailbox, readonly=False)
     return clienteEmail
 
-def buscar_email_original(msg):
-    in_reply = msg.get('In-Reply-To')
-    if not in_reply:
-        return None
+def gerar_message_id(remetente: str) -> str:
+    """
+    Message-ID único no domínio do remetente (ex: <1700000000.123.456@ufu.br>),
+    gerado antes do envio e gravado em Email.email_id.
+    """
+    dominio = remetente.rsplit('@', 1)[-1].strip(' >') if '@' in remetente else None
+    return make_msgid(domain=dominio)
 
+def _decodificar(valor):
     try:
-        decoded = str(make_header(decode_header(in_reply)))
+        return str(make_header(decode_header(valor)))
     except:
-        decoded = in_reply
-
-    return Email.objects.filter(email_id=decoded).first()
-
-def extrair_corpo(msg):
-    body = None
+        return valor
+
+def ids_referenciados(msg):
+    """
+    Message-IDs a que a mensagem responde, do mais provável para o menos:
+    In-Reply-To e depois References (do último, o pai direto, para o primeiro).
+    """
+    ids = []
+    in_reply = msg.get('In-Reply-To')
+    if in_reply:
+        ids.extend(re.findall(r'<[^<>]+>', _decodificar(in_reply)) or [_decodificar(in_reply).strip()])
+    references = msg.get('References')
+    if references:
+        ids.extend(reversed(re.findall(r'<[^<>]+>', _decodificar(references))))
+    return list(dict.fromkeys(i for i in ids if i))
+
+def escolher_original(msg, conhecidos):
+    """Primeiro id referenciado por `msg` que está em `conhecidos` (dict email_id -> Email)."""
+    for message_id in ids_referenciados(msg):
+        if message_id in conhecidos:
+            return conhecidos[message_id]
+    return None
 
-    if msg.is_multipart():
-        for part in msg.walk():
-            tipo = part.get_content_type()
-            disposicao = part.get_content_disposition()
+def buscar_email_original(msg):
+    ids = ids_referenciados(msg)
+    if not ids:
+        return None
+    return escolher_original(msg, Email.objects.in_bulk(ids, field_name='email_id'))
 
-            if disposicao == 'attachment':
-                continue
-            if tipo == 'text/plain':
-                body = part
-                break
-            if tipo == 'text/html' and body is None:
-                body = part
-
-    else:
-        body = msg
-    if not body:
-        return ""
-
-    charset = body.get_content_charset() or 'utf-8'
-    try:
-        return body.get_payload(decode=True).decode(charset, errors='ignore').strip()
-    except:
-        return body.get_payload().decode(errors='ignore').strip()
+def message_id_de(msg):
+    message_id = msg.get('Message-ID')
+    if not message_id:
+        return None
+    return str(make_header(decode_header(message_id))).strip()
 
-def salvar_email(msg, email_original, corpo):
+def montar_email(msg, email_original, corpo):
+    """Email (ainda não salvo) a partir dos cabeçalhos da mensagem."""
     def decode_addr(header_value):
         if not header_value:
             return ""
-        hdr = str(make_header(decode_header(header_value)))
-        if '<' in hdr and '>' in hdr:
-            return hdr
-        return hdr
+        return _decodificar(header_value)
 
     remetente = decode_addr(msg.get('From'))
     destinatario = decode_addr(msg.get('To'))
 
-    assunto = msg.get('Subject', "")
-    assunto = str(make_header(decode_header(assunto)))
-
-    message_id = msg.get('Message-ID')
-    if message_id:
-        message_id = str(make_header(decode_header(message_id)))
+    assunto = _decodificar(msg.get('Subject', ""))
 
-    return Email.objects.create(
+    return Email(
         email_original=email_original,
         remetente=remetente,
         destinatario=destinatario,
         assunto=assunto or "",
         mensagem=corpo,
-        email_id=message_id,
+        email_id=message_id_de(msg),
     )
 
-def salvar_anexos(msg, email_obj, uid):
-    for part in msg.walk():
-        cdisp = part.get_content_disposition()
-
-        # aceitar inline se for arquivo
-        if cdisp not in ("attachment", "inline"):
-            continue
-
-        filename = part.get_filename()
-        if not filename:
-            # sem filename? provavelmente não é um anexo de verdade
+def baixar_anexos(clienteEmail, uid, partes):
+    """
+    Baixa cada anexo para um arquivo temporário em disco, em pedaços.
+    Devolve [(nome, arquivo)] com os arquivos já posicionados no início.
+    """
+    baixados = []
+    for parte in partes:
+        if not parte.eh_anexo:
             continue
+        temporario = tempfile.TemporaryFile()
+        baixar_parte(clienteEmail, uid, parte, destino=temporario)
+        temporario.seek(0)
+        baixados.append((parte.nome_arquivo, temporario))
+    return baixados
+
+def salvar_anexos(baixados, email_obj):
+    """Guarda os anexos baixados pelo conteúdo: bytes repetidos não são gravados de novo."""
+    for filename, temporario in baixados:
+        anexar_arquivo(email_obj, filename, temporario)
+
+def baixar_conteudo(clienteEmail, uid, estrutura):
+    """
+    Baixa por parte, a partir do BODYSTRUCTURE, o texto do corpo e os anexos
+    (estes para arquivos temporários). Devolve (corpo, [(nome, arquivo)]).
+    """
+    partes = partes_da_estrutura(estrutura)
+    parte_corpo = escolher_corpo(partes)
+    corpo = texto_da_parte(baixar_parte(clienteEmail, uid, parte_corpo), parte_corpo) if parte_corpo else ""
+    return corpo, baixar_anexos(clienteEmail, uid, partes)
+
+def processar_emails(clienteEmail, uids, falhas=None):
+    """
+    Processa um lote de UIDs com poucas idas ao banco e ao servidor:
+    - cabeçalhos e BODYSTRUCTURE de todo o lote num único FETCH;
+    - uma consulta para os Message-IDs já gravados (que são ignorados) e
+      os emails originais citados em In-Reply-To/References;
+    - corpo e anexos só das mensagens novas;
+    - um INSERT em lote para os Emails e um STORE \\Seen para o lote inteiro.
+    Uma mensagem que não pode ser baixada, lida ou ter os anexos gravados é
+    registrada no log e não fica gravada nem marcada como lida; o UID dela vai
+    para o conjunto `falhas` (quem chama decide tentar de novo). O resto do
+    lote é gravado normalmente.
+    """
+    falhas = set() if falhas is None else falhas
+    dados = clienteEmail.fetch(uids, ['BODY.PEEK[HEADER]', 'BODYSTRUCTURE'])
+    mensagens = []
+    for uid in uids:
+        item = dados.get(uid)
+        if item and b'BODY[HEADER]' in item:
+            mensagens.append((uid, BytesHeaderParser().parsebytes(item[b'BODY[HEADER]']), item[b'BODYSTRUCTURE']))
+    if not mensagens:
+        return 0
 
-        filename = str(make_header(decode_header(filename)))
+    citados = {message_id_de(msg) for _, msg, _ in mensagens} | {i for _, msg, _ in mensagens for i in ids_referenciados(msg)}
+    conhecidos = Email.objects.in_bulk([i for i in citados if i], field_name='email_id')
 
-        payload = part.get_payload(decode=True)
-        if not payload:
+    # Idempotente: a mesma mensagem pode voltar se a pasta for relida
+    novas, vistos = [], set()
+    for uid, msg, estrutura in mensagens:
+        message_id = message_id_de(msg)
+        if message_id and (message_id in conhecidos or message_id in vistos):
             continue
+        vistos.add(message_id)
+        novas.append((uid, msg, estrutura))
 
-        safe_name = f"{int(time.time())}_{uid}_{filename}"
-
-        anexo = AnexoEmail(email=email_obj, caminhoArquivo=filename)
-        anexo.arquivo.save(safe_name, ContentFile(payload), save=False)
-        anexo.tamanho = getattr(anexo.arquivo, 'size', None)
-        anexo.save()
-
-def processar_email_unico(clienteEmail, uid, dados):
-    emailBruto = dados.get(b'RFC822')
-    if not emailBruto:
-        return False
-
-    msg = message_from_bytes(emailBruto)
-
-    email_original = buscar_email_original(msg)
-    corpo = extrair_corpo(msg)
-
-    with transaction.atomic():
-        novo_email = salvar_email(msg, email_original, corpo)
-        salvar_anexos(msg, novo_email, uid)
-
-    clienteEmail.add_flags(uid, [b'\\Seen'])
-    return True
+    baixados = {}
+    desfazer = set()
+    try:
+        registros, lidas = [], []
+        for uid, msg, estrutura in novas:
+            try:
+                corpo, baixados[uid] = baixar_conteudo(clienteEmail, uid, estrutura)
+                registros.append(montar_email(msg, escolher_original(msg, conhecidos), corpo))
+            except ERROS_CONEXAO_IMAP:
+                raise
+            except Exception:
+                logger.exception("Mensagem UID %s ignorada: falha ao baixar ou ler o conteúdo", uid)
+                falhas.add(uid)
+                continue
+            lidas.append((uid, msg, estrutura))
+        novas = lidas
+
+        with transaction.atomic():
+            Email.objects.bulk_create(registros)
+            if any(r.pk is None for r in registros):
+                # Banco sem RETURNING no INSERT em lote: recupera os ids pelo Message-ID
+                ids = dict(Email.objects.filter(email_id__in=[r.email_id for r in registros]).values_list('email_id', 'id'))
+                for r in registros:
+                    r.pk = ids.get(r.email_id)
+
+            # Respostas a mensagens do próprio lote só podem ser ligadas depois do INSERT
+            do_lote = {r.email_id: r for r in registros if r.email_id}
+            respondidas = []
+            for (uid, msg, _), registro in zip(novas, registros):
+                if registro.email_original_id is None:
+                    original = escolher_original(msg, do_lote)
+                    if original is not None and original is not registro:
+                        registro.email_original = original
+                        respondidas.append(registro)
+            Email.objects.bulk_update(respondidas, ['email_original'])
+
+            uid_do_registro = {registro.pk: uid for (uid, _, _), registro in zip(novas, registros)}
+            for (uid, _, _), registro in zip(novas, registros):
+                try:
+                    with transaction.atomic():
+                        salvar_anexos(baixados[uid], registro)
+                except Exception:
+                    logger.exception("Anexos da mensagem UID %s não foram gravados; ela fica para a próxima sincronização", uid)
+                    desfazer.add(registro.pk)
+
+            if desfazer:
+                # Sem os anexos a mensagem inteira volta a ser pendente. As respostas a ela
+                # do próprio lote saem junto (email_original é CASCADE) e voltam com ela.
+                while respostas := {r.pk for r in registros if r.email_original_id in desfazer} - desfazer:
+                    desfazer |= respostas
+                Email.objects.filter(pk__in=desfazer).delete()
+                falhas.update(uid_do_registro[pk] for pk in desfazer)
+    finally:
+        for arquivos in baixados.values():
+            for _, temporario in arquivos:
+                temporario.close()
+
+    clienteEmail.add_flags([uid for uid, _, _ in mensagens if uid not in falhas], [b'\\Seen'])
+    return len(registros) - len(desfazer)
+
+TAMANHO_LOTE_IMAP = 100
+# Tentativas de ler uma mensagem com erro antes de desistir dela (fica não lida na caixa)
+MAX_TENTATIVAS_IMAP = 5
+
+def sincronizar_caixa(clienteEmail, mailbox: str) -> int:
+    """
+    Lê só as mensagens novas da pasta, a partir do SincronizacaoCaixa dela.
+    O ponto de parada é gravado a cada lote, então uma execução interrompida
+    continua de onde parou. Mensagens que falharam não seguram o ponto de
+    parada: ficam em `uids_pendentes` e são tentadas de novo no começo das
+    próximas execuções, até MAX_TENTATIVAS_IMAP vezes; depois disso são
+    abandonadas (com registro no log) e continuam não lidas na caixa.
+    Devolve quantas mensagens novas foram gravadas.
+    """
+    checkpoint, _ = SincronizacaoCaixa.objects.get_or_create(mailbox=mailbox)
+    estado = clienteEmail.select_folder(mailbox, readonly=False)
+    uidvalidity = estado[b'UIDVALIDITY']
+    uidnext = estado.get(b'UIDNEXT')
+    modseq = estado.get(b'HIGHESTMODSEQ')
+
+    if checkpoint.uidvalidity != uidvalidity:
+        checkpoint.uidvalidity = uidvalidity
+        checkpoint.ultimo_uid = 0
+        checkpoint.modseq = None
+        checkpoint.uids_pendentes = {}
+    elif not checkpoint.uids_pendentes and (
+        (modseq is not None and modseq == checkpoint.modseq) or (uidnext is not None and uidnext <= checkpoint.ultimo_uid + 1)
+    ):
+        return 0
+
+    # "n:*" sempre devolve ao menos a última mensagem, mesmo com UID menor que n
+    uids = sorted(uid for uid in clienteEmail.search(['UID', f'{checkpoint.ultimo_uid + 1}:*']) if uid > checkpoint.ultimo_uid)
+    pendentes = sorted(int(uid) for uid in checkpoint.uids_pendentes)
 
-def processar_emails(clienteEmail, emails_fetch):
     novas = 0
-    for uid, dados in emails_fetch.items():
-        if processar_email_unico(clienteEmail, uid, dados):
-            novas += 1
+    lotes = [pendentes[i:i + TAMANHO_LOTE_IMAP] for i in range(0, len(pendentes), TAMANHO_LOTE_IMAP)]
+    lotes += [uids[i:i + TAMANHO_LOTE_IMAP] for i in range(0, len(uids), TAMANHO_LOTE_IMAP)]
+    for lote in lotes:
+        falhas = set()
+        novas += processar_emails(clienteEmail, lote, falhas)
+        for uid in lote:
+            tentativas = checkpoint.uids_pendentes.pop(str(uid), 0)
+            if uid not in falhas:
+                continue
+            if tentativas + 1 < MAX_TENTATIVAS_IMAP:
+                checkpoint.uids_pendentes[str(uid)] = tentativas + 1
+            else:
+                logger.error("%s: mensagem UID %s abandonada após %d tentativas", mailbox, uid, tentativas + 1)
+        checkpoint.ultimo_uid = max(checkpoint.ultimo_uid, lote[-1])
+        checkpoint.save()
+
+    checkpoint.modseq = modseq
+    checkpoint.save()
     return novas
 
-def tem_caractere_especial(texto:str) -> bool:
-    return bool(re.search(r"[^A-Za-z0-9\s.,!?]", texto))
-
-def buscar_id_email(assunto_busca:str, email_destinatario:str) -> str | None:
-    from email import message_from_bytes
-
-    clienteEmail = conectar_email_IMAP("[Gmail]/Sent Mail")
-    if tem_caractere_especial(assunto_busca):
-        mensagens = clienteEmail.search(['HEADER', 'To', email_destinatario])
-    else:    
-        mensagens = clienteEmail.search(['HEADER', 'Subject', assunto_busca])
-
-    if not mensagens:
-        print("Nenhum e-mail com esse assunto.")
-        return None
-
-    uid = mensagens[-1]
-    dados = clienteEmail.fetch(uid, ['RFC822'])
-    raw_email = dados[uid][b'RFC822']
-
-    msg = message_from_bytes(raw_email)
-    msgid = msg.get('Message-ID')
-
-    if msgid:
-        return str(make_header(decode_header(msgid)))
-
-    return None
\ No newline at end of file
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from emails.conexoes import conexoes
+from emails.fila import enviar_lote
+
+
+class Command(BaseCommand):
+    help = 'Envia os e-mails da caixa de saída em lotes, com nova tentativa em caso de falha'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--uma-vez', action='store_true', help='Esvazia a fila e sai, sem ficar aguardando novos e-mails.')
+        parser.add_argument('--intervalo', type=float, default=10, help='Segundos de espera quando não há e-mails prontos.')
+        parser.add_argument('--lote', type=int, default=None, help='Quantidade de e-mails por conexão SMTP.')
+
+    def handle(self, *args, **options):
+        kwargs = {'limite': options['lote']} if options['lote'] else {}
+        try:
+            while True:
+                # Conexão derrubada pelo banco (CONN_MAX_AGE, reinício) não deve derrubar o worker
+                close_old_connections()
+                enviados, falhas = enviar_lote(**kwargs)
+                if enviados or falhas:
+                    self.stdout.write(f"Lote enviado: {enviados} e-mail(s), {falhas} falha(s).")
+                    continue
+                if options['uma_vez']:
+                    break
+                time.sleep(options['intervalo'])
+        finally:
+            conexoes.fechar()
@@ -0,0 +1,23 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from emails.ouvinteImap import OuvinteIMAP
+
+
+class Command(BaseCommand):
+    help = 'Mantém a caixa de entrada em IMAP IDLE e registra as respostas assim que chegam'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mailbox', default='INBOX', help='Pasta IMAP a escutar.')
+
+    def handle(self, *args, **options):
+        ouvinte = OuvinteIMAP(options['mailbox'])
+        # O deploy encerra workers com SIGTERM: sai do IDLE e faz logout em vez de derrubar a conexão
+        signal.signal(signal.SIGTERM, lambda *args: ouvinte.parar.set())
+        self.stdout.write(f"Escutando {options['mailbox']}...")
+        try:
+            ouvinte.executar()
+        except KeyboardInterrupt:
+            ouvinte.sessao.fechar()
+        self.stdout.write(f"{ouvinte.sincronizadas} mensagem(ns) registrada(s).")
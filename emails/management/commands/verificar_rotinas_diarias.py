@@ -1,108 +1,156 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from datetime import timedelta
+from django.db.models import DateTimeField, DurationField, Exists, ExpressionWrapper, F, OuterRef, Q, Subquery, Value
 from core.models import Projeto, Parecer
-from emails.gerenciadorEmails import GerenciadorEmails, TipoRelatorio
+from emails.gerenciadorEmails import TipoRelatorio
+from emails.notificacoes import modelo_notificacao
+from emails.disparo import Aviso, disparar_avisos, TRABALHADORES_ENVIO, ENVIOS_POR_MINUTO
+from emails.models import LembreteEnviado
+
+# Marcos vencidos há até esse número de dias e ainda não avisados são recuperados
+JANELA_RECUPERACAO_DIAS = 30
 
 class Command(BaseCommand):
     help = 'Executa rotinas diárias de verificação de e-mails (Pendências e Relatórios)'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--trabalhadores', type=int, default=TRABALHADORES_ENVIO, help='Envios simultâneos (uma conexão SMTP cada).')
+        parser.add_argument('--por-minuto', type=int, default=ENVIOS_POR_MINUTO, help='Máximo de e-mails por minuto (0 = sem limite).')
+
     def handle(self, *args, **options):
         self.stdout.write("Iniciando rotinas diárias de email...")
-        
-        self.verificar_projetos_aprovados()
-        self.verificar_projetos_pendentes()
-        
-        self.stdout.write(self.style.SUCCESS("Rotinas finalizadas."))
+
+        # Primeiro monta o lote inteiro do dia; depois dispara em paralelo, respeitando a cota do provedor
+        avisos = self.verificar_projetos_aprovados() + self.verificar_projetos_pendentes()
+        self.stdout.write(f"{len(avisos)} aviso(s) a enviar.")
+
+        resultados = disparar_avisos(
+            avisos,
+            trabalhadores=options.get('trabalhadores', TRABALHADORES_ENVIO),
+            por_minuto=options.get('por_minuto', ENVIOS_POR_MINUTO),
+        )
+
+        self.registrar_lembretes(resultados)
+
+        falhas = [r for r in resultados if not r.ok]
+        for r in falhas:
+            self.stdout.write(self.style.ERROR(f"Erro ao enviar {r.aviso.descricao}: {r.erro}"))
+        self.resultados = resultados
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rotinas finalizadas: {len(resultados) - len(falhas)} enviado(s), {len(falhas)} falha(s)."
+        ))
+
+    def registrar_lembretes(self, resultados):
+        # Só os enviados entram no registro; os que falharam são selecionados de novo na próxima execução
+        LembreteEnviado.objects.bulk_create([
+            LembreteEnviado(projeto=r.aviso.projeto, marco=r.aviso.marco, referencia=r.aviso.referencia)
+            for r in resultados if r.ok and r.aviso.marco
+        ], ignore_conflicts=True)
 
     def verificar_projetos_aprovados(self):
         """
-        Regra: 
+        Regra:
         - 180 dias após aprovação: cobrar relatório parcial.
         - 365 dias após aprovação: cobrar relatório final ou parcial.
+        Marcos vencidos nos últimos JANELA_RECUPERACAO_DIAS dias e ainda sem
+        LembreteEnviado também são cobrados (execução perdida).
         """
         hoje = timezone.now().date()
-        
-        # Datas alvo
-        data_180_dias = hoje - timedelta(days=180)
-        data_365_dias = hoje - timedelta(days=365)
-
-        # Buscar projetos aprovados nessas datas exatas
-        projetos_180 = Projeto.objects.filter(status='aprovado', data_aprovacao=data_180_dias, rel_parc=False)
-        projetos_365 = Projeto.objects.filter(status='aprovado', data_aprovacao=data_365_dias) # Final cobra mesmo se entregou parcial antes
-
-        # Envio 180 dias
-        for proj in projetos_180:
-            self.enviar_cobranca_relatorio(proj, 30, TipoRelatorio.PARCIAL.value)
-
-        # Envio 365 dias (1 ano)
-        for proj in projetos_365:
-            # Se já entregou o final, não precisa cobrar
-            if not proj.rel_final:
-                self.enviar_cobranca_relatorio(proj, 30, TipoRelatorio.QUALQUER.value)
-
-    def enviar_cobranca_relatorio(self, projeto, dias_prazo, tipo_texto):
-        try:
-            self.stdout.write(f"Enviando cobrança de relatório ({tipo_texto}) para {projeto.titulo}")
-            GerenciadorEmails.notificacao_relatorio_aprovado(
-                nome_pesquisador=projeto.pesquisador.nome,
-                nome_pesquisa=projeto.titulo,
-                email_destinatario=projeto.pesquisador.email,
-                dias_restantes=dias_prazo,
-                tipo_relatorio=tipo_texto
+
+        marcos = (
+            ('relatorio_parcial', 180, TipoRelatorio.PARCIAL.value, {'rel_parc': False}),
+            # Final cobra mesmo se entregou parcial antes; se já entregou o final, não precisa cobrar
+            ('relatorio_final', 365, TipoRelatorio.QUALQUER.value, {'rel_final': False}),
+        )
+
+        cobrancas = []
+        for marco, dias, tipo_texto, pendente in marcos:
+            vencimento = hoje - timedelta(days=dias)
+            ja_enviado = LembreteEnviado.objects.filter(projeto=OuterRef('pk'), marco=marco)
+            projetos = (
+                Projeto.objects
+                .filter(status='aprovado', data_aprovacao__range=(vencimento - timedelta(days=JANELA_RECUPERACAO_DIAS), vencimento), **pendente)
+                .filter(~Exists(ja_enviado))
+                .select_related('pesquisador')
+                .order_by('data_aprovacao', 'id')
             )
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f"Erro ao enviar para {projeto.id}: {e}"))
+            cobrancas += [(proj, marco, tipo_texto, proj.data_aprovacao + timedelta(days=dias)) for proj in projetos]
+
+        # Um único modelo compilado para o lote; por projeto só muda o contexto
+        renderizados = modelo_notificacao('relatorio_aprovado').renderizar_lote([
+            {'nome_pesquisador': proj.pesquisador.nome, 'nome_pesquisa': proj.titulo, 'dias_restantes': 30, 'tipo_relatorio': tipo_texto}
+            for proj, _, tipo_texto, _ in cobrancas
+        ])
+        return [
+            Aviso(proj.pesquisador.email, assunto, texto, proj,
+                  descricao=f"cobrança de relatório ({tipo_texto}) para {proj.titulo}",
+                  marco=marco, referencia=referencia, html=html)
+            for (proj, marco, tipo_texto, referencia), (assunto, texto, html) in zip(cobrancas, renderizados)
+        ]
 
     def verificar_projetos_pendentes(self):
         """
         Regra:
         - Pesquisador tem 30 dias para corrigir.
         - Enviar emails diários nos 5 últimos dias (dia 26, 27, 28, 29, 30).
-        - Após 30 dias, enviar email pedindo retirada.
+        - Após 30 dias, enviar email pedindo retirada (uma vez; se a execução
+          do dia 31 for perdida, sai na próxima, até JANELA_RECUPERACAO_DIAS depois).
         """
-        projetos_pendentes = Projeto.objects.filter(status='pendente')
         hoje = timezone.now() # Usamos datetime completo para comparar com o Parecer (que é DateTimeField)
+        data_hoje = timezone.localdate()
 
         prazo_limite_dias = 30
         inicio_aviso_dias = 25 # Começa a avisar no dia 26 (quando faltam 5 dias)
+        expirou_em = hoje - timedelta(days=prazo_limite_dias + 1)
 
+        # Data do último parecer pendente e tempo desde ele, calculados no banco;
+        # só voltam os projetos dentro da janela de aviso ainda sem o lembrete correspondente.
+        ultimo_pendente = Parecer.objects.filter(projeto=OuterRef('pk'), decisao='pendente').order_by('-data_parecer')
+        avisado_hoje = LembreteEnviado.objects.filter(projeto=OuterRef('pk'), marco='pendencia', referencia=data_hoje)
+        expiracao_avisada = LembreteEnviado.objects.filter(
+            projeto=OuterRef('pk'), marco='pendencia_expirada', enviado_em__gte=OuterRef('ultimo_pendente')
+        )
+        projetos_pendentes = (
+            Projeto.objects.filter(status='pendente')
+            .annotate(ultimo_pendente=Subquery(ultimo_pendente.values('data_parecer')[:1]))
+            .filter(
+                ultimo_pendente__lte=hoje - timedelta(days=inicio_aviso_dias),
+                ultimo_pendente__gt=expirou_em - timedelta(days=JANELA_RECUPERACAO_DIAS + 1),
+            )
+            .alias(avisado_hoje=Exists(avisado_hoje), expiracao_avisada=Exists(expiracao_avisada))
+            .filter(
+                Q(ultimo_pendente__gt=expirou_em, avisado_hoje=False)
+                | Q(ultimo_pendente__lte=expirou_em, expiracao_avisada=False)
+            )
+            .annotate(tempo_pendente=ExpressionWrapper(
+                Value(hoje, output_field=DateTimeField()) - F('ultimo_pendente'), output_field=DurationField()
+            ))
+            .select_related('pesquisador')
+            .order_by('ultimo_pendente', 'id')
+        )
+
+        projetos_pendentes = list(projetos_pendentes)
         for projeto in projetos_pendentes:
-            # Descobre quando ficou pendente pegando o último parecer
-            ultimo_parecer = projeto.pareceres.filter(decisao='pendente').order_by('-data_parecer').first()
-            
-            if not ultimo_parecer:
-                continue
-
-            # Calcula quantos dias se passaram desde o parecer
-            dias_corridos = (hoje - ultimo_parecer.data_parecer).days
-            dias_restantes = prazo_limite_dias - dias_corridos
-
-            enviar = False
-            
-            # Situação A: Faltam 5 dias ou menos (e ainda está no prazo)
-            if 0 <= dias_restantes <= 5: 
-                # Note: se dias_restantes for 5, significa que passaram 25 dias.
-                # O requisito diz "nos 5 últimos dias".
-                enviar = True
-            
-            # Situação B: Estourou o prazo (dias_restantes < 0)
-            elif dias_restantes == -1: 
-                enviar = True
-
-            if enviar:
-                try:
-                    print("try")
-                    self.stdout.write(f"Enviando aviso de pendência para {projeto.titulo}. Restam: {dias_restantes} dias.")
-                    
-                    # Usa o método estático que você já tem no gerenciadorEmails.py
-                    # Esse método já sabe formatar o texto se dias_restantes <= 0
-                    GerenciadorEmails.notificacao_relatorio_pendente(
-                        nome_pesquisador=projeto.pesquisador.nome,
-                        nome_pesquisa=projeto.titulo,
-                        email_destinatario=projeto.pesquisador.email,
-                        dias_restantes=dias_restantes if dias_restantes > 0 else 0
-                    )
-                except Exception as e:
-                    self.stdout.write(self.style.ERROR(f"Erro ao enviar pendência para {projeto.id}: {e}"))
+            projeto.dias_restantes = prazo_limite_dias - projeto.tempo_pendente.days
+
+        # O texto já muda quando dias_restantes <= 0 (pedido de retirada)
+        renderizados = modelo_notificacao('relatorio_pendente').renderizar_lote([
+            {'nome_pesquisador': projeto.pesquisador.nome, 'nome_pesquisa': projeto.titulo,
+             'dias_restantes': max(projeto.dias_restantes, 0)}
+            for projeto in projetos_pendentes
+        ])
 
+        avisos = []
+        for projeto, (assunto, texto, html) in zip(projetos_pendentes, renderizados):
+            # Faltam 5 dias ou menos (ainda no prazo) ou o prazo estourou
+            if projeto.dias_restantes >= 0:
+                marco, referencia = 'pendencia', data_hoje
+            else:
+                marco = 'pendencia_expirada'
+                referencia = timezone.localtime(projeto.ultimo_pendente).date() + timedelta(days=prazo_limite_dias + 1)
+            avisos.append(Aviso(projeto.pesquisador.email, assunto, texto, projeto,
+                                descricao=f"aviso de pendência para {projeto.titulo} (restam {projeto.dias_restantes} dias)",
+                                marco=marco, referencia=referencia, html=html))
+        return avisos
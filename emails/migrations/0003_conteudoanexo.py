@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:35
+
+import django.db.models.deletion
+import emails.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0002_sincronizacaocaixa'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConteudoAnexo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hash', models.CharField(max_length=64, unique=True)),
+                ('arquivo', models.FileField(max_length=255, upload_to=emails.models.conteudo_anexo_upload_to)),
+                ('tamanho', models.BigIntegerField()),
+                ('referencias', models.PositiveIntegerField(default=0)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='anexoemail',
+            name='conteudo',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='anexos', to='emails.conteudoanexo'),
+        ),
+    ]
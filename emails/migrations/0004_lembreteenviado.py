@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_indices_rotinas_diarias'),
+        ('emails', '0003_conteudoanexo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LembreteEnviado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('marco', models.CharField(choices=[('relatorio_parcial', 'Cobrança de relatório parcial (180 dias)'), ('relatorio_final', 'Cobrança de relatório final (365 dias)'), ('pendencia', 'Aviso diário de pendência'), ('pendencia_expirada', 'Aviso de prazo de pendência expirado')], max_length=30)),
+                ('referencia', models.DateField()),
+                ('enviado_em', models.DateTimeField(auto_now_add=True)),
+                ('projeto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lembretes_enviados', to='core.projeto')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('projeto', 'marco', 'referencia'), name='lembrete_unico_por_marco')],
+            },
+        ),
+    ]
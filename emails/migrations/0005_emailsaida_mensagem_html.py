@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0004_lembreteenviado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailsaida',
+            name='mensagem_html',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
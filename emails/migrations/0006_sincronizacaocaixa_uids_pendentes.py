@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 15:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0005_emailsaida_mensagem_html'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sincronizacaocaixa',
+            name='uids_pendentes',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
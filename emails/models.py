@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 class Email(models.Model):
     # Informações do email
@@ -21,12 +22,116 @@ class Email(models.Model):
 def anexos_email_upload_to(instance, filename):
     return f"email_attachments/{instance.email.id}/{filename}"
 
+def conteudo_anexo_upload_to(instance, filename):
+    return f"email_attachments/conteudo/{instance.hash[:2]}/{instance.hash}"
+
+class ConteudoAnexo(models.Model):
+    """
+    Bytes de um anexo, guardados uma única vez pelo SHA-256. Cada AnexoEmail
+    que usa o conteúdo conta em `referencias`; quando o último é apagado, o
+    arquivo também é (ver emails.armazenamentoAnexos).
+    """
+    hash = models.CharField(max_length=64, unique=True)
+    arquivo = models.FileField(upload_to=conteudo_anexo_upload_to, max_length=255)
+    tamanho = models.BigIntegerField()
+    referencias = models.PositiveIntegerField(default=0)
+    criado_em = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.hash[:12]} ({self.referencias} referência(s))"
+
 class AnexoEmail(models.Model):
     email = models.ForeignKey('Email', related_name='anexos', on_delete=models.CASCADE)
+    # Anexos antigos não têm conteúdo e guardam o próprio arquivo; os novos
+    # apontam `arquivo` para o arquivo do ConteudoAnexo compartilhado.
+    conteudo = models.ForeignKey('ConteudoAnexo', related_name='anexos', on_delete=models.PROTECT, null=True, blank=True)
 
     arquivo = models.FileField(upload_to=anexos_email_upload_to)
     caminhoArquivo = models.CharField(max_length=255)
     tamanho = models.PositiveIntegerField(null=True, blank=True)
 
     def __str__(self):
-        return self.caminhoArquivo
\ No newline at end of file
+        return self.caminhoArquivo
+
+class EmailSaida(models.Model):
+    """
+    Caixa de saída: as views só gravam aqui e o comando `enviar_emails`
+    envia em lotes, reaproveitando uma conexão SMTP e reagendando falhas.
+    """
+    STATUS_CHOICES = (
+        ('pendente', 'Pendente'),
+        ('enviando', 'Enviando'),
+        ('enviado', 'Enviado'),
+        ('falhou', 'Falhou'),
+    )
+
+    remetente = models.EmailField(blank=True, default='')
+    destinatario = models.EmailField()
+    assunto = models.CharField(max_length=255)
+    mensagem = models.TextField()
+    mensagem_html = models.TextField(blank=True, default='')
+    projeto = models.ForeignKey('core.Projeto', on_delete=models.SET_NULL, null=True, blank=True)
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pendente')
+    tentativas = models.PositiveSmallIntegerField(default=0)
+    proxima_tentativa = models.DateTimeField(default=timezone.now)
+    ultimo_erro = models.TextField(blank=True, default='')
+    lote = models.UUIDField(null=True, blank=True)
+    reservado_em = models.DateTimeField(null=True, blank=True)
+
+    criado_em = models.DateTimeField(auto_now_add=True)
+    enviado_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'proxima_tentativa'])]
+
+    def __str__(self):
+        return f"{self.assunto} para {self.destinatario} ({self.get_status_display()})"
+
+
+class SincronizacaoCaixa(models.Model):
+    """
+    Ponto de parada da leitura de cada pasta IMAP: a próxima execução só
+    busca UIDs acima de `ultimo_uid`. Se o servidor trocar o UIDVALIDITY, os
+    UIDs antigos deixam de valer e a pasta é relida (sem duplicar, pelo Message-ID).
+    """
+    mailbox = models.CharField(max_length=255, unique=True)
+    uidvalidity = models.BigIntegerField(null=True, blank=True)
+    ultimo_uid = models.BigIntegerField(default=0)
+    # HIGHESTMODSEQ (CONDSTORE), quando o servidor suporta: se não mudou, não há nada novo
+    modseq = models.BigIntegerField(null=True, blank=True)
+    # UIDs que falharam (já abaixo de ultimo_uid) -> tentativas feitas
+    uids_pendentes = models.JSONField(default=dict, blank=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.mailbox} (UID {self.ultimo_uid})"
+
+
+class LembreteEnviado(models.Model):
+    """
+    Registro dos lembretes automáticos já enviados, um por projeto, marco e
+    data de referência. As rotinas diárias só selecionam marcos vencidos sem
+    registro, então uma execução perdida é recuperada na seguinte e repetir
+    a execução no mesmo dia não envia nada.
+    """
+    MARCO_CHOICES = (
+        ('relatorio_parcial', 'Cobrança de relatório parcial (180 dias)'),
+        ('relatorio_final', 'Cobrança de relatório final (365 dias)'),
+        ('pendencia', 'Aviso diário de pendência'),
+        ('pendencia_expirada', 'Aviso de prazo de pendência expirado'),
+    )
+
+    projeto = models.ForeignKey('core.Projeto', on_delete=models.CASCADE, related_name='lembretes_enviados')
+    marco = models.CharField(max_length=30, choices=MARCO_CHOICES)
+    # Dia em que o marco venceu (ex.: aprovação + 180 dias; o próprio dia, para o aviso diário)
+    referencia = models.DateField()
+    enviado_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['projeto', 'marco', 'referencia'], name='lembrete_unico_por_marco'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_marco_display()} - {self.projeto} ({self.referencia})"
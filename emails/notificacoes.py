@@ -0,0 +1,66 @@
+import threading
+
+from django.core.mail import EmailMultiAlternatives
+from django.template import engines
+from django.template.loader import get_template
+
+# Notificações disponíveis: nome -> assunto. Texto e HTML ficam em
+# emails/templates/emails/notificacoes/<nome>.txt e <nome>.html.
+NOTIFICACOES = {
+    'relatorio_aprovado': "Solicitação de envio do relatório {{ tipo_relatorio }}",
+    'relatorio_pendente': "Aviso sobre pendência na pesquisa '{{ nome_pesquisa }}'",
+    'pendencia_projeto': "Pendência no Projeto: {{ titulo }}",
+}
+
+
+class ModeloNotificacao:
+    """Assunto, texto e HTML de uma notificação, compilados uma única vez."""
+
+    def __init__(self, nome):
+        self.nome = nome
+        self.assunto = engines['django'].from_string(
+            "{% autoescape off %}" + NOTIFICACOES[nome] + "{% endautoescape %}"
+        )
+        self.texto = get_template(f"emails/notificacoes/{nome}.txt")
+        self.html = get_template(f"emails/notificacoes/{nome}.html")
+
+    def renderizar(self, contexto):
+        """Devolve (assunto, texto, html) para um destinatário."""
+        return (
+            self.assunto.render(contexto).strip(),
+            self.texto.render(contexto).strip(),
+            self.html.render(contexto).strip(),
+        )
+
+    def renderizar_lote(self, contextos):
+        """Uma renderização por contexto, com os templates já compilados."""
+        return [self.renderizar(contexto) for contexto in contextos]
+
+
+_modelos = {}
+_lock = threading.Lock()
+
+
+def modelo_notificacao(nome):
+    """ModeloNotificacao compilado de `nome`, guardado para as próximas chamadas."""
+    with _lock:
+        if nome not in _modelos:
+            _modelos[nome] = ModeloNotificacao(nome)
+        return _modelos[nome]
+
+
+def mensagem_email(remetente, destinatario, assunto, texto, html='', message_id=None):
+    """
+    Monta a mensagem usada pelos dois caminhos de envio (caixa de saída e
+    disparo dos lembretes): texto simples, com a versão HTML como alternativa.
+    """
+    mensagem = EmailMultiAlternatives(
+        subject=assunto,
+        body=texto,
+        from_email=remetente,
+        to=[destinatario],
+        headers={'Message-ID': message_id} if message_id else None,
+    )
+    if html:
+        mensagem.attach_alternative(html, 'text/html')
+    return mensagem
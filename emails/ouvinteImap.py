@@ -0,0 +1,97 @@
+import logging
+import threading
+import time
+
+from django.db import close_old_connections
+
+from emails.conexoes import SessaoIMAP, ERROS_CONEXAO_IMAP
+from emails.imapUtils import sincronizar_caixa
+
+logger = logging.getLogger(__name__)
+
+# RFC 2177: o servidor pode encerrar um IDLE após 30 min, então renovamos antes
+RENOVAR_IDLE = 29 * 60
+# Intervalo de cada idle_check (também é o tempo máximo para perceber um pedido de parada)
+ESPERA_IDLE = 30
+ESPERA_RECONEXAO_BASE = 5
+ESPERA_RECONEXAO_MAX = 5 * 60
+
+
+class OuvinteIMAP:
+    """
+    Mantém uma pasta IMAP em IDLE e sincroniza (sincronizar_caixa) sempre que
+    chega mensagem nova. A cada (re)conexão faz uma sincronização completa a
+    partir do checkpoint, então nada se perde enquanto esteve desconectado.
+    Servidores sem IDLE são consultados a cada `espera_idle` segundos.
+    """
+
+    def __init__(self, mailbox="INBOX", sessao=None, espera_idle=ESPERA_IDLE, renovar_idle=RENOVAR_IDLE,
+                 espera_reconexao=ESPERA_RECONEXAO_BASE, espera_reconexao_max=ESPERA_RECONEXAO_MAX):
+        self.mailbox = mailbox
+        self.sessao = sessao or SessaoIMAP(mailbox)
+        self.espera_idle = espera_idle
+        self.renovar_idle = renovar_idle
+        self.espera_reconexao = espera_reconexao
+        self.espera_reconexao_max = espera_reconexao_max
+        self.parar = threading.Event()
+        self.falhas = 0
+        self.sincronizadas = 0
+
+    def sincronizar(self, clienteEmail):
+        # O processo fica de pé por dias: a conexão com o banco pode ter caído desde a última vez
+        close_old_connections()
+        novas = sincronizar_caixa(clienteEmail, self.mailbox)
+        self.sincronizadas += novas
+        if novas:
+            logger.info("%s: %d mensagem(ns) nova(s)", self.mailbox, novas)
+        return novas
+
+    def _escutar(self, clienteEmail):
+        if not clienteEmail.has_capability('IDLE'):
+            while not self.parar.wait(self.espera_idle):
+                self.sincronizar(clienteEmail)
+            return
+
+        # Se a conexão cair no meio do IDLE a exceção sobe para executar(), que reconecta
+        clienteEmail.idle()
+        inicio_idle = time.monotonic()
+        while not self.parar.is_set():
+            respostas = clienteEmail.idle_check(timeout=self.espera_idle)
+            if self.parar.is_set():
+                break
+            chegou = any(len(r) > 1 and r[1] in (b'EXISTS', b'RECENT') for r in respostas)
+            if chegou or time.monotonic() - inicio_idle > self.renovar_idle:
+                clienteEmail.idle_done()
+                if chegou:
+                    self.sincronizar(clienteEmail)
+                clienteEmail.idle()
+                inicio_idle = time.monotonic()
+        clienteEmail.idle_done()
+
+    def _aguardar_nova_tentativa(self):
+        self.falhas += 1
+        espera = min(self.espera_reconexao_max, self.espera_reconexao * 2 ** (self.falhas - 1))
+        self.parar.wait(espera)
+        return espera
+
+    def executar(self):
+        """
+        Laço principal: conecta, sincroniza, escuta. Qualquer erro (conexão
+        perdida, banco fora do ar, resposta IMAP inesperada) é registrado e o
+        laço recomeça com backoff, com uma conexão IMAP nova.
+        """
+        while not self.parar.is_set():
+            try:
+                with self.sessao.usar() as clienteEmail:
+                    self.sincronizar(clienteEmail)
+                    self.falhas = 0
+                    self._escutar(clienteEmail)
+            except ERROS_CONEXAO_IMAP as e:
+                logger.warning("%s: conexão IMAP perdida (%s); reconectando", self.mailbox, e)
+                self._aguardar_nova_tentativa()
+            except Exception:
+                logger.exception("%s: erro no ouvinte IMAP; tentando de novo", self.mailbox)
+                # A conexão pode ter ficado no meio de um IDLE: começa com outra
+                self.sessao.fechar()
+                self._aguardar_nova_tentativa()
+        self.sessao.fechar()
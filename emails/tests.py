@@ -4,8 +4,28 @@ from datetime import timedelta
 from decouple import config
 from django.core import mail
 from unittest.mock import patch
+from django.core.mail.backends.locmem import EmailBackend
+from django.urls import reverse
+from django.contrib.auth.models import Group
 
 from emails.gerenciadorEmails import GerenciadorEmails, TipoRelatorio
+from emails.fila import enfileirar_email, enviar_lote, MAX_TENTATIVAS_EMAIL, TEMPO_RESERVA_EMAIL
+from emails.models import Email, EmailSaida, AnexoEmail, ConteudoAnexo, LembreteEnviado
+from emails.imapUtils import buscar_email_original, sincronizar_caixa, processar_emails, baixar_conteudo, MAX_TENTATIVAS_IMAP
+from django.db import connection, OperationalError
+from django.test.utils import CaptureQueriesContext
+from emails.models import SincronizacaoCaixa
+import os
+import re
+import tempfile
+from email import message_from_string
+from email.message import EmailMessage as MensagemMIME
+from django.test import override_settings
+from emails.conexoes import SessaoSMTP, SessaoIMAP, INTERVALO_VERIFICACAO
+from emails.ouvinteImap import OuvinteIMAP
+from emails.disparo import LimiteTaxa
+from emails.notificacoes import modelo_notificacao
+from django.template.loader import get_template
 from emails.management.commands.verificar_rotinas_diarias import Command
 from core.models import Projeto, Pesquisador, Parecer, User
 
@@ -62,14 +82,110 @@ class RotinaDiariaTest(TestCase):
         print(parecer.data_parecer)
 
     def test_rotina(self):
-        with patch("emails.gerenciadorEmails.GerenciadorEmails.notificacao_relatorio_aprovado") as mock_aprovado, \
-             patch("emails.gerenciadorEmails.GerenciadorEmails.notificacao_relatorio_pendente") as mock_pendente:
+        comando = Command()
+        comando.handle(trabalhadores=2, por_minuto=0)
 
-            Command().handle()
+        # Parcial (180), final (365) e pendência: um resultado por aviso
+        self.assertEqual(len(comando.resultados), 3)
+        self.assertTrue(all(r.ok for r in comando.resultados))
+        self.assertEqual(sorted(m.subject for m in mail.outbox), sorted([
+            "Solicitação de envio do relatório parcial",
+            "Solicitação de envio do relatório final ou parcial",
+            "Aviso sobre pendência na pesquisa 'Pend'",
+        ]))
+        self.assertEqual(Email.objects.filter(projeto__isnull=False).count(), 3)
 
-            # Assert para projetos aprovados
-            mock_aprovado.assert_called()
-            mock_pendente.assert_called()
+    def test_rotina_contabiliza_falhas(self):
+        with patch.object(BackendContador, 'recusado', self.pesq.email), \
+             override_settings(EMAIL_BACKEND='emails.tests.BackendContador'):
+            comando = Command()
+            comando.handle(trabalhadores=2, por_minuto=0)
+
+        self.assertEqual(len(comando.resultados), 3)
+        self.assertFalse(any(r.ok for r in comando.resultados))
+        self.assertFalse(Email.objects.exists())
+
+    def test_pendentes_em_uma_consulta(self):
+        hoje = timezone.now()
+        esperados = {"Pend": 3}  # o do setUp, parecer de 27 dias
+        for dias in (10, 24, 25, 30, 31, 32, 61, 62):
+            projeto = Projeto.objects.create(titulo=f"Pend{dias}", pesquisador=self.pesq, data_submissao=hoje, status="pendente", caae=1000 + dias)
+            Parecer.objects.create(projeto=projeto, relator=self.relator, decisao="pendente", justificativa="x",
+                                   data_parecer=hoje - timedelta(days=dias, hours=1))
+            # Avisos diários (25 a 30) e aviso de expiração ainda não enviado, recuperável por 30 dias
+            if 25 <= dias <= 61:
+                esperados[projeto.titulo] = 30 - dias
+        # Vale o último parecer pendente: este projeto voltou a ficar pendente há pouco e sai da janela
+        reaberto = Projeto.objects.get(titulo="Pend30")
+        Parecer.objects.create(projeto=reaberto, relator=self.relator, decisao="pendente", justificativa="x",
+                               data_parecer=hoje - timedelta(days=3))
+        del esperados["Pend30"]
+
+        with self.assertNumQueries(1):
+            avisos = Command().verificar_projetos_pendentes()
+            restantes = {a.projeto.titulo: a.descricao for a in avisos}
+
+        self.assertEqual(set(restantes), set(esperados))
+        for titulo, dias_restantes in esperados.items():
+            self.assertIn(f"(restam {dias_restantes} dias)", restantes[titulo])
+
+    def test_reexecucao_nao_reenvia(self):
+        Command().handle(por_minuto=0)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(LembreteEnviado.objects.count(), 3)
+
+        comando = Command()
+        comando.handle(por_minuto=0)
+        self.assertEqual(comando.resultados, [])
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_recupera_marcos_perdidos(self):
+        hoje = timezone.now()
+        # A rotina não rodou nos dias em que estes marcos venceram
+        atrasado = Projeto.objects.create(titulo="P183", pesquisador=self.pesq, data_submissao=hoje, status="aprovado",
+                                          data_aprovacao=(hoje - timedelta(days=183)).date(), caae=183)
+        Projeto.objects.create(titulo="P250", pesquisador=self.pesq, data_submissao=hoje, status="aprovado",
+                               data_aprovacao=(hoje - timedelta(days=250)).date(), caae=250)
+        expirado = Projeto.objects.create(titulo="Exp", pesquisador=self.pesq, data_submissao=hoje, status="pendente", caae=35)
+        Parecer.objects.create(projeto=expirado, relator=self.relator, decisao="pendente", justificativa="x",
+                               data_parecer=hoje - timedelta(days=35))
+        # Parcial do P180 já foi cobrado numa execução anterior
+        LembreteEnviado.objects.create(projeto=self.projeto_180, marco='relatorio_parcial',
+                                       referencia=timezone.localdate())
+
+        comando = Command()
+        comando.handle(por_minuto=0)
+        enviados = {(r.aviso.projeto.titulo, r.aviso.marco) for r in comando.resultados}
+        self.assertEqual(enviados, {
+            ("P183", 'relatorio_parcial'),
+            ("P365", 'relatorio_final'),
+            ("Pend", 'pendencia'),
+            ("Exp", 'pendencia_expirada'),
+        })
+        self.assertEqual(
+            LembreteEnviado.objects.get(projeto=atrasado).referencia,
+            atrasado.data_aprovacao + timedelta(days=180),
+        )
+
+        # A expiração só é avisada uma vez, mesmo em dias seguintes
+        self.assertEqual(Command().verificar_projetos_pendentes(), [])
+
+    def test_limite_por_minuto(self):
+        relogio = [0.0]
+        esperas = []
+
+        def dormir(segundos):
+            esperas.append(segundos)
+
+        limite = LimiteTaxa(30, relogio=lambda: relogio[0], dormir=dormir)
+        for _ in range(3):
+            limite.aguardar()
+        # 30 por minuto: um envio a cada 2 s, o primeiro sem espera
+        self.assertEqual(esperas, [2.0, 4.0])
+
+        relogio[0] = 60.0
+        limite.aguardar()
+        self.assertEqual(len(esperas), 2)
 
     def test_envio(self):
             GerenciadorEmails.notificacao_relatorio_aprovado(self.pesq.nome, self.projeto_180.titulo, self.pesq.email, 185, TipoRelatorio.PARCIAL)
@@ -77,3 +193,613 @@ class RotinaDiariaTest(TestCase):
 
             # Assert para verificar o número de emails enviados
             self.assertEqual(len(mail.outbox), 2)
+
+    def test_message_id_gerado_no_envio(self):
+        GerenciadorEmails.envia_email(self.pesq.email, "Assunto", "Mensagem", projeto=self.projeto_pend, remetenteEmail="cep@ufu.br")
+
+        registro = Email.objects.get()
+        self.assertEqual(mail.outbox[0].extra_headers['Message-ID'], registro.email_id)
+        # O domínio do Message-ID é o do remetente
+        self.assertTrue(registro.email_id.startswith('<') and registro.email_id.endswith('@ufu.br>'))
+
+        resposta = message_from_string(f"In-Reply-To: {registro.email_id}\nSubject: Re: Assunto\n\nOk")
+        self.assertEqual(buscar_email_original(resposta), registro)
+
+
+class BackendContador(EmailBackend):
+    """Backend em memória que conta conexões abertas e recusa um destinatário."""
+    aberturas = 0
+    recusado = None
+
+    def open(self):
+        BackendContador.aberturas += 1
+        return super().open()
+
+    def send_messages(self, messages):
+        if any(self.recusado in m.to for m in messages):
+            raise ConnectionError("SMTP indisponível")
+        return super().send_messages(messages)
+
+
+class CaixaDeSaidaTest(TestCase):
+    def setUp(self):
+        BackendContador.aberturas = 0
+        BackendContador.recusado = None
+        self.pesq = Pesquisador.objects.create(nome="Pesq", email="pesq@teste.com")
+
+    def test_view_so_enfileira(self):
+        gestor = User.objects.create_user('gestor', 'gestor@teste.com', '123')
+        gestor.groups.add(Group.objects.create(name='Gestores'))
+        projeto = Projeto.objects.create(titulo="P", descricao="", caae="1", pesquisador=self.pesq, status='em_analise')
+        self.client.force_login(gestor)
+
+        self.client.post(reverse('dar_parecer', args=[projeto.pk]), {
+            'decisao': 'pendente', 'justificativa': 'Faltam documentos', 'data_parecer': '2025-01-01T10:00',
+        })
+        self.assertEqual(len(mail.outbox), 0)
+        email = EmailSaida.objects.get()
+        self.assertEqual((email.destinatario, email.status, email.projeto), ('pesq@teste.com', 'pendente', projeto))
+
+    def test_lote_usa_uma_conexao(self):
+        for n in range(5):
+            enfileirar_email(f"p{n}@teste.com", "Assunto", "Mensagem")
+
+        enviados, falhas = enviar_lote(sessao=SessaoSMTP(BackendContador))
+        self.assertEqual((enviados, falhas), (5, 0))
+        self.assertEqual(BackendContador.aberturas, 1)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertFalse(EmailSaida.objects.exclude(status='enviado').exists())
+        self.assertEqual(
+            sorted(m.extra_headers['Message-ID'] for m in mail.outbox),
+            sorted(Email.objects.values_list('email_id', flat=True)),
+        )
+        self.assertEqual(enviar_lote(sessao=SessaoSMTP(BackendContador)), (0, 0))
+
+    def test_falha_volta_para_fila_com_espera(self):
+        BackendContador.recusado = "ruim@teste.com"
+        enfileirar_email("ruim@teste.com", "Assunto", "Mensagem")
+        enfileirar_email("bom@teste.com", "Assunto", "Mensagem")
+
+        self.assertEqual(enviar_lote(sessao=SessaoSMTP(BackendContador)), (1, 1))
+        ruim = EmailSaida.objects.get(destinatario="ruim@teste.com")
+        self.assertEqual((ruim.status, ruim.tentativas), ('pendente', 1))
+        self.assertGreater(ruim.proxima_tentativa, timezone.now())
+        self.assertIn("SMTP indisponível", ruim.ultimo_erro)
+
+        # Ainda em espera: nada a enviar agora
+        self.assertEqual(enviar_lote(sessao=SessaoSMTP(BackendContador)), (0, 0))
+
+        for _ in range(MAX_TENTATIVAS_EMAIL - 1):
+            EmailSaida.objects.filter(pk=ruim.pk).update(proxima_tentativa=timezone.now())
+            enviar_lote(sessao=SessaoSMTP(BackendContador))
+        ruim.refresh_from_db()
+        self.assertEqual((ruim.status, ruim.tentativas), ('falhou', MAX_TENTATIVAS_EMAIL))
+
+    def test_reserva_abandonada_volta_para_fila(self):
+        email = enfileirar_email("p@teste.com", "Assunto", "Mensagem")
+        EmailSaida.objects.filter(pk=email.pk).update(status='enviando', reservado_em=timezone.now() - TEMPO_RESERVA_EMAIL - timedelta(minutes=1))
+        self.assertEqual(enviar_lote(sessao=SessaoSMTP(BackendContador)), (1, 0))
+
+
+class ConexaoFalsa:
+    """Imita o smtplib.SMTP/IMAPClient só no que as sessões usam."""
+    def __init__(self):
+        self.viva = True
+
+    def noop(self):
+        if not self.viva:
+            raise ConnectionError("caiu")
+        return (250, b'OK')
+
+    def logout(self):
+        pass
+
+
+class SessoesTest(TestCase):
+    def setUp(self):
+        BackendContador.aberturas = 0
+        BackendContador.recusado = None
+
+    def test_smtp_reaproveitada(self):
+        sessao = SessaoSMTP(BackendContador)
+        for n in range(3):
+            sessao.enviar(mail.EmailMessage("A", "M", "cep@teste.com", [f"p{n}@teste.com"]))
+        self.assertEqual(BackendContador.aberturas, 1)
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_smtp_reabre_por_inatividade(self):
+        sessao = SessaoSMTP(BackendContador, tempo_ocioso=0)
+        sessao.conexao()
+        sessao.conexao()
+        self.assertEqual(BackendContador.aberturas, 2)
+
+    def test_smtp_verifica_e_reconecta(self):
+        sessao = SessaoSMTP(BackendContador)
+        backend = sessao.conexao()
+        backend.connection = ConexaoFalsa()
+        backend.connection.viva = False
+        sessao._ultimo_uso -= INTERVALO_VERIFICACAO + 1
+        self.assertIsNot(sessao.conexao(), backend)
+
+    def test_smtp_tenta_de_novo_se_cair(self):
+        class CaiUmaVez(BackendContador):
+            def send_messages(self, messages):
+                if BackendContador.aberturas == 1:
+                    raise ConnectionError("caiu")
+                return super().send_messages(messages)
+
+        SessaoSMTP(CaiUmaVez).enviar(mail.EmailMessage("A", "M", "cep@teste.com", ["p@teste.com"]))
+        self.assertEqual(BackendContador.aberturas, 2)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_imap_descarta_conexao_que_caiu(self):
+        criados = []
+        def fabrica():
+            criados.append(ConexaoFalsa())
+            return criados[-1]
+
+        sessao = SessaoIMAP("INBOX", fabrica)
+        with sessao.usar() as cliente:
+            pass
+        with sessao.usar() as mesmo:
+            self.assertIs(mesmo, cliente)
+
+        with self.assertRaises(ConnectionError):
+            with sessao.usar():
+                raise ConnectionError("caiu")
+        with sessao.usar() as novo:
+            self.assertIsNot(novo, cliente)
+        self.assertEqual(len(criados), 2)
+
+
+def _estrutura_de(parte):
+    """BODYSTRUCTURE no formato do IMAPClient para um email.message.Message."""
+    def parametros(itens):
+        return tuple(v.encode() for par in itens for v in par) or None
+
+    if parte.is_multipart():
+        return ([_estrutura_de(p) for p in parte.get_payload()], parte.get_content_subtype().encode(),
+                parametros([('boundary', parte.get_boundary())]), None, None, None)
+
+    bruto = parte.get_payload().encode()
+    params = parametros([(k, v) for k, v in parte.get_params()[1:]] if parte.get_params() else [])
+    disposicao = None
+    if parte.get_content_disposition():
+        nome = parte.get_filename()
+        disposicao = (parte.get_content_disposition().encode(), (b'filename', nome.encode()) if nome else None)
+    encoding = (parte.get('Content-Transfer-Encoding') or '7bit').encode()
+    base = (parte.get_content_maintype().encode(), parte.get_content_subtype().encode(), params, None, None, encoding, len(bruto))
+    if parte.get_content_maintype() == 'text':
+        return base + (bruto.count(b'\n'), None, disposicao, None, None)
+    return base + (None, disposicao, None, None)
+
+
+def _parte_por_numero(msg, numero):
+    parte = msg
+    for indice in numero.split('.'):
+        if parte.is_multipart():
+            parte = parte.get_payload()[int(indice) - 1]
+    return parte
+
+
+class CaixaIMAPFalsa:
+    """
+    Pasta IMAP em memória com a parte da API do IMAPClient usada na leitura:
+    UIDs crescentes, UIDVALIDITY, HIGHESTMODSEQ opcional, "UID n:*",
+    cabeçalhos, BODYSTRUCTURE e fetch parcial BODY[n]<início.tamanho>.
+    """
+    def __init__(self, uidvalidity=1, condstore=False):
+        self.uidvalidity = uidvalidity
+        self.condstore = condstore
+        self.mensagens = {}
+        self.proximo_uid = 1
+        self.modseq = 1
+        self.flags = {}
+        self.buscas = []
+        self.buscados = []
+        self.pedidos = []
+        self.marcacoes = []
+
+    def adicionar(self, message_id, assunto="Assunto", in_reply_to=None, mensagem=None, references=None):
+        if mensagem is None:
+            cabecalhos = f"Message-ID: {message_id}\nFrom: p@teste.com\nTo: cep@example.com\nSubject: {assunto}\n"
+            if in_reply_to:
+                cabecalhos += f"In-Reply-To: {in_reply_to}\n"
+            if references:
+                cabecalhos += f"References: {references}\n"
+            mensagem = message_from_string(cabecalhos + "\nCorpo")
+        else:
+            mensagem['Message-ID'] = message_id
+        self.mensagens[self.proximo_uid] = mensagem
+        self.proximo_uid += 1
+        self.modseq += 1
+
+    def select_folder(self, mailbox, readonly=False):
+        estado = {b'UIDVALIDITY': self.uidvalidity, b'UIDNEXT': self.proximo_uid, b'EXISTS': len(self.mensagens)}
+        if self.condstore:
+            estado[b'HIGHESTMODSEQ'] = self.modseq
+        return estado
+
+    def search(self, criterios):
+        self.buscas.append(criterios)
+        inicio = int(criterios[1].split(':')[0])
+        uids = [uid for uid in self.mensagens if uid >= inicio]
+        return uids or ([max(self.mensagens)] if self.mensagens else [])
+
+    def _item(self, msg, pedido):
+        if pedido == 'BODY.PEEK[HEADER]':
+            return b'BODY[HEADER]', msg.as_bytes().split(b'\n\n', 1)[0] + b'\n\n'
+        if pedido == 'BODYSTRUCTURE':
+            return b'BODYSTRUCTURE', _estrutura_de(msg)
+        numero, faixa = re.match(r'BODY\.PEEK\[([\d.]+)\]<(\d+\.\d+)>', pedido).groups()
+        inicio, tamanho = map(int, faixa.split('.'))
+        bruto = _parte_por_numero(msg, numero).get_payload().encode()
+        return f'BODY[{numero}]<{inicio}>'.encode(), bruto[inicio:inicio + tamanho]
+
+    def fetch(self, uids, partes):
+        uids = uids if isinstance(uids, list) else [uids]
+        self.pedidos.extend(partes)
+        if 'BODYSTRUCTURE' in partes:
+            self.buscados.extend(uids)
+        return {uid: dict(self._item(self.mensagens[uid], p) for p in partes) for uid in uids}
+
+    def add_flags(self, uids, flags):
+        self.marcacoes.append(uids)
+        self.modseq += 1
+        for uid in (uids if isinstance(uids, list) else [uids]):
+            self.flags.setdefault(uid, set()).update(flags)
+
+    def noop(self):
+        return (b'OK', [])
+
+    def logout(self):
+        pass
+
+
+class SincronizacaoCaixaTest(TestCase):
+    def test_mensagem_com_erro_tentada_de_novo(self):
+        caixa = CaixaIMAPFalsa()
+        for n in range(3):
+            caixa.adicionar(f"<{n}@teste.com>")
+
+        def baixar_com_erro(clienteEmail, uid, estrutura):
+            if uid == 2:
+                raise OperationalError("database is locked")
+            return baixar_conteudo(clienteEmail, uid, estrutura)
+
+        with patch('emails.imapUtils.baixar_conteudo', side_effect=baixar_com_erro), \
+             self.assertLogs('emails.imapUtils', 'ERROR'):
+            self.assertEqual(sincronizar_caixa(caixa, "INBOX"), 2)
+
+        checkpoint = SincronizacaoCaixa.objects.get(mailbox="INBOX")
+        # O ponto de parada não fica preso na que falhou; ela fica pendente e não lida
+        self.assertEqual((checkpoint.ultimo_uid, checkpoint.uids_pendentes), (3, {'2': 1}))
+        self.assertNotIn(2, caixa.flags)
+
+        self.assertEqual(sincronizar_caixa(caixa, "INBOX"), 1)
+        self.assertTrue(Email.objects.filter(email_id="<1@teste.com>").exists())
+        self.assertIn(b'\\Seen', caixa.flags[2])
+        self.assertEqual(SincronizacaoCaixa.objects.get(mailbox="INBOX").uids_pendentes, {})
+
+    def test_mensagem_abandonada_apos_limite(self):
+        caixa = CaixaIMAPFalsa()
+        caixa.adicionar("<ok@teste.com>")
+        caixa.adicionar("<ruim@teste.com>")
+
+        def baixar_com_erro(clienteEmail, uid, estrutura):
+            if uid == 2:
+                raise ValueError("BODYSTRUCTURE inválido")
+            return baixar_conteudo(clienteEmail, uid, estrutura)
+
+        with patch('emails.imapUtils.baixar_conteudo', side_effect=baixar_com_erro), \
+             self.assertLogs('emails.imapUtils', 'ERROR') as logs:
+            for _ in range(MAX_TENTATIVAS_IMAP):
+                sincronizar_caixa(caixa, "INBOX")
+
+        self.assertIn("abandonada", logs.output[-1])
+        self.assertEqual(SincronizacaoCaixa.objects.get(mailbox="INBOX").uids_pendentes, {})
+        self.assertNotIn(2, caixa.flags)
+        buscados = len(caixa.buscados)
+        self.assertEqual(sincronizar_caixa(caixa, "INBOX"), 0)
+        self.assertEqual(len(caixa.buscados), buscados)
+
+    def test_busca_apenas_uids_novos(self):
+        caixa = CaixaIMAPFalsa()
+        caixa.adicionar("<a@teste.com>")
+        caixa.adicionar("<b@teste.com>")
+
+        self.assertEqual(sincronizar_caixa(caixa, "INBOX"), 2)
+        self.assertEqual(SincronizacaoCaixa.objects.get(mailbox="INBOX").ultimo_uid, 2)
+
+        # Nada novo: nem chega a buscar
+        self.assertEqual(sincronizar_caixa(caixa, "INBOX"), 0)
+        self.assertEqual(len(caixa.buscas), 1)
+
+        caixa.adicionar("<c@teste.com>")
+        caixa.buscados.clear()
+        self.assertEqual(sincronizar_caixa(caixa, "INBOX"), 1)
+        self.assertEqual(caixa.buscados, [3])
+        self.assertEqual(Email.objects.count(), 3)
+
+    def test_uidvalidity_novo_rele_sem_duplicar(self):
+        caixa = CaixaIMAPFalsa()
+        caixa.adicionar("<a@teste.com>")
+        sincronizar_caixa(caixa, "INBOX")
+
+        caixa.uidvalidity = 2
+        caixa.adicionar("<b@teste.com>")
+        self.assertEqual(sincronizar_caixa(caixa, "INBOX"), 1)
+        self.assertEqual(sorted(caixa.buscados), [1, 1, 2])
+        self.assertEqual(Email.objects.count(), 2)
+        self.assertEqual(SincronizacaoCaixa.objects.get().uidvalidity, 2)
+
+    def test_modseq_sem_mudanca_nao_busca(self):
+        caixa = CaixaIMAPFalsa(condstore=True)
+        caixa.adicionar("<a@teste.com>")
+        sincronizar_caixa(caixa, "INBOX")
+        self.assertEqual(SincronizacaoCaixa.objects.get().modseq, 2)
+
+        # Servidor sem UIDNEXT: só o HIGHESTMODSEQ diz que nada mudou
+        caixa.select_folder = lambda mailbox, readonly=False: {b'UIDVALIDITY': 1, b'HIGHESTMODSEQ': 2}
+        buscas = len(caixa.buscas)
+        self.assertEqual(sincronizar_caixa(caixa, "INBOX"), 0)
+        self.assertEqual(len(caixa.buscas), buscas)
+
+    def test_resposta_associada_ao_original(self):
+        original = Email.objects.create(remetente="cep@example.com", destinatario="p@teste.com", assunto="Aviso", mensagem="", email_id="<orig@example.com>")
+        caixa = CaixaIMAPFalsa()
+        caixa.adicionar("<r@teste.com>", "Re: Aviso", in_reply_to="<orig@example.com>")
+        sincronizar_caixa(caixa, "INBOX")
+        self.assertEqual(Email.objects.get(email_id="<r@teste.com>").email_original, original)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class LeituraPorPartesTest(TestCase):
+    def mensagem_com_anexo(self, conteudo):
+        mensagem = MensagemMIME()
+        mensagem['From'] = "p@teste.com"
+        mensagem['To'] = "cep@example.com"
+        mensagem['Subject'] = "Documentos"
+        mensagem.set_content("Segue o protocolo em anexo. Ação necessária.", cte='quoted-printable')
+        mensagem.add_attachment(conteudo, maintype='application', subtype='pdf', filename='protocolo.pdf')
+        return mensagem
+
+    def test_anexo_baixado_em_pedacos(self):
+        conteudo = os.urandom(50_000)
+        caixa = CaixaIMAPFalsa()
+        caixa.adicionar("<anexo@teste.com>", mensagem=self.mensagem_com_anexo(conteudo))
+
+        with patch('emails.imapPartes.TAMANHO_PEDACO_ANEXO', 4096):
+            self.assertEqual(sincronizar_caixa(caixa, "INBOX"), 1)
+
+        email = Email.objects.get()
+        self.assertEqual(email.mensagem, "Segue o protocolo em anexo. Ação necessária.")
+        anexo = email.anexos.get()
+        self.assertEqual(anexo.caminhoArquivo, 'protocolo.pdf')
+        with anexo.arquivo.open('rb') as arquivo:
+            self.assertEqual(arquivo.read(), conteudo)
+
+        pedidos_anexo = [p for p in caixa.pedidos if p.startswith('BODY.PEEK[2]')]
+        self.assertGreater(len(pedidos_anexo), 10)
+        self.assertNotIn('RFC822', caixa.pedidos)
+
+    def test_falha_nos_anexos_volta_para_a_fila(self):
+        conteudo = os.urandom(5_000)
+        caixa = CaixaIMAPFalsa()
+        caixa.adicionar("<anexo@teste.com>", mensagem=self.mensagem_com_anexo(conteudo))
+        caixa.adicionar("<r@teste.com>", "Re: Documentos", in_reply_to="<anexo@teste.com>")
+
+        def salvar_com_erro(baixados, email_obj):
+            if baixados:
+                raise OSError("disco cheio")
+
+        with patch('emails.imapUtils.salvar_anexos', side_effect=salvar_com_erro), \
+             self.assertLogs('emails.imapUtils', 'ERROR'):
+            self.assertEqual(sincronizar_caixa(caixa, "INBOX"), 0)
+
+        # A resposta do mesmo lote volta junto com o original, para ser ligada a ele depois
+        self.assertFalse(Email.objects.exists())
+        self.assertEqual(SincronizacaoCaixa.objects.get(mailbox="INBOX").uids_pendentes, {'1': 1, '2': 1})
+        self.assertEqual(caixa.flags, {})
+
+        self.assertEqual(sincronizar_caixa(caixa, "INBOX"), 2)
+        original = Email.objects.get(email_id="<anexo@teste.com>")
+        self.assertEqual(original.anexos.count(), 1)
+        self.assertEqual(Email.objects.get(email_id="<r@teste.com>").email_original, original)
+
+    def test_mensagem_conhecida_nao_baixa_corpo(self):
+        Email.objects.create(remetente="p@teste.com", destinatario="cep@example.com", assunto="", mensagem="", email_id="<anexo@teste.com>")
+        caixa = CaixaIMAPFalsa()
+        caixa.adicionar("<anexo@teste.com>", mensagem=self.mensagem_com_anexo(b'x' * 1000))
+
+        self.assertEqual(sincronizar_caixa(caixa, "INBOX"), 0)
+        self.assertEqual(caixa.pedidos, ['BODY.PEEK[HEADER]', 'BODYSTRUCTURE'])
+
+    def test_anexo_repetido_guardado_uma_vez(self):
+        conteudo = os.urandom(20_000)
+        caixa = CaixaIMAPFalsa()
+        caixa.adicionar("<a@teste.com>", mensagem=self.mensagem_com_anexo(conteudo))
+        caixa.adicionar("<b@teste.com>", mensagem=self.mensagem_com_anexo(conteudo))
+        sincronizar_caixa(caixa, "INBOX")
+
+        # Um envio com o mesmo arquivo também reaproveita o conteúdo
+        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as arquivo:
+            arquivo.write(conteudo)
+        self.addCleanup(os.remove, arquivo.name)
+        GerenciadorEmails.envia_email("p@teste.com", "Protocolo", "Segue.", caminhoArquivos=[arquivo.name])
+
+        guardado = ConteudoAnexo.objects.get()
+        self.assertEqual(guardado.referencias, 3)
+        self.assertEqual(guardado.tamanho, len(conteudo))
+        self.assertEqual({a.arquivo.name for a in AnexoEmail.objects.all()}, {guardado.arquivo.name})
+
+        caminho = guardado.arquivo.path
+        with self.captureOnCommitCallbacks(execute=True):
+            Email.objects.get(email_id="<a@teste.com>").delete()
+        guardado.refresh_from_db()
+        self.assertEqual(guardado.referencias, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Email.objects.filter(anexos__isnull=False).delete()
+        self.assertFalse(ConteudoAnexo.objects.exists())
+        self.assertFalse(os.path.exists(caminho))
+
+
+class ProcessamentoEmLoteTest(TestCase):
+    def setUp(self):
+        self.aviso = Email.objects.create(remetente="cep@example.com", destinatario="p@teste.com", assunto="Aviso", mensagem="", email_id="<aviso@example.com>")
+        self.lembrete = Email.objects.create(remetente="cep@example.com", destinatario="p@teste.com", assunto="Lembrete", mensagem="", email_id="<lembrete@example.com>")
+
+    def test_consultas_e_flags_por_lote(self):
+        caixa = CaixaIMAPFalsa()
+        for n in range(30):
+            caixa.adicionar(f"<r{n}@teste.com>", "Re: Aviso", in_reply_to="<aviso@example.com>")
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(processar_emails(caixa, list(range(1, 31))), 30)
+        # Um SELECT (já gravados + originais) e um INSERT em lote, não um por mensagem
+        consultas = [q['sql'] for q in ctx.captured_queries if 'emails_email' in q['sql']]
+        self.assertEqual(len(consultas), 2)
+        self.assertEqual(caixa.marcacoes, [list(range(1, 31))])
+        self.assertEqual(self.aviso.respostas.count(), 30)
+
+    def test_threading_por_references(self):
+        caixa = CaixaIMAPFalsa()
+        # Sem In-Reply-To: o pai é o último id de References que conhecemos
+        caixa.adicionar("<r1@teste.com>", "Re: Lembrete", references="<aviso@example.com> <lembrete@example.com> <desconhecido@x.com>")
+        # Resposta a uma mensagem que chegou no mesmo lote
+        caixa.adicionar("<r2@teste.com>", "Re: Re: Lembrete", in_reply_to="<r1@teste.com>")
+        sincronizar_caixa(caixa, "INBOX")
+
+        r1 = Email.objects.get(email_id="<r1@teste.com>")
+        self.assertEqual(r1.email_original, self.lembrete)
+        self.assertEqual(Email.objects.get(email_id="<r2@teste.com>").email_original, r1)
+
+
+
+class CaixaIMAPComIdle(CaixaIMAPFalsa):
+    """
+    CaixaIMAPFalsa com IDLE. Cada idle_check consome um passo do roteiro:
+    uma função (que pode alterar a caixa e devolve as respostas do servidor)
+    ou uma exceção a levantar. Com o roteiro vazio, o ouvinte é parado.
+    """
+    def __init__(self, roteiro=(), **kwargs):
+        super().__init__(**kwargs)
+        self.roteiro = list(roteiro)
+        self.ouvinte = None
+        self.idles = 0
+
+    def has_capability(self, capacidade):
+        return capacidade == 'IDLE'
+
+    def idle(self):
+        self.idles += 1
+
+    def idle_check(self, timeout=None):
+        if not self.roteiro:
+            self.ouvinte.parar.set()
+            return []
+        passo = self.roteiro.pop(0)
+        if isinstance(passo, Exception):
+            raise passo
+        return passo()
+
+    def idle_done(self):
+        return (b'OK', [])
+
+
+class OuvinteIMAPTest(TestCase):
+    def _ouvinte(self, caixa, fabrica=None, **kwargs):
+        sessao = SessaoIMAP("INBOX", fabrica=fabrica or (lambda: caixa))
+        ouvinte = OuvinteIMAP("INBOX", sessao=sessao, espera_reconexao=0, **kwargs)
+        caixa.ouvinte = ouvinte
+        return ouvinte
+
+    def test_sincroniza_quando_chega_mensagem(self):
+        caixa = CaixaIMAPComIdle()
+        caixa.adicionar("<a@teste.com>")
+
+        def chega_mensagem():
+            caixa.adicionar("<b@teste.com>")
+            return [(2, b'EXISTS')]
+
+        caixa.roteiro = [lambda: [(b'OK', b'Still here')], chega_mensagem]
+        self._ouvinte(caixa).executar()
+
+        self.assertTrue(Email.objects.filter(email_id="<a@teste.com>").exists())
+        self.assertTrue(Email.objects.filter(email_id="<b@teste.com>").exists())
+        # Sincronização inicial + uma por EXISTS; o keepalive não gera busca
+        self.assertEqual(len(caixa.buscas), 2)
+        self.assertEqual(caixa.idles, 2)
+
+    def test_reconecta_e_ressincroniza(self):
+        caixa = CaixaIMAPComIdle(roteiro=[ConnectionError("conexão perdida")])
+        conexoes_abertas = []
+
+        def fabrica():
+            if conexoes_abertas:
+                # Chegou enquanto o ouvinte estava desconectado
+                caixa.adicionar("<offline@teste.com>")
+            conexoes_abertas.append(caixa)
+            return caixa
+
+        ouvinte = self._ouvinte(caixa, fabrica=fabrica)
+        ouvinte.executar()
+
+        self.assertEqual(len(conexoes_abertas), 2)
+        self.assertEqual(ouvinte.falhas, 0)
+        self.assertTrue(Email.objects.filter(email_id="<offline@teste.com>").exists())
+
+    def test_erro_inesperado_nao_encerra_o_ouvinte(self):
+        caixa = CaixaIMAPComIdle()
+        caixa.adicionar("<a@teste.com>")
+        falhas = [OperationalError("server closed the connection unexpectedly")]
+
+        def sincronizar(clienteEmail, mailbox):
+            if falhas:
+                raise falhas.pop()
+            return sincronizar_caixa(clienteEmail, mailbox)
+
+        ouvinte = self._ouvinte(caixa)
+        with patch('emails.ouvinteImap.sincronizar_caixa', side_effect=sincronizar), \
+             self.assertLogs('emails.ouvinteImap', 'ERROR'):
+            ouvinte.executar()
+
+        self.assertEqual(ouvinte.falhas, 0)
+        self.assertTrue(Email.objects.filter(email_id="<a@teste.com>").exists())
+
+    def test_renova_idle_periodicamente(self):
+        caixa = CaixaIMAPComIdle(roteiro=[lambda: []] * 3)
+        self._ouvinte(caixa, renovar_idle=0).executar()
+        self.assertEqual(caixa.idles, 4)
+        # Renovar o IDLE não dispara sincronização; só a inicial buscou
+        self.assertEqual(len(caixa.buscas), 1)
+
+
+class NotificacoesTest(TestCase):
+    def test_modelo_compilado_uma_vez(self):
+        with patch('emails.notificacoes.get_template', wraps=get_template) as carregar, \
+             patch.dict('emails.notificacoes._modelos', clear=True):
+            modelo = modelo_notificacao('relatorio_pendente')
+            renderizados = modelo.renderizar_lote([
+                {'nome_pesquisador': f"P{n}", 'nome_pesquisa': "Estudo <A&B>", 'dias_restantes': n} for n in range(50)
+            ])
+            self.assertIs(modelo_notificacao('relatorio_pendente'), modelo)
+        # Texto e HTML carregados só uma vez para o lote todo
+        self.assertEqual(carregar.call_count, 2)
+
+        assunto, texto, html = renderizados[3]
+        self.assertEqual(assunto, "Aviso sobre pendência na pesquisa 'Estudo <A&B>'")
+        self.assertIn("é de 3 dias", texto)
+        self.assertIn("Estudo &lt;A&amp;B&gt;", html)
+        self.assertIn("expirou", renderizados[0][1])
+
+    def test_envio_com_alternativa_html(self):
+        enfileirar_email("p@teste.com", "Assunto", "Texto", mensagem_html="<p>Texto</p>")
+        enviar_lote()
+        GerenciadorEmails.notificacao_relatorio_aprovado("Ana", "Estudo", "p@teste.com", 30, TipoRelatorio.PARCIAL)
+
+        self.assertEqual(len(mail.outbox), 2)
+        for enviado in mail.outbox:
+            self.assertEqual(enviado.alternatives[0][1], 'text/html')
+        self.assertEqual(mail.outbox[1].subject, "Solicitação de envio do relatório parcial")
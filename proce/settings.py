@@ -72,8 +72,12 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.ContadorConsultasMiddleware',
 ]
 
+# Acima deste número de consultas SQL por requisição o ContadorConsultasMiddleware registra um aviso
+LIMITE_CONSULTAS_POR_REQUISICAO = config('LIMITE_CONSULTAS_POR_REQUISICAO', default=30, cast=int)
+
 ROOT_URLCONF = 'proce.urls'
 
 TEMPLATES = [
@@ -109,6 +113,19 @@ DATABASES = {
 }
 
 
+# Cache compartilhado entre os workers do gunicorn (estatísticas de relatores etc.).
+# A tabela é criada com `python manage.py createcachetable`.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.db.DatabaseCache'),
+        'LOCATION': config('CACHE_LOCATION', default='proce_cache'),
+    }
+}
+
+# Validade (segundos) das estatísticas de carga dos relatores no dashboard do gestor
+TEMPO_CACHE_ESTATISTICAS_RELATORES = config('TEMPO_CACHE_ESTATISTICAS_RELATORES', default=3600, cast=int)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
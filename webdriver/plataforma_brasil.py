@@ -1,14 +1,13 @@
-from time import sleep
 from enum import StrEnum
 
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.common.exceptions import NoSuchElementException, TimeoutException
+from selenium.common.exceptions import NoSuchElementException, TimeoutException, WebDriverException
 
-from core.models import Projeto
+from core.protocolos import gravar_protocolos, protocolos_conhecidos
+from webdriver.waits import WaitEngine
 from sistema_logs.models import Logs
 
 
@@ -24,6 +23,61 @@ apreciacao_map = {
     'Nc': 'Notificação de Centro Coparticipante'
 }
 
+TABLE_ID = "formConsultarProtocoloPesquisa:tabelaResultado:tb"
+# Protocolos lidos acumulados antes de cada gravação em lote
+SAVE_BATCH_SIZE = 25
+
+# Posição de cada coluna na tabela de protocolos da aba CEP
+FIELD_MAP = {
+    'apreciacao': 0,
+    'tipo': 1,
+    'caae': 2,
+    'pesquisador': 3,
+    'versao': 4,
+    'data_aceite': 5,
+    'data_ultima_submissao': 6,
+    'data_ultima_modificacao': 7,
+    'data_primeira_submissao': 8,
+    'relator': 9,
+    'situacao': 10,
+    'nota_tecnica': 11,
+    'acao': 12
+}
+
+# Texto de todas as células do tbody, linha a linha, numa única ida ao navegador
+READ_TABLE_SCRIPT = """
+var tbody = document.getElementById(arguments[0]);
+if (!tbody) { return null; }
+return Array.prototype.map.call(tbody.rows, function (tr) {
+    return Array.prototype.map.call(tr.cells, function (td) {
+        return (td.innerText || td.textContent || '').trim();
+    });
+});
+"""
+
+
+def rows_from_cells(table):
+    """Converte a matriz de textos da tabela em registros {campo: texto, 'index': linha}."""
+    records = []
+    for index, cells in enumerate(table):
+        if not cells or len(cells) <= FIELD_MAP['acao']:
+            continue
+        records.append({'index': index, **{field: cells[pos] for field, pos in FIELD_MAP.items()}})
+    return records
+
+
+def changed_records(records, known):
+    """Registros cujo CAAE é novo ou cuja versão/data de modificação mudou desde `known`."""
+    changed = []
+    for record in records:
+        if record['caae'] not in known:
+            changed.append(record)
+            continue
+        signature = known[record['caae']]
+        if signature is not None and signature != (record['versao'], record['data_ultima_modificacao']):
+            changed.append(record)
+    return changed
+
 class EnumSituacao(StrEnum):
     PENDENTE = "Relatoria Recusada"
     APROVADO = "Relatoria Aprovada"
@@ -35,7 +89,7 @@ class InvalidInputError(Exception):
 class PlataformaBrasilService:
     base_url = "https://plataformabrasil.saude.gov.br/"
 
-    def __init__(self, user_email = None, user_password = None, headless = True):
+    def __init__(self, user_email = None, user_password = None, headless = True, timeouts = None):
         chrome_options = Options()
         chrome_options.add_argument("--disable-dev-shm-usage")
         chrome_options.add_argument("--no-sandbox")
@@ -43,8 +97,10 @@ class PlataformaBrasilService:
             chrome_options.add_argument("--headless")
 
         self.driver = webdriver.Chrome(options=chrome_options)
+        self.waits = WaitEngine(self.driver, timeouts)
         self.logged = False
         self.projects = None
+        self.last_sync = None
         self.user_email = user_email
         self.user_password = user_password
 
@@ -54,6 +110,34 @@ class PlataformaBrasilService:
         except Exception as e:
             print(e)
 
+    def is_alive(self):
+        """False se o Chrome caiu ou a sessão do WebDriver não responde mais."""
+        try:
+            self.driver.current_url
+            return True
+        except WebDriverException:
+            return False
+
+    def is_logged_in(self):
+        return bool(self.driver.find_elements(By.ID, "menu_perfil"))
+
+    def restore_cookies(self, cookies):
+        """Reaplica os cookies de uma sessão anterior; devolve True se isso bastou para estar logado."""
+        for cookie in cookies:
+            try:
+                self.driver.add_cookie(cookie)
+            except WebDriverException:
+                pass
+        self.open()
+        self.logged = self.is_logged_in()
+        return self.logged
+
+    def quit(self):
+        try:
+            self.driver.quit()
+        except Exception:
+            pass
+
     def open(self, url = base_url):
         self.driver.get(url)
         return self
@@ -64,20 +148,14 @@ class PlataformaBrasilService:
         return self
     
     def check_alerts(self):
-        wait = WebDriverWait(self.driver, 3)
-       
         try:
-            modal = wait.until(
-                EC.presence_of_element_located(
-                    (By.ID, "modalMsgContainer")
-                )
-            )
+            modal = self.waits.until('alert', EC.presence_of_element_located((By.ID, "modalMsgContainer")))
             msg_body = modal.find_element(By.CLASS_NAME, "rich-mpnl-body")
         
             print(msg_body.text)
             botao_fechar = modal.find_element(By.ID, "formModalMensagemAviso:botaoFecharModal")
             botao_fechar.click()
-            wait.until(EC.invisibility_of_element_located((By.ID, "modalMsg")))
+            self.waits.until('alert', EC.invisibility_of_element_located((By.ID, "modalMsg")))
         
             return self
 
@@ -99,14 +177,20 @@ class PlataformaBrasilService:
             email_input.send_keys(self.user_email)
             password_input.send_keys(self.user_password)
             login_button.click()
-            self.logger = True
+
+            # Termina assim que aparece o menu do usuário (sucesso) ou o painel de mensagem (erro)
+            try:
+                self.waits.until('login', EC.any_of(
+                    EC.presence_of_element_located((By.ID, "menu_perfil")),
+                    EC.presence_of_element_located((By.ID, "idPainelMensagem")),
+                ))
+            except TimeoutException:
+                raise NoSuchElementException("Nenhuma resposta ao login")
 
             if self.driver.find_element(By.ID, "menu_perfil"):
                 print("Login sucedido")
                 self.logged = True
 
-            sleep(5)
-
             return self
         
         except NoSuchElementException:
@@ -136,17 +220,15 @@ class PlataformaBrasilService:
         search_menu_button = self.driver.find_element(By.CSS_SELECTOR, "a.pesquisas.das-texto.formatoGG")
         search_menu_button.click()
 
-        search_name_input = self.driver.find_element(By.NAME, "formPesquisarProjPesquisa:j_id71")
+        search_name_input = self.waits.until('search', EC.element_to_be_clickable((By.NAME, "formPesquisarProjPesquisa:j_id71")))
         search_name_input.send_keys(name)
         
         
         search_action_button = self.driver.find_element(By.ID, "formPesquisarProjPesquisa:idBtnPesquisar")
+        self.waits.idle('search')
         search_action_button.click()
 
-        sleep(60)
-
-        table = self.driver.find_element(By.ID, "formPesquisarProjPesquisa:tabelaResultado:tb")
-        row = table.find_elements(By.TAG_NAME, "tr")
+        row = self.waits.rows('search', (By.ID, "formPesquisarProjPesquisa:tabelaResultado:tb"))
 
         for tr in row:
             cells = tr.find_elements(By.TAG_NAME, "td")
@@ -157,114 +239,110 @@ class PlataformaBrasilService:
 
         return self
     
-    def fetch_projects_form_table(self):
+    def read_table(self, table_id = TABLE_ID):
+        """
+        Lê a tabela de resultados inteira numa única chamada execute_script
+        (em vez de um find_element/.text por célula) e devolve um registro
+        por linha.
+        """
+        return rows_from_cells(self.driver.execute_script(READ_TABLE_SCRIPT, table_id) or [])
+
+    def fetch_project_details(self, record):
+        """Abre o detalhe da linha, lê e-mail e telefone do pesquisador e volta para a tabela."""
+        detalhes = self.driver.find_element(
+            By.XPATH, f"//tbody[@id='{TABLE_ID}']/tr[{record['index'] + 1}]/td[{FIELD_MAP['acao'] + 1}]//a"
+        )
+        detalhes.click()
+        painel = self.waits.until('detail', EC.presence_of_element_located((By.ID, "idPanelDetalharPesquisador")))
+
+        (
+            self.driver
+                .find_element(By.ID, "idPanelDetalharPesquisador")
+                .find_elements(By.TAG_NAME, "a")[0]
+                .click
+        )
+        
+        email_pesquisador = self.driver.find_element(
+            By.XPATH,
+            "//td[b[normalize-space()='E-mail:']]"
+        ).text.split("E-mail:")[1].strip()
+
+        telefone_pesquisador = self.driver.find_element(
+            By.XPATH,
+            "//td[b[normalize-space()='Telefone:']]"
+        ).text.split("Telefone:")[1].strip()
+
+        self.driver.back()
+        self.waits.until('back', EC.staleness_of(painel))
+        self.waits.rows('back', (By.ID, TABLE_ID))
+
+        return {**record, 'email_pesquisador': email_pesquisador, 'telefone_pesquisador': telefone_pesquisador}
+
+    def save_projects(self, records):
+        if records:
+            self.last_sync['salvos'] += gravar_protocolos(records)
+            # Sem e-mail do pesquisador o protocolo não é gravado e volta na próxima sincronização
+            self.last_sync['falhas'] += sum(1 for record in records if not record.get('email_pesquisador'))
+
+    def fetch_projects_form_table(self, known = None, progress = None):
+        """
+        Busca os protocolos da aba CEP. `known` é {caae: (versao, data_ultima_modificacao)}
+        do que já foi importado (valor None = só se sabe que existe); sem ele,
+        usa a foto da última sincronização. Só as linhas novas ou alteradas
+        abrem o detalhe, e são gravadas em lotes de SAVE_BATCH_SIZE (uma
+        falha no meio não perde o que já foi lido). `progress(feitos, total)`
+        é chamado a cada linha processada; o resumo fica em `last_sync`.
+        """
         if not self.logged:
-            self.login(self.user_email, self.user_password)
-
-        field_map = {
-            'apreciacao': 0,
-            'tipo': 1,
-            'caae': 2,
-            'pesquisador': 3,
-            'versao': 4,
-            'data_aceite': 5,
-            'data_ultima_submissao': 6,
-            'data_ultima_modificacao': 7,
-            'data_primeira_submissao': 8,
-            'relator': 9,
-            'situacao': 10,
-            'nota_tecnica': 11,
-            'acao': 12
-        }
+            self.login()
+
+        if known is None:
+            known = protocolos_conhecidos()
 
         try:
             cep_tab = self.driver.find_element(By.ID, "formPesquisador:idLinkAbaCepAtiva")
             cep_tab.click()
-            sleep(2)
 
-            checkbox = self.driver.find_element(By.ID, "formConsultarProtocoloPesquisa:j_id323:1:idItem")
+            checkbox = self.waits.until('table', EC.element_to_be_clickable((By.ID, "formConsultarProtocoloPesquisa:j_id323:1:idItem")))
             search_button = self.driver.find_element(By.ID, "formConsultarProtocoloPesquisa:idBtnBuscar")
             
             checkbox.click()            
+            self.waits.idle('table')
             search_button.click()
-            
-            sleep(5)
-
-            table = self.driver.find_element(By.ID, "formPesquisador:tabelaResultado:tb")
-            sleep(3)
 
-            table = self.driver.find_element(By.ID, "formConsultarProtocoloPesquisa:tabelaResultado:tb")
-            if not table:
-                print("Tabela nao encontrada")
-                return self
-            rows = table.find_elements(By.TAG_NAME, "tr")
-            row_count = len(rows)
-
-        except:
-            pass
-    
-        for i in range(len(row_count)):
-            try:
-                table = self.driver.find_element(By.ID, "formConsultarProtocoloPesquisa:tabelaResultado:tb")
-                rows = table.find_elements(By.TAG_NAME, "tr")
+            self.waits.rows('table', (By.ID, TABLE_ID))
+            records = self.read_table()
 
-                row = rows[i]
-                cells = row.find_elements(By.TAG_NAME, "td")
-                if not cells or len(cells) <= 12:
-                    continue
+        except TimeoutException:
+            print("Tabela nao encontrada")
+            return self
 
-                caae = cells[field_map['caae']].text
-                pesquisador = cells[field_map['pesquisador']].text
-                data_parecer = cells[field_map['data_ultima_modificacao']].text
-                parecer = cells[field_map['situacao']].text
-                relator = cells[field_map['relator']].text
-                data_aprovacao = None
+        changed = changed_records(records, known)
+        print(f"{len(records)} protocolo(s) na tabela, {len(changed)} novo(s) ou alterado(s)")
+        self.last_sync = {'linhas': len(records), 'alterados': len(changed), 'salvos': 0, 'falhas': 0}
+        if progress:
+            progress(0, len(changed))
 
-                if parecer == EnumSituacao.APROVADO:
-                    data_aprovacao = cells[field_map['data_ultima_modificacao']].text
+        batch = []
+        for done, record in enumerate(changed, start=1):
+            try:
+                batch.append(self.fetch_project_details(record))
 
-            
-                detalhes = cells[field_map['acao']].find_elements(By.TAG_NAME, "a")[0]
-                detalhes.click()
-                sleep(1)
-
-                (
-                    self.driver
-                        .find_element(By.ID, "idPanelDetalharPesquisador")
-                        .find_elements(By.TAG_NAME, "a")[0]
-                        .click
-                )
-                
-                email_pesquisador = self.driver.find_element(
-                    By.XPATH,
-                    "//td[b[normalize-space()='E-mail:']]"
-                ).text.split("E-mail:")[1].strip()
-
-                telefone_pesquisador = self.driver.find_element(
-                    By.XPATH,
-                    "//td[b[normalize-space()='Telefone:']]"
-                ).text.split("Telefone:")[1].strip()
-
-                self.driver.back()
-                sleep(1)
-
-                Projeto.objects.create(
-                    caae=caae,
-                    pesquisador=pesquisador,
-                    data_parecer=data_parecer,
-                    parecer=parecer,
-                    relator=relator,
-                    data_aprovacao=data_aprovacao,
-                    email_pesquisador=email_pesquisador,
-                    telefone_pesquisador=telefone_pesquisador
-                )
-                
             except NoSuchElementException as e:
                 print(f"Elemento nao encontrado: {e}")
-                continue
+                self.last_sync['falhas'] += 1
 
             except Exception as e:
                 print(f"Falha ao ler informações do projetos")
-    
+                self.last_sync['falhas'] += 1
+
+            if len(batch) >= SAVE_BATCH_SIZE:
+                self.save_projects(batch)
+                batch = []
+
+            if progress:
+                progress(done, len(changed))
+
+        self.save_projects(batch)
+        print(f"Tempos de espera: {self.waits.report()}")
         return self
-    
\ No newline at end of file
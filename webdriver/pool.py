@@ -0,0 +1,167 @@
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+
+from selenium.common.exceptions import WebDriverException
+
+from webdriver.plataforma_brasil import PlataformaBrasilService
+
+# Sessões paradas há mais que isso são fechadas (o Chrome ocupa ~200 MB cada)
+IDLE_TIMEOUT = 10 * 60
+MAX_SESSIONS = 3
+
+
+class BrowserPoolFull(Exception):
+    pass
+
+
+def credential_key(user_email, user_password):
+    # A chave muda se a senha mudar; a senha em si não fica exposta no dicionário
+    return hashlib.sha256(f"{user_email}\0{user_password}".encode()).hexdigest()
+
+
+class BrowserSession:
+    def __init__(self, key, service, last_used):
+        self.key = key
+        self.service = service
+        self.last_used = last_used
+        self.in_use = False
+
+
+class BrowserPool:
+    """
+    Navegadores já abertos e logados na Plataforma Brasil, um por credencial.
+    Reaproveitar a sessão evita subir o Chrome e refazer o login a cada
+    sincronização. Sessões paradas além de IDLE_TIMEOUT são fechadas; um
+    navegador que caiu é descartado e recriado, reaplicando os cookies da
+    sessão anterior antes de tentar o login de novo.
+    """
+
+    def __init__(self, factory=None, max_sessions=MAX_SESSIONS, idle_timeout=IDLE_TIMEOUT, clock=time.monotonic):
+        self.factory = factory or (lambda email, senha: PlataformaBrasilService(user_email=email, user_password=senha, headless=True))
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.clock = clock
+        self._sessions = {}
+        self._cookies = {}
+        self._creating = set()
+        self._lock = threading.RLock()
+
+    def _discard(self, session):
+        with self._lock:
+            if self._sessions.get(session.key) is session:
+                del self._sessions[session.key]
+        session.service.quit()
+
+    def evict_idle(self):
+        with self._lock:
+            now = self.clock()
+            expired = [s for s in self._sessions.values() if not s.in_use and now - s.last_used > self.idle_timeout]
+        for session in expired:
+            self._discard(session)
+        return len(expired)
+
+    def _reserve_slot(self, key):
+        """Reserva uma vaga para uma nova sessão, fechando a ociosa mais antiga se o pool estiver cheio."""
+        with self._lock:
+            if key in self._creating:
+                raise BrowserPoolFull("Já existe uma sincronização em andamento para esta conta.")
+            oldest = None
+            if len(self._sessions) + len(self._creating) >= self.max_sessions:
+                idle = [s for s in self._sessions.values() if not s.in_use]
+                if not idle:
+                    raise BrowserPoolFull("Todas as sessões da Plataforma Brasil estão em uso.")
+                oldest = min(idle, key=lambda s: s.last_used)
+                del self._sessions[oldest.key]
+            self._creating.add(key)
+        if oldest is not None:
+            oldest.service.quit()
+
+    def _ready(self, session):
+        """Garante que a sessão está viva e logada; False se o navegador caiu."""
+        service = session.service
+        if not service.is_alive():
+            return False
+        try:
+            service.open()
+            service.logged = service.is_logged_in()
+            if not service.logged:
+                service.login()
+        except WebDriverException:
+            return False
+        return True
+
+    def _create(self, key, user_email, user_password):
+        service = self.factory(user_email, user_password)
+        try:
+            cookies = self._cookies.get(key)
+            if not (cookies and service.restore_cookies(cookies)):
+                service.login()
+        except Exception:
+            service.quit()
+            raise
+        return BrowserSession(key, service, self.clock())
+
+    @contextmanager
+    def session(self, user_email, user_password):
+        """
+        Empresta o PlataformaBrasilService logado da credencial. Uma sessão é
+        usada por um chamador de cada vez; se a credencial já estiver em uso,
+        BrowserPoolFull.
+        """
+        key = credential_key(user_email, user_password)
+        self.evict_idle()
+
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is not None:
+                if session.in_use:
+                    raise BrowserPoolFull("Já existe uma sincronização em andamento para esta conta.")
+                session.in_use = True
+
+        if session is not None:
+            try:
+                ready = self._ready(session)
+            except Exception:
+                # Login recusado (ex.: senha trocada): a sessão não serve mais
+                self._discard(session)
+                raise
+            if not ready:
+                self._discard(session)
+                session = None
+
+        if session is None:
+            self._reserve_slot(key)
+            try:
+                session = self._create(key, user_email, user_password)
+                session.in_use = True
+                with self._lock:
+                    self._sessions[key] = session
+            finally:
+                with self._lock:
+                    self._creating.discard(key)
+
+        try:
+            yield session.service
+        except WebDriverException:
+            # Navegador travado ou fechado no meio do uso: não volta para o pool
+            self._discard(session)
+            raise
+        finally:
+            session.in_use = False
+            session.last_used = self.clock()
+            if session.service.logged and session.service.is_alive():
+                try:
+                    self._cookies[key] = session.service.driver.get_cookies()
+                except WebDriverException:
+                    pass
+
+    def close_all(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+        for session in sessions:
+            self._discard(session)
+
+
+pool = BrowserPool()
@@ -1,3 +1,200 @@
-from django.test import TestCase
+from django.test import SimpleTestCase
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.common.by import By
 
-# Create your tests here.
+from webdriver.waits import WaitEngine, rows_stable
+from webdriver.plataforma_brasil import PlataformaBrasilService, changed_records, rows_from_cells
+from webdriver.pool import BrowserPool, BrowserPoolFull
+
+
+class TabelaFalsa:
+    """tbody que ganha uma linha a cada consulta até chegar em `total`."""
+    def __init__(self, total):
+        self.total = total
+        self.linhas = 0
+
+    def find_elements(self, by, valor):
+        self.linhas = min(self.total, self.linhas + 1)
+        return [object()] * self.linhas
+
+
+class DriverFalso:
+    def __init__(self, tabela=None, ajax_pendente=0):
+        self.tabela = tabela
+        self.ajax_pendente = ajax_pendente
+
+    def execute_script(self, script, *args):
+        # Simula requisições AJAX terminando uma por verificação
+        if self.ajax_pendente:
+            self.ajax_pendente -= 1
+            return False
+        return True
+
+    def find_element(self, by, valor):
+        if self.tabela is None:
+            raise Exception("não encontrado")
+        return self.tabela
+
+
+class WaitEngineTest(SimpleTestCase):
+    def test_linhas_estaveis(self):
+        relogio = [0.0]
+        condicao = rows_stable((By.ID, "tb"), quiet=1, clock=lambda: relogio[0])
+        driver = DriverFalso(TabelaFalsa(3))
+
+        self.assertFalse(condicao(driver))  # 1 linha
+        self.assertFalse(condicao(driver))  # 2
+        self.assertFalse(condicao(driver))  # 3: começa a contar
+        relogio[0] = 0.5
+        self.assertFalse(condicao(driver))
+        relogio[0] = 1.5
+        self.assertEqual(len(condicao(driver)), 3)
+
+    def test_espera_termina_quando_tabela_carrega(self):
+        driver = DriverFalso(TabelaFalsa(5), ajax_pendente=2)
+        waits = WaitEngine(driver, poll_frequency=0.01)
+
+        linhas = waits.rows('table', (By.ID, "tb"), quiet=0.05)
+
+        self.assertEqual(len(linhas), 5)
+        metricas = waits.summary()['table']
+        self.assertEqual(metricas['count'], 1)
+        self.assertLess(metricas['total'], 2)
+
+    def test_timeout_por_etapa(self):
+        waits = WaitEngine(DriverFalso(), timeouts={'detail': 0.05}, poll_frequency=0.01)
+
+        with self.assertRaises(TimeoutException):
+            waits.rows('detail', (By.ID, "tb"))
+
+        self.assertEqual(waits.summary()['detail']['timeouts'], 1)
+        self.assertIn('detail: 1x', waits.report())
+
+
+def _linha(caae, versao="1", modificacao="01/01/2025", situacao="Em relatoria"):
+    celulas = [""] * 13
+    celulas[2], celulas[4], celulas[7], celulas[10] = caae, versao, modificacao, situacao
+    return celulas
+
+
+class LeituraTabelaTest(SimpleTestCase):
+    def test_tabela_lida_em_uma_chamada(self):
+        class DriverScript:
+            chamadas = 0
+
+            def execute_script(self, script, *args):
+                DriverScript.chamadas += 1
+                return [_linha("111"), ["Nenhum registro"], _linha("222", versao="2")]
+
+        servico = PlataformaBrasilService.__new__(PlataformaBrasilService)
+        servico.driver = DriverScript()
+
+        registros = servico.read_table()
+
+        self.assertEqual(DriverScript.chamadas, 1)
+        self.assertEqual([(r['index'], r['caae'], r['versao']) for r in registros], [(0, "111", "1"), (2, "222", "2")])
+
+    def test_somente_novos_ou_alterados(self):
+        registros = rows_from_cells([
+            _linha("novo"),
+            _linha("igual", versao="2", modificacao="10/02/2025"),
+            _linha("nova_versao", versao="3"),
+            _linha("sem_assinatura"),
+        ])
+        conhecidos = {
+            "igual": ("2", "10/02/2025"),
+            "nova_versao": ("2", "01/01/2025"),
+            "sem_assinatura": None,
+        }
+        self.assertEqual([r['caae'] for r in changed_records(registros, conhecidos)], ["novo", "nova_versao"])
+
+
+class ServicoFalso:
+    """PlataformaBrasilService sem navegador: conta logins e aceita cookies salvos."""
+    def __init__(self, email, senha):
+        self.user_email = email
+        self.logged = False
+        self.vivo = True
+        self.logins = 0
+        self.fechado = False
+        self.driver = self
+
+    def get_cookies(self):
+        return [{'name': 'JSESSIONID', 'value': self.user_email}]
+
+    def is_alive(self):
+        return self.vivo
+
+    def is_logged_in(self):
+        return self.logged
+
+    def open(self):
+        return self
+
+    def login(self):
+        self.logins += 1
+        self.logged = True
+        return self
+
+    def restore_cookies(self, cookies):
+        self.logged = cookies == self.get_cookies()
+        return self.logged
+
+    def quit(self):
+        self.fechado = True
+
+
+class BrowserPoolTest(SimpleTestCase):
+    def setUp(self):
+        self.criados = []
+        self.relogio = [0.0]
+
+        def fabrica(email, senha):
+            servico = ServicoFalso(email, senha)
+            self.criados.append(servico)
+            return servico
+
+        self.pool = BrowserPool(factory=fabrica, max_sessions=2, idle_timeout=60, clock=lambda: self.relogio[0])
+
+    def test_reaproveita_sessao_logada(self):
+        with self.pool.session("a@x.com", "1") as primeiro:
+            pass
+        with self.pool.session("a@x.com", "1") as segundo:
+            self.assertIs(segundo, primeiro)
+        self.assertEqual(len(self.criados), 1)
+        self.assertEqual(primeiro.logins, 1)
+
+    def test_navegador_caido_recriado_com_cookies(self):
+        with self.pool.session("a@x.com", "1") as servico:
+            pass
+        servico.vivo = False
+
+        with self.pool.session("a@x.com", "1") as novo:
+            self.assertIsNot(novo, servico)
+            self.assertTrue(novo.logged)
+        # O login foi dispensado: os cookies da sessão anterior bastaram
+        self.assertEqual(novo.logins, 0)
+        self.assertTrue(servico.fechado)
+
+    def test_ociosas_e_limite(self):
+        with self.pool.session("a@x.com", "1") as a:
+            with self.pool.session("b@x.com", "1"):
+                # Mesma conta em uso e pool cheio com todas ocupadas
+                with self.assertRaises(BrowserPoolFull):
+                    with self.pool.session("a@x.com", "1"):
+                        pass
+                with self.assertRaises(BrowserPoolFull):
+                    with self.pool.session("c@x.com", "1"):
+                        pass
+
+        # Cheio, mas com ociosas: a usada há mais tempo sai
+        self.relogio[0] = 10
+        with self.pool.session("b@x.com", "1"):
+            pass
+        with self.pool.session("c@x.com", "1"):
+            pass
+        self.assertTrue(a.fechado)
+
+        self.relogio[0] = 100
+        self.assertEqual(self.pool.evict_idle(), 2)
+        self.assertTrue(all(s.fechado for s in self.criados))
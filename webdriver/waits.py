@@ -0,0 +1,132 @@
+import time
+from collections import defaultdict
+
+from selenium.common.exceptions import StaleElementReferenceException, TimeoutException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+
+
+# Tempo máximo de cada etapa (segundos). A espera termina assim que a
+# condição é satisfeita; o limite só vale quando o site não responde.
+DEFAULT_TIMEOUTS = {
+    'alert': 3,
+    'login': 30,
+    'search': 120,
+    'table': 60,
+    'detail': 30,
+    'back': 30,
+}
+DEFAULT_TIMEOUT = 30
+POLL_FREQUENCY = 0.2
+# Quanto tempo a contagem de linhas precisa ficar parada para a tabela ser considerada carregada
+ROWS_QUIET_PERIOD = 0.6
+
+# Conta as requisições XHR em andamento (A4J/RichFaces e jQuery usam XMLHttpRequest).
+# É instalado na primeira verificação de cada página.
+_AJAX_IDLE_SCRIPT = """
+if (!window.__pbAjaxHook) {
+    window.__pbAjaxHook = true;
+    window.__pbAjaxPending = 0;
+    var send = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function () {
+        window.__pbAjaxPending++;
+        this.addEventListener('loadend', function () { window.__pbAjaxPending--; });
+        return send.apply(this, arguments);
+    };
+}
+return document.readyState === 'complete'
+    && window.__pbAjaxPending === 0
+    && (!window.jQuery || window.jQuery.active === 0);
+"""
+
+
+class ajax_idle:
+    """Condição: página carregada e nenhuma requisição AJAX pendente."""
+
+    def __call__(self, driver):
+        return bool(driver.execute_script(_AJAX_IDLE_SCRIPT))
+
+
+class rows_stable:
+    """
+    Condição: a tabela `locator` existe e o número de linhas não muda há
+    `quiet` segundos (o RichFaces vai preenchendo o tbody aos poucos).
+    Devolve as linhas.
+    """
+
+    def __init__(self, locator, quiet=ROWS_QUIET_PERIOD, clock=time.monotonic):
+        self.locator = locator
+        self.quiet = quiet
+        self.clock = clock
+        self.count = None
+        self.since = None
+
+    def __call__(self, driver):
+        try:
+            rows = driver.find_element(*self.locator).find_elements(By.TAG_NAME, 'tr')
+        except StaleElementReferenceException:
+            return False
+        except Exception:
+            self.count = None
+            return False
+
+        now = self.clock()
+        if len(rows) != self.count:
+            self.count, self.since = len(rows), now
+            return False
+        return rows if now - self.since >= self.quiet else False
+
+
+class WaitEngine:
+    """
+    Esperas explícitas do scraping, no lugar de sleep(): cada etapa espera
+    uma condição com o próprio timeout e o tempo gasto fica em `metrics`.
+    """
+
+    def __init__(self, driver, timeouts=None, poll_frequency=POLL_FREQUENCY, clock=time.monotonic):
+        self.driver = driver
+        self.timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+        self.poll_frequency = poll_frequency
+        self.clock = clock
+        self.metrics = defaultdict(list)
+        self.timeouts_hit = defaultdict(int)
+
+    def until(self, step, condition, timeout=None):
+        """Espera `condition` na etapa `step` e devolve o valor dela; TimeoutException se estourar."""
+        timeout = timeout if timeout is not None else self.timeouts.get(step, DEFAULT_TIMEOUT)
+        start = self.clock()
+        try:
+            return WebDriverWait(self.driver, timeout, poll_frequency=self.poll_frequency).until(
+                condition, f"Tempo esgotado em '{step}' ({timeout}s)"
+            )
+        except TimeoutException:
+            self.timeouts_hit[step] += 1
+            raise
+        finally:
+            self.metrics[step].append(self.clock() - start)
+
+    def idle(self, step, timeout=None):
+        return self.until(step, ajax_idle(), timeout)
+
+    def rows(self, step, locator, timeout=None, quiet=ROWS_QUIET_PERIOD):
+        """Espera o AJAX terminar e as linhas da tabela pararem de mudar; devolve as linhas."""
+        idle, stable = ajax_idle(), rows_stable(locator, quiet, self.clock)
+        return self.until(step, lambda driver: idle(driver) and stable(driver), timeout)
+
+    def summary(self):
+        """{etapa: {'count', 'total', 'max', 'timeouts'}} com os tempos em segundos."""
+        return {
+            step: {
+                'count': len(durations),
+                'total': round(sum(durations), 3),
+                'max': round(max(durations), 3),
+                'timeouts': self.timeouts_hit.get(step, 0),
+            }
+            for step, durations in self.metrics.items()
+        }
+
+    def report(self):
+        return ", ".join(
+            f"{step}: {m['count']}x {m['total']:.1f}s (máx {m['max']:.1f}s)"
+            for step, m in self.summary().items()
+        )